@@ -0,0 +1 @@
+# makes the repository root (and thus utils) importable from tests/
@@ -32,6 +32,10 @@ parser.add_argument('-p', '--plot',
                     help='field plotting',
                     action='store_true')
 
+parser.add_argument('--headless',
+                    help='no prompts or live display, write progress records instead',
+                    action='store_true')
+
 
 args = parser.parse_args()
 
@@ -1,6 +1,8 @@
 import utils
 from argparse import ArgumentParser
 import rich
+import rich.console
+import rich.table
 import json
 
 console = rich.get_console()
@@ -10,22 +12,129 @@ parser = ArgumentParser()
 
 subparsers = parser.add_subparsers(dest='command')
 
-parse_status = subparsers.add_parser('status')
+parse_status = subparsers.add_parser('status', help='list running jobs from the job registry')
+parse_status.add_argument('--prune', action='store_true', help='remove stale registry entries')
 
-parse_collect = subparsers.add_parser('collect')
+parse_collect = subparsers.add_parser('collect', help='print the indexed calc.json of every angle under a data root')
 parse_collect.add_argument('root')
+parse_collect.add_argument('--rescan', action='store_true', help='rescan root into the result index first (see reindex)')
 
 parse_collect.add_argument('-n', '--no-highlight', action='store_true')
 
+parse_reindex = subparsers.add_parser('reindex', help='rescan a data root into the result index')
+parse_reindex.add_argument('root', nargs='?', default=utils.global_cfg.DATA_DIR)
+
+parse_query = subparsers.add_parser('query', help='list indexed results by parameter ranges')
+parse_query.add_argument('root', nargs='?', default=utils.global_cfg.DATA_DIR)
+for key in utils.base.results.RANGE_KEYS:
+    parse_query.add_argument(f'--{key}', default=None, metavar='MIN:MAX', help=f'{key} range (or a single value)')
+parse_query.add_argument('-f', '--format', choices=['table', 'csv', 'json'], default='table')
+parse_query.add_argument('-o', '--output', default=None, help='write csv/json to a file instead of stdout')
+parse_query.add_argument('--calc', action='store_true', help='include calc.json in json output')
+
+parse_calc = subparsers.add_parser('calc', help='calculate gamma and widths for every angle under a data root')
+parse_calc.add_argument('root')
+parse_calc.add_argument('-j', '--jobs', type=int, default=0, help='number of worker processes (default: number of CPUs)')
+parse_calc.add_argument('-q', '--queue', type=int, default=None, help='maximum number of tasks in flight (default: 2x jobs)')
+parse_calc.add_argument('--only', choices=['gamma', 'width'], default=None)
+parse_calc.add_argument('--precision', default='double')
+parse_calc.add_argument('--lx-min', default='0')
+parse_calc.add_argument('--lx-max', default='inf')
+parse_calc.add_argument('--fft-threads', type=int, default=1)
+parse_calc.add_argument('--amplitude-precision', choices=['single', 'double'], default=None)
+
+group_calc = parse_calc.add_mutually_exclusive_group()
+group_calc.add_argument('-d', '--dry', help='dry run', action='store_true')
+group_calc.add_argument('-O', '--overwrite', help='recompute existing results', action='store_true')
+
+parse_convert = subparsers.add_parser('convert', help='convert interface fields under a data root to another file format')
+parse_convert.add_argument('root')
+parse_convert.add_argument('--to', choices=['raw', 'npz', 'series'], default='raw')
+parse_convert.add_argument('-d', '--dry', help='dry run', action='store_true')
+
+parse_wisdom = subparsers.add_parser('wisdom', help='plan the FFTs of all shapes a config will produce and save the wisdom')
+parse_wisdom.add_argument('stage', choices=['uc', 'unit_cell', 'gi', 'gen_interface', 'ri', 'run_interface'])
+parse_wisdom.add_argument('-c', '--config', required=True, help='config file')
+parse_wisdom.add_argument('-n', '--count', type=int, default=20, help='number of interfaces to plan for (run_interface)')
+
+parse_pipeline = subparsers.add_parser('pipeline', help='run every stage of a parameter sweep')
+parse_pipeline.add_argument('sweep', help='sweep file')
+parse_pipeline.add_argument('-j', '--cores', type=int, default=None, help='number of cores to use (default: from the sweep file)')
+parse_pipeline.add_argument('-m', '--memory', default=None, help='memory budget, e.g. 64G (default: from the sweep file)')
+parse_pipeline.add_argument('-d', '--dry', help='list the jobs to run', action='store_true')
+
+parse_bench = subparsers.add_parser('bench', help='benchmark the hot paths on synthetic fields')
+parse_bench.add_argument('config', help='benchmark config file')
+parse_bench.add_argument('--only', nargs='+', choices=utils.bench.config.CASES, default=None, help='cases to run')
+parse_bench.add_argument('-o', '--output', default=None, help='results file (default: under data/bench/)')
+parse_bench.add_argument('-b', '--baseline', default=None, help='baseline file (default: under data/bench/)')
+parse_bench.add_argument('--save-baseline', action='store_true', help='save the results as the baseline')
+
 
 args = parser.parse_args()
 
 if args.command == 'status':
-    utils.show_status()
+    utils.show_status(prune=args.prune)
+
+
+if args.command == 'calc':
+    utils.calc.tree.run(utils.calc.config.TreeCalcConfig(args))
+
+
+if args.command == 'convert':
+    utils.convert_tree(args.root, args.to, dry=args.dry)
+
+
+if args.command == 'wisdom':
+    if args.stage in ['uc', 'unit_cell']:
+        C = utils.unit_cell.parse_config(args.config)
+        shapes = utils.unit_cell.fft_shapes(C)
+    elif args.stage in ['gi', 'gen_interface']:
+        C = utils.gen_interface.parse_config(args.config)
+        shapes = utils.gen_interface.fft_shapes(C)
+    else:
+        C = utils.run_interface.parse_config(args.config)
+        shapes = utils.run_interface.fft_shapes(C, args.count)
+
+    for shape, precision, threads in shapes:
+        console.log(f'planning shape={shape} precision={precision} threads={threads}', highlight=False)
+    utils.preplan(utils.get_store(C.wisdom_store), shapes)
+    console.log(f'saved wisdom under {C.wisdom_store}/{utils.host_cpu_id()}', highlight=False)
+
+
+if args.command == 'pipeline':
+    utils.pipeline.run(args.sweep, cores=args.cores, memory=utils.parse_bytes(args.memory), dry=args.dry)
+
+
+if args.command == 'bench':
+    n = utils.bench.run(args.config, cases=args.only, output=args.output,
+                        baseline=args.baseline, save_baseline=args.save_baseline)
+    if n > 0:
+        raise SystemExit(1)
+
+
+if args.command == 'reindex':
+    n_updated, n_removed = utils.base.ResultStore().rebuild(args.root)
+    console.log(f'{n_updated} angles updated, {n_removed} removed', highlight=False)
+
+
+if args.command == 'query':
+    ranges = {k: utils.base.parse_range(getattr(args, k)) for k in utils.base.results.RANGE_KEYS
+              if getattr(args, k) is not None}
+    rows = utils.base.ResultStore().query(args.root, ranges=ranges, with_calc=args.calc)
+
+    if args.format == 'table':
+        table = rich.table.Table(*utils.base.results.COLUMNS)
+        for row in rows:
+            table.add_row(*('' if row[c] is None else str(row[c]) for c in utils.base.results.COLUMNS))
+        console.print(table)
+        console.print(f'{len(rows)} angles', highlight=False)
+    else:
+        utils.base.export_rows(rows, args.format, args.output)
 
 
 if args.command == 'collect':
-    d = utils.collect(args.root)
+    d = utils.collect(args.root, rescan=args.rescan)
 
     s = json.dumps(d, indent=4)
 
@@ -34,4 +143,9 @@ if args.command == 'collect':
     else:
         console.print(s)
 
+    if not args.rescan:
+        rich.console.Console(stderr=True).print(
+                'read from the result index, which may be stale: run reindex or pass --rescan',
+                highlight=False)
+
 
@@ -0,0 +1,121 @@
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+tg = pytest.importorskip('torusgrid')
+pfc = pytest.importorskip('pfc_util')
+
+from utils.base import get_quiet_hooks
+from utils.unit_cell.mucache import MuCache
+from utils.unit_cell.search import find_coexistent_mu_cached
+
+
+EPS = '0.1'
+MU_MIN, MU_MAX = 0.194, 0.196
+
+
+def _cfg(search_method: str) -> SimpleNamespace:
+    # evaluations start from different states (nearest cached vs. last
+    # evaluated), so they are converged tightly enough for omega_s - omega_l
+    # not to depend on it
+    return SimpleNamespace(
+        search_points=1, search_workers=1,
+        mu_precision=1e-3, search_method=search_method,
+        dt=0.05, eps_=0.1, alpha_=0., beta_=0.,
+        fft_threads=1, wisdom_only=False,
+        n_steps=8, refresh_interval=4,
+        target='psibar', tol=1e-11, patience=10,
+        liquid_tol=5e-4)
+
+
+def _solid() -> tg.RealField2D:
+    return pfc.toolkit.get_relaxed_minimized_coexistent_unit_cell(EPS)
+
+
+def _hooks(cfg: SimpleNamespace):
+    return get_quiet_hooks(
+            state_function_cls=pfc.pfc6.StateFunction,
+            refresh_interval=cfg.refresh_interval,
+            detect_slow=(cfg.target, cfg.tol, cfg.patience))
+
+
+def _library_mu(cfg: SimpleNamespace) -> list:
+    def relaxer_supplier(field: tg.RealField2D, /, mu: tg.FloatLike):
+        m = pfc.pfc6.StressRelaxer(field, cfg.dt, cfg.eps_, cfg.alpha_, cfg.beta_, mu)
+        m.initialize_fft(threads=cfg.fft_threads, wisdom_only=cfg.wisdom_only, destroy_input=True)
+        return m
+
+    def const_mu_supplier(field: tg.RealField2D, /, mu: tg.FloatLike):
+        m = pfc.pfc6.ConstantMuMinimizer(field, cfg.dt, cfg.eps_, cfg.alpha_, cfg.beta_, mu)
+        m.initialize_fft(threads=cfg.fft_threads, wisdom_only=cfg.wisdom_only, destroy_input=True)
+        return m
+
+    fef = pfc.pfc6.FreeEnergyFunctional(cfg.eps_, cfg.alpha_, cfg.beta_)
+    hooks = _hooks(cfg)
+    rec = pfc.toolkit.find_coexistent_mu(
+        _solid(), MU_MIN, MU_MAX, fef,
+        relaxer_supplier=relaxer_supplier,
+        relaxer_hooks=hooks, relaxer_nsteps=cfg.n_steps,
+        const_mu_supplier=const_mu_supplier,
+        const_mu_hooks=hooks, const_mu_nsteps=cfg.n_steps,
+        precision=cfg.mu_precision,
+        search_method=cfg.search_method,
+        liquid_tol=cfg.liquid_tol,
+        error_if_liquefied=True)
+    return list(rec.mu)
+
+
+@pytest.mark.parametrize('search_method', ['binary', 'interpolate'])
+def test_sequential_search_matches_find_coexistent_mu(search_method):
+    cfg = _cfg(search_method)
+    fef = pfc.pfc6.FreeEnergyFunctional(cfg.eps_, cfg.alpha_, cfg.beta_)
+
+    cache = MuCache()
+    rec = find_coexistent_mu_cached(_solid(), MU_MIN, MU_MAX, fef, cfg, cache, hooks=_hooks(cfg))
+
+    expected = _library_mu(cfg)
+    assert len(rec.mu) == len(expected)
+    assert np.allclose(rec.mu, expected, rtol=0, atol=cfg.mu_precision * 1e-3)
+
+    # a repeated search is answered from the cache, and only then counts hits
+    assert cache.hits == 0
+    again = find_coexistent_mu_cached(_solid(), MU_MIN, MU_MAX, fef, cfg, cache, hooks=_hooks(cfg))
+    assert list(again.mu) == list(rec.mu)
+    assert cache.hits == len(rec.mu)
+
+
+def _round_order_ok(rec: pfc.toolkit.MuSearchRecord, k: int) -> bool:
+    gap = np.abs(np.asarray(rec.omega_s) - np.asarray(rec.omega_l))
+    return all(np.all(np.diff(gap[i:i+k]) <= 0) for i in range(0, len(gap), k))
+
+
+def test_kary_search_brackets_find_coexistent_mu():
+    cfg = _cfg('binary')
+    cfg.search_points = cfg.search_workers = 3
+    fef = pfc.pfc6.FreeEnergyFunctional(cfg.eps_, cfg.alpha_, cfg.beta_)
+
+    rec = find_coexistent_mu_cached(_solid(), MU_MIN, MU_MAX, fef, cfg, MuCache())
+
+    # bisection points never coincide across rounds, so every round records k
+    assert len(rec.mu) % 3 == 0
+    assert _round_order_ok(rec, 3)
+    gap = np.abs(np.asarray(rec.omega_s) - np.asarray(rec.omega_l))
+    assert gap[-1] == gap[-3:].min()
+
+    atol = cfg.mu_precision * 1e-3
+    assert rec.lower_bound - atol <= _library_mu(cfg)[-1] <= rec.upper_bound + atol
+
+
+def test_kary_search_records_round_before_liquefied_error():
+    cfg = _cfg('binary')
+    cfg.search_points = cfg.search_workers = 3
+    fef = pfc.pfc6.FreeEnergyFunctional(cfg.eps_, cfg.alpha_, cfg.beta_)
+
+    # points 0.196, 0.198, 0.2: the solid liquefies at the last one
+    with pytest.raises(pfc.toolkit.LiquefiedError) as e:
+        find_coexistent_mu_cached(_solid(), 0.194, 0.202, fef, cfg, MuCache())
+
+    assert np.isclose(e.value.mu, 0.2)
+    assert np.allclose(e.value.mu_rec.mu, [0.198, 0.196])
+    assert _round_order_ok(e.value.mu_rec, 3)
@@ -0,0 +1,41 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+tg = pytest.importorskip('torusgrid')
+pfc = pytest.importorskip('pfc_util')
+
+from utils.base.timestep import set_dt
+
+
+EPS, ALPHA, BETA, MU = 0.1, 0., 0.5, 0.2
+
+
+def _field(seed: int = 0) -> tg.RealField2D:
+    field = tg.RealField2D(4*np.pi, 4*np.pi*np.sqrt(3), 32, 48)
+    field.psi[...] = 0.2 + 0.1 * np.random.default_rng(seed).standard_normal(field.shape)
+    return field
+
+
+MINIMIZERS = {
+    'ConstantMuMinimizer': lambda field, dt: pfc.pfc6.ConstantMuMinimizer(field, dt, EPS, ALPHA, BETA, MU),
+    'NonlocalConservedRK4': lambda field, dt: pfc.pfc6.NonlocalConservedRK4(field, dt, EPS, ALPHA, BETA),
+}
+
+
+@pytest.mark.parametrize('name', MINIMIZERS.keys())
+def test_step_after_set_dt_matches_fresh_minimizer(name):
+    make = MINIMIZERS[name]
+
+    changed = make(_field(), 0.1)
+    changed.initialize_fft(threads=1)
+    set_dt(changed, 0.05)
+
+    fresh = make(_field(), 0.05)
+    fresh.initialize_fft(threads=1)
+
+    changed.step()
+    fresh.step()
+
+    np.testing.assert_allclose(changed.field.psi, fresh.field.psi, rtol=1e-12, atol=1e-12)
+    assert changed.data['dt'] == 0.05
+
@@ -4,4 +4,8 @@ from . import run_interface
 
 from . import calc
 
+from . import pipeline
+
+from . import bench
+
 from .base import *
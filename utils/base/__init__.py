@@ -1,10 +1,44 @@
-from .paths import get_path
+from .paths import get_path, parse_path, find_rotation
 from .config import *
 
 from .status import show_status
 
+from .jobs import Job, get_job, read_jobs, ReportProgress
+
 from .collect import collect
 
+from .results import ResultStore, update_results, parse_range, export_rows
+
+from .units import parse_bytes, parse_duration
+
+from .parallel import max_workers, SharedArray
+
+from .hooks import (get_quiet_hooks, get_pfc_hooks, get_progress, Progress, StopOnEvent,
+                    Stopped, stop_on_sigterm)
+
+from .index import index_entry, append_to_index, read_index
+
+from .fieldio import (FieldFormat, load_field, save_field,
+                      field_format, field_stat, convert_field, read_field_header)
+
+from .series import FieldSeries, get_series
+
+from .convert import convert_tree
+
+from .fftplan import FFTPlanCache
+
+from .lease import Lease, read_lease, lease_is_stale, is_leased, describe_lease
+
+from .checkpoint import Checkpoint, CheckpointHook
+
+from .schedule import run_phases
+
+from .timestep import AdaptiveTimeStep, set_dt, dt_adjustable, with_adaptive_dt
+
+from .timing import Timings, StepClock, get_timings, timed_hooks
+
+from .wisdom import WisdomStore, get_store, preplan, host_cpu_id
+
 from .data import (Fallback, put_val,
                    put_val_into_json, FieldLoader,
                    has_key, json_has_key,
@@ -0,0 +1,262 @@
+from typing import Any, Dict, Optional
+from pathlib import Path
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+
+import torusgrid as tg
+import rich
+
+from .. import global_cfg as G
+from .data import DataExistsError
+from .fieldio import load_field, save_raw
+from .timestep import set_dt
+from .timing import get_timings
+
+
+class Checkpoint:
+    """
+    Progress of a stage in a leased data directory, kept in its .checkpoint/
+    subdirectory next to the .running lease so that re-running the same
+    command resumes instead of starting over.
+
+    A checkpoint holds picklable state (a dict) and named fields. Fields are
+    written to new files first (raw format) and the state, which lists them,
+    is replaced atomically afterwards, so a crash while saving leaves the
+    previous checkpoint intact.
+
+    The state of an evolver (its field, including size, momentum if any, and
+    age) can be saved periodically with hook() and put back with restore().
+
+    interval=None disables checkpoints: save() does nothing and nothing is
+    loaded.
+
+    A checkpoint records the config (see config_hash) it was written with; a
+    checkpoint written with another config raises DataExistsError unless
+    overwrite, which removes it.
+
+    Once lost is set (the lease on dir was lost, see Lease), nothing is
+    written anymore.
+    """
+    def __init__(self, dir: str, *, interval: Optional[float] = None,
+                 config: Optional[str] = None, overwrite: bool = False,
+                 lost: Optional[threading.Event] = None):
+        self.dir = Path(dir) / G.CHECKPOINT_DIR
+        self.interval = interval
+        self.config = config
+        self.lost = lost
+        self.state: Dict[str, Any] = {}
+        self._files: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        if overwrite:
+            self.clear()
+
+        state_file = self.dir / 'state.pkl'
+        if self.enabled and state_file.exists():
+            with open(state_file, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('config') != config:
+                raise DataExistsError(
+                        f'Checkpoint in {self.dir} was written with a different config, '
+                        'pass -O to discard it and start over')
+            self.state = data['state']
+            self._files = data['files']
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval is not None
+
+    @property
+    def writable(self) -> bool:
+        return self.enabled and (self.lost is None or not self.lost.is_set())
+
+    @property
+    def empty(self) -> bool:
+        return self.state == {} and self._files == {}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.state.get(key, default)
+
+    def has(self, name: str) -> bool:
+        return name in self._files.keys()
+
+    def field(self, name: str) -> tg.RealField2D:
+        return load_field(str(self.dir / self._files[name]), mmap=False)
+
+    def _commit(self, files: Dict[str, str], state: Dict[str, Any]):
+        """
+        Atomically replace state.pkl and delete the field files no longer
+        listed. Must be called with the lock held.
+        """
+        tmp = self.dir / 'state.pkl.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(dict(state=state, files=files, config=self.config), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.dir / 'state.pkl')
+
+        for fname in set(self._files.values()) - set(files.values()):
+            (self.dir / fname).unlink(missing_ok=True)
+        self.state, self._files = state, files
+
+    def save(self, fields: Optional[Dict[str, tg.RealField2D]] = None, **state):
+        """
+        Add or replace the given fields and state entries
+        """
+        if not self.writable:
+            return
+
+        with self._lock, get_timings().timer('checkpoint.save'):
+            files = self._write(fields or {})
+            self._commit(files, dict(self.state, **state))
+
+    def _write(self, fields: Dict[str, tg.RealField2D]) -> Dict[str, str]:
+        """
+        Write fields to new files, return the file list including them
+        """
+        self.dir.mkdir(parents=True, exist_ok=True)
+        files = dict(self._files)
+        for name, field in fields.items():
+            fname = f'{name}.{uuid.uuid4().hex[:8]}.field'
+            save_raw(field, str(self.dir / fname))
+            files[name] = fname
+        return files
+
+    def discard(self, *names: str):
+        """
+        Drop the given fields and evolver states
+        """
+        if not self.writable:
+            return
+
+        def dropped(key: str) -> bool:
+            return any(key == n or key.startswith(f'{n}.') for n in names)
+
+        with self._lock:
+            if not any(dropped(k) for k in [*self._files.keys(), *self.state.keys()]):
+                return
+            self._commit(
+                {k: v for k, v in self._files.items() if not dropped(k)},
+                {k: v for k, v in self.state.items() if not dropped(k)})
+
+    def clear(self):
+        """
+        Remove the checkpoint, e.g. once the stage is complete
+        """
+        if not self.writable:
+            return
+        self.state, self._files = {}, {}
+        if self.dir.exists():
+            shutil.rmtree(self.dir)
+
+    def save_evolver(self, name: str, evolver: tg.dynamics.FieldEvolver[tg.RealField2D], **state):
+        """
+        Save the state of evolver under name, along with the given state
+        entries
+        """
+        self.save_state(
+                name, evolver.field,
+                momentum=getattr(evolver, 'dgrid', None),
+                age=getattr(evolver, 'age', None),
+                dt=getattr(evolver, 'dt', None),
+                **state)
+
+    def save_state(
+        self, name: str, field: tg.RealField2D, *,
+        momentum: Optional[tg.RealField2D] = None,
+        age: Optional[tg.FloatLike] = None,
+        dt: Optional[tg.FloatLike] = None,
+        **state
+    ):
+        """
+        save_evolver() for an evolver given by its parts, e.g. one running in
+        another process
+        """
+        fields = {name: field}
+        if momentum is not None:
+            fields[f'{name}.momentum'] = momentum
+        state[f'{name}.age'] = age
+        state[f'{name}.dt'] = dt
+        self.save(fields, **state)
+
+    def advance(self, name: str, field: tg.RealField2D, phase: int, **state):
+        """
+        Record that the evolution saved under name goes on with the given
+        phase (see run_phases), starting from field
+        """
+        if not self.writable:
+            return
+        with self._lock, get_timings().timer('checkpoint.save'):
+            files = self._write({name: field})
+            files.pop(f'{name}.momentum', None)
+            state = dict(self.state, **state)
+            state.update({f'{name}.age': None, f'{name}.dt': None, f'{name}.phase': phase})
+            self._commit(files, state)
+
+    def restore(self, name: str, evolver: tg.dynamics.FieldEvolver[tg.RealField2D], *,
+                phase: int = 0) -> bool:
+        """
+        Put the evolver state saved under name back into evolver (whose field
+        must have the same shape, the precision may differ) if it was saved
+        in the given phase. Return whether there was one.
+        """
+        if not self.has(name) or self.get(f'{name}.phase', 0) != phase:
+            return False
+
+        saved = self.field(name)
+        evolver.field.set_size(saved.lx, saved.ly)
+        evolver.field.psi[...] = saved.psi
+
+        dgrid = getattr(evolver, 'dgrid', None)
+        if dgrid is not None and self.has(f'{name}.momentum'):
+            dgrid.psi[...] = self.field(f'{name}.momentum').psi
+
+        age = self.get(f'{name}.age')
+        if age is not None and hasattr(evolver, 'set_age'):
+            evolver.set_age(age) # type: ignore
+
+        # the time step may have been adapted (see AdaptiveTimeStep)
+        dt = self.get(f'{name}.dt')
+        if dt is not None and dt != getattr(evolver, 'dt', None):
+            set_dt(evolver, dt)
+
+        rich.get_console().log(
+                f'resumed {name} from checkpoint' + ('' if age is None else f' (age={age})'),
+                highlight=False)
+        return True
+
+    def hook(self, name: str, *, stop: Optional[threading.Event] = None, **state) -> 'CheckpointHook':
+        return CheckpointHook(self, name, stop=stop, **state)
+
+
+class CheckpointHook(tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]):
+    """
+    Save the evolver state to a checkpoint every checkpoint.interval seconds,
+    and when evolution ends because stop is set (e.g. on SIGTERM). Saving
+    happens between two steps on the evolver thread, so the saved state is
+    consistent.
+    """
+    def __init__(self, checkpoint: Checkpoint, name: str, *,
+                 stop: Optional[threading.Event] = None, **state):
+        self.checkpoint = checkpoint
+        self.name = name
+        self.stop = stop
+        self.state = state
+
+    def on_start(self, n_steps: int, n_epochs: Optional[int]):
+        self._last = time.monotonic()
+
+    def on_step(self, step: int):
+        interval = self.checkpoint.interval
+        if interval is None or time.monotonic() - self._last < interval:
+            return
+        self.checkpoint.save_evolver(self.name, self.evolver, **self.state)
+        self._last = time.monotonic()
+
+    def on_end(self):
+        if self.stop is not None and self.stop.is_set():
+            self.checkpoint.save_evolver(self.name, self.evolver, **self.state)
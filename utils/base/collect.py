@@ -1,32 +1,16 @@
-from pathlib import Path
-import json
-from .. import global_cfg as G
-from .data import put_val
-
-def collect(root: str):
-
-    data_path = Path(G.DATA_DIR)
-    root_path = Path(root)
-
-    if not root_path.is_relative_to(data_path):
-        raise ValueError(f'Invalid data root: {str(root_path)}')
-
-    d = {}
-
-    calcs = root_path.rglob(G.CALC_FILE)
-
-    for calc_path in calcs:
-
-
-        with open(calc_path, 'r') as f:
-            calc_data = json.load(f)
-
-        rel_path = calc_path.relative_to(root_path)
-        affixes = [s.split('_')[-1] for s in rel_path.parent.parts]
-
-        put_val(d, *affixes, val=calc_data)
-
-
-    return d
-
-
+from typing import Any, Dict
+
+from .results import ResultStore, rows_by_path
+
+
+def collect(root: str, *, rescan: bool = False) -> Dict[str, Any]:
+    """
+    calc.json of every angle under root (a directory under G.DATA_DIR) as a
+    nested dict keyed by the affixes of the path below root, read from the
+    result index (see ResultStore). Results written without updating the
+    index are only seen after a rescan (rescan, or manage.py reindex).
+    """
+    store = ResultStore()
+    if rescan:
+        store.rebuild(root)
+    return rows_by_path(store.query(root, with_calc=True), root)
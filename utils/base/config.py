@@ -1,15 +1,19 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import List, Literal
+from typing import Any, Dict, Iterable, List, Literal
 import torusgrid as tg
 import pfc_util as pfc
+import hashlib
+import json
 import pickle
 
 from .. import global_cfg as G
 
 from .paths import get_path
+from .units import parse_duration
+from .data import Fallback
 
-from rich import get_console
+from rich import get_console, reconfigure
 console = get_console()
 
 
@@ -68,9 +72,12 @@ class SpecifiesShape(ConfigBase):
 class SpecifiesFFTWisdoms(ConfigBase):
     """
     fftw_wisdoms
+
+    wisdom_store (optional, default data/wisdom; null disables)
     """
     def __init__(self, config: dict):
         super().__init__(config)
+        self.wisdom_store = config.get('wisdom_store', f'{G.DATA_DIR}/{G.WISDOM_DIR}')
         self.fftw_wisdoms = []
         for wisdom_file in config['fftw_wisdoms']:
             with open(wisdom_file, 'rb') as f:
@@ -78,6 +85,29 @@ class SpecifiesFFTWisdoms(ConfigBase):
             self.fftw_wisdoms.append(wisdom)
 
 
+def config_hash(config: Dict[str, Any], *, ignore: Iterable[str] = ()) -> str:
+    """
+    Hash of a config dict without the keys in ignore
+    """
+    items = {k: v for k, v in config.items() if k not in ignore}
+    return hashlib.sha256(json.dumps(items, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class SpecifiesCheckpoints(ConfigBase):
+    """
+    checkpoint_interval (optional, default 10m; null disables checkpoints)
+
+    config_hash: hash of the config without checkpoint_ignore, stored in
+    checkpoints so that they are only resumed with the same config
+    """
+    checkpoint_ignore = ('checkpoint_interval',)
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.checkpoint_interval = parse_duration(config.get('checkpoint_interval', '10m'))
+        self.config_hash = config_hash(config, ignore=self.checkpoint_ignore)
+
+
 class SpecifiesPFCParams(ConfigBase):
     """
     eps, alpha, beta (strings)
@@ -145,6 +175,75 @@ class SpecifiesSimulationParams(ConfigBase, IHasToFloat):
         self.wisdom_only = bool(config['wisdom_only'])
 
 
+class AdaptiveDtConfig:
+    """
+    period, grow, shrink, dt_min, dt_max, see base.AdaptiveTimeStep
+    """
+    def __init__(self, config: dict, to_float):
+        self.period = int(config.get('period', 100))
+        self.grow = float(config.get('grow', 1.1))
+        self.shrink = float(config.get('shrink', 0.5))
+        dt_min = config.get('dt_min', None)
+        dt_max = config.get('dt_max', None)
+        self.dt_min = None if dt_min is None else to_float(str(dt_min))
+        self.dt_max = None if dt_max is None else to_float(str(dt_max))
+
+
+class SpecifiesAdaptiveTimeStep(ConfigBase, IHasToFloat):
+    """
+    adaptive_dt (optional): grow dt while the energy decreases, roll back
+    and shrink it when it increases; keys period (steps between checks,
+    default 100), grow (default 1.1), shrink (default 0.5), dt_min (default
+    dt), dt_max (default none)
+    """
+    def __init__(self, config: dict):
+        super().__init__(config)
+        try:
+            # through Fallback, phases inherit the enclosing adaptive_dt
+            adaptive_dt = config['adaptive_dt']
+        except KeyError:
+            adaptive_dt = None
+        self.adaptive_dt = None if adaptive_dt is None else AdaptiveDtConfig(adaptive_dt, self.to_float)
+
+
+class PhaseConfig(
+    SpecifiesAdaptiveTimeStep,
+    SpecifiesSimulationParams,
+    SpecifiesPrecision,
+    ConfigBase
+):
+    """
+    One phase of a precision schedule, see SpecifiesPrecisionSchedule
+    """
+
+
+class SpecifiesPrecisionSchedule(ConfigBase):
+    """
+    phases (optional): minimization phases run before the configured one,
+    typically converging in single or double precision with a looser tol
+    before the final phase in the configured precision. Keys missing from a
+    phase are taken from the enclosing config.
+    """
+    PHASE_KEYS = ['precision', 'dt', 'target', 'tol', 'patience',
+                  'n_steps', 'refresh_interval', 'fps',
+                  'fft_threads', 'wisdom_only', 'adaptive_dt']
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+
+        parent = {}
+        for key in self.PHASE_KEYS:
+            try:
+                parent[key] = config[key]
+            except KeyError:
+                pass
+
+        self.phases = [
+            PhaseConfig(Fallback(phase, parent, self.PHASE_KEYS))
+            for phase in (config.get('phases', None) or [])
+        ]
+
+
 class SpecifiesKRegularizer(ConfigBase):
     def __init__(self, config: dict):
         super().__init__(config)
@@ -160,10 +259,17 @@ class SpecifiesInertia(ConfigBase):
 class CommandLineConfig:
     def __init__(self, args):
 
-        self.plot: bool = args.plot
+        self.headless: bool = getattr(args, 'headless', False)
+        self.plot: bool = args.plot and not self.headless
         self.dry: bool = args.dry
         self.overwrite: bool = args.overwrite
 
+        if self.headless:
+            # plain log lines, no live display or prompts
+            reconfigure(force_terminal=False, force_interactive=False,
+                        soft_wrap=True, no_color=True)
+            console.log('Headless mode')
+
         if self.dry:
             console.log('[bold orange1]Dry run[/bold orange1]')
 
@@ -0,0 +1,53 @@
+from pathlib import Path
+import os
+
+import rich
+
+from .. import global_cfg as G
+from .fieldio import FieldFormat, convert_field, field_format, field_stat
+from .index import read_index, append_to_index
+from .lease import is_leased
+from .data import get_interface_list
+
+
+def convert_tree(root: str, fmt: FieldFormat, *, dry: bool = False):
+    """
+    Convert all interface fields under root to the given format in place.
+
+    Interface directories that are currently being written to (with a live
+    lease) are skipped. For fields that are in the interface index,
+    an updated entry with the new file size is appended. Fields are packed
+    into (series) or unpacked from their directory's series in name order;
+    a series is removed once all of its members are unpacked.
+    """
+    console = rich.get_console()
+
+    ifcs_dirs = sorted(p for p in Path(root).rglob(G.INTERFACES_DIR) if p.is_dir())
+
+    n_converted = 0
+    for d in ifcs_dirs:
+        if is_leased(str(d)):
+            console.log(f'{d}: running, skipped', highlight=False)
+            continue
+
+        index = read_index(str(d))
+        fields = [loader.path for loader in get_interface_list(str(d))]
+        todo = [p for p in fields if field_format(p) != fmt]
+
+        console.log(f'{d}: {len(todo)}/{len(fields)} fields to convert', highlight=False)
+        if dry:
+            continue
+
+        for p in todo:
+            convert_field(p, fmt)
+            n_converted += 1
+
+            entry = index.get(Path(p).name)
+            if entry is not None:
+                append_to_index(str(d), dict(entry, size=field_stat(p)['size']))
+
+        series = d / G.SERIES_FILE
+        if fmt != 'series' and series.exists():
+            os.remove(series)
+
+    console.log(f'Converted {n_converted} fields to {fmt}', highlight=False)
@@ -1,9 +1,14 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 import torusgrid as tg
 from pathlib import Path
 import json
 import os
 
+from .. import global_cfg as G
+from .index import read_index, entry_float
+from .fieldio import load_field, read_field_header, field_stat
+from .series import member_paths
+
 
 class Fallback(Dict[str, Any]):
     """
@@ -90,26 +95,68 @@ def json_has_key(
 
 class FieldLoader:
 
-    def __init__(self, path) -> None:
+    def __init__(self, path, meta: Optional[Dict[str, Any]] = None) -> None:
         self.path = path
+        self.meta = meta
+        """
+        Index entry of the field, if any
+        """
 
     def __call__(self):
-        return tg.load(tg.RealField2D, self.path)
-
-
-def get_interface_list(path: str):
-
+        """
+        Load the field; fields in the raw format are memory-mapped read-only
+        """
+        return load_field(self.path)
+
+    @property
+    def lx(self) -> tg.FloatLike:
+        """
+        Lx from the index entry or, if the field is not indexed, from the
+        file's metadata (psi is not loaded)
+        """
+        if self.meta is None:
+            self.meta = read_field_header(self.path)
+            return self.meta['lx']
+        return entry_float(self.meta, 'lx') # type: ignore
+
+
+def get_interface_list(
+    path: str, *,
+    lx_min: Optional[tg.FloatLike] = None,
+    lx_max: Optional[tg.FloatLike] = None
+):
+    """
+    Return loaders of all interface fields under path (files and members of
+    its series), sorted by name, with their index entries attached. If lx_min
+    or lx_max is given, only fields with lx_min <= Lx <= lx_max are returned;
+    Lx is taken from the index, so only fields missing from the index are
+    opened (metadata only).
+    """
     dir = Path(path)
     
     if dir.exists():
         if dir.is_dir():
-            ifcs = sorted([str(p) for p in list(dir.glob('*.field'))])
+            ifcs = sorted(set(str(p) for p in dir.glob('*.field')) | set(member_paths(path)))
         else:
             raise NotADirectoryError(str(dir))
     else:
         ifcs = []
 
-    return [FieldLoader(p) for p in ifcs]
+    index = read_index(path)
+
+    loaders = []
+    for p in ifcs:
+        entry = index.get(Path(p).name)
+        if entry is not None and entry['size'] != field_stat(p)['size']:
+            entry = None
+        loaders.append(FieldLoader(p, entry))
+
+    if lx_min is not None:
+        loaders = [l for l in loaders if l.lx >= lx_min]
+    if lx_max is not None:
+        loaders = [l for l in loaders if l.lx <= lx_max]
+
+    return loaders
 
 
 
@@ -129,8 +176,16 @@ def check_dir_empty(
         if not pth.is_dir():
             raise NotADirectoryError(f'Saving location {path} is not a directory')
 
-        files = os.listdir(str(path))
-        if not (files == []):
+        # the lease, checkpoint, progress records and timings of the process
+        # about to write are not data
+        files = [f for f in os.listdir(str(path))
+                 if f not in (G.RUNNING_FILE, G.CHECKPOINT_DIR, G.PROGRESS_FILE, G.TIMINGS_FILE)]
+
+        # an interrupted run (which passed this check) is being resumed;
+        # Checkpoint refuses it if the config changed
+        resuming = (pth / G.CHECKPOINT_DIR / 'state.pkl').exists()
+
+        if not (files == []) and not resuming:
             if (not overwrite):
                 raise DataExistsError(f'Saving directory {path} not empty')
     else:
@@ -0,0 +1,197 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Iterable, Optional, Set, Tuple
+from pathlib import Path
+import os
+import pickle
+import queue
+import threading
+
+import numpy as np
+import pyfftw
+import torusgrid as tg
+import rich
+
+from .timing import get_timings
+
+if TYPE_CHECKING:
+    from .wisdom import WisdomStore
+
+
+PlanKey = Tuple[Tuple[int, ...], str, int, bool]
+"""
+(shape, dtype, threads, destroy_input) of a real field's FFT plans
+"""
+
+
+class FFTPlanCache:
+    """
+    FFTW wisdom for the FFT plans of real 2D fields, keyed by shape, dtype,
+    thread count and destroy_input.
+
+    Planning a key creates a throwaway field of that shape and initializes
+    its FFT, which leaves wisdom behind; a later initialize_fft() with the
+    same parameters (also with wisdom_only=True) then returns immediately.
+    Planned keys and the accumulated wisdom are loaded from and saved to a
+    WisdomStore, so they persist across sessions.
+
+    Keys can also be planned on a background thread (preplan()) while the
+    main thread is busy; FFTW planning is serialized by pyfftw, while
+    executing existing plans is not blocked. Leaving a with block stops the
+    background thread and saves.
+    """
+    def __init__(
+        self, store: Optional[WisdomStore] = None, *,
+        precision: Optional[tg.PrecisionLike] = None,
+        effort: Optional[tg.FFTWEffort] = None
+    ):
+        """
+        :param store: where wisdom is loaded from and saved to; None keeps it
+                      in memory only
+        :param precision: only load wisdom of this precision from the store
+        """
+        self.store = store
+        self.effort = effort
+        self.planned: Set[PlanKey] = set()
+
+        self._lock = threading.Lock()
+        self._queue: queue.Queue[Optional[Tuple[Tuple[int, ...], tg.PrecisionLike, int, bool]]] = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+        if store is not None:
+            store.load(self, precision)
+
+    @staticmethod
+    def key(
+        shape: Tuple[int, ...], precision: tg.PrecisionLike,
+        threads: int, destroy_input: bool
+    ) -> PlanKey:
+        dtype = np.dtype(tg.get_real_dtype(precision)).str
+        return tuple(int(n) for n in shape), dtype, int(threads), bool(destroy_input)
+
+    def __contains__(self, key: PlanKey) -> bool:
+        with self._lock:
+            return key in self.planned
+
+    def plan(
+        self, shape: Tuple[int, ...], precision: tg.PrecisionLike,
+        threads: int, *, destroy_input: bool = False
+    ):
+        """
+        Plan the FFTs of a real field with the given parameters, unless
+        already planned
+        """
+        key = self.key(shape, precision, threads, destroy_input)
+        if key in self:
+            get_timings().count('fft.plan.cached')
+            return
+
+        # timed separately when planned in the background
+        name = 'fft.preplan' if threading.current_thread() is self._thread else 'fft.plan'
+        with get_timings().timer(name):
+            field = tg.RealField2D(1., 1., *shape, precision=precision)
+            field.initialize_fft(threads=threads, effort=self.effort, destroy_input=destroy_input)
+
+        with self._lock:
+            self.planned.add(key)
+
+    def plan_minimizer(
+        self, shape: Tuple[int, ...], precision: tg.PrecisionLike,
+        threads: int, *, background: bool = False
+    ):
+        """
+        Plan what a pfc_util minimizer plans for a field of this shape: its
+        internal fields with default arguments on construction, then all
+        fields with the given threads and destroy_input=True on
+        initialize_fft().
+        """
+        for t, destroy_input in [(1, False), (threads, True)]:
+            if background:
+                self.preplan([shape], precision, t, destroy_input=destroy_input)
+            else:
+                self.plan(shape, precision, t, destroy_input=destroy_input)
+
+    def _work(self):
+        console = rich.get_console()
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            shape, precision, threads, destroy_input = job
+            try:
+                self.plan(shape, precision, threads, destroy_input=destroy_input)
+            except Exception as e:
+                console.log(f'FFT preplanning of shape {shape} failed ({e})', highlight=False)
+
+    def preplan(
+        self, shapes: Iterable[Tuple[int, ...]], precision: tg.PrecisionLike,
+        threads: int, *, destroy_input: bool = False
+    ):
+        """
+        Plan the given shapes on a background thread
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._work, name='fft-preplan', daemon=True)
+            self._thread.start()
+
+        for shape in shapes:
+            if self.key(shape, precision, threads, destroy_input) not in self:
+                self._queue.put((tuple(shape), precision, threads, destroy_input))
+
+    def close(self):
+        """
+        Drop the queued shapes and stop the background thread once the shape
+        being planned is done
+        """
+        if self._thread is not None:
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def load(self, path: str):
+        """
+        Import the wisdom and planned keys saved at path
+        """
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        pyfftw.import_wisdom(data['wisdom'])
+        with self._lock:
+            self.planned.update(tuple(k) for k in data['planned']) # type: ignore
+
+    def save_to(self, path: str, keys: Iterable[PlanKey]):
+        """
+        Merge the current wisdom and the given keys into the file at path,
+        written atomically
+        """
+        planned: Set[PlanKey] = set(keys)
+        if Path(path).exists():
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            pyfftw.import_wisdom(data['wisdom'])
+            planned.update(tuple(k) for k in data['planned']) # type: ignore
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(dict(wisdom=pyfftw.export_wisdom(), planned=sorted(planned)), f)
+        os.replace(tmp, path)
+
+    def save(self):
+        """
+        Save to the store, if any
+        """
+        if self.store is not None:
+            with self._lock:
+                planned = list(self.planned)
+            self.store.save(self, planned)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        self.save()
@@ -0,0 +1,241 @@
+"""
+Field files in the npz format of tg.save or in a raw format that can be
+memory-mapped, or members of an interface series (see series.py). A member
+is addressed by the path it would have as a file in the series' directory;
+a file at that path takes precedence.
+
+Raw field layout:
+
+    magic (8 bytes) | header length (uint64, little endian) | JSON header |
+    zero padding up to a multiple of 4096 bytes | psi (C order)
+
+The header holds shape, size (lx, ly as strings), precision, fft_axes, dtype,
+the array offset and optional extra metadata. Since psi starts at an aligned
+offset it can be memory-mapped directly.
+"""
+from typing import Any, Dict, Literal, Optional
+import json
+import os
+import struct
+
+import numpy as np
+import torusgrid as tg
+
+from .timing import get_timings
+from .series import find_member, get_series, series_of
+
+
+FieldFormat = Literal['npz', 'raw', 'series']
+
+
+RAW_MAGIC = b'PFCFIELD'
+"""
+First 8 bytes of a raw field file
+"""
+
+_RAW_VERSION = 1
+_RAW_ALIGN = 4096
+
+
+def is_raw_field(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(RAW_MAGIC)) == RAW_MAGIC
+
+
+def save_raw(field: tg.RealField2D, path: str, *, extra: Optional[Dict[str, Any]] = None):
+    """
+    Save a field in the raw format; the file is written to a temporary path,
+    synced and renamed, so readers never see a partial file.
+    """
+    header = dict(
+        version=_RAW_VERSION,
+        shape=[int(n) for n in field.shape],
+        size=[str(field.lx), str(field.ly)],
+        precision=field.precision.name,
+        fft_axes=[int(a) for a in field.fft_axes],
+        dtype=field.psi.dtype.str,
+        extra=extra or {}
+    )
+
+    prefix_len = len(RAW_MAGIC) + 8
+    header_bytes = json.dumps(header).encode()
+    offset = -(-(prefix_len + len(header_bytes) + 32) // _RAW_ALIGN) * _RAW_ALIGN
+    header['offset'] = offset
+    header_bytes = json.dumps(header).encode()
+    assert prefix_len + len(header_bytes) <= offset
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(RAW_MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b'\0' * (offset - prefix_len - len(header_bytes)))
+        f.write(np.ascontiguousarray(field.psi).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_raw_header(path: str) -> Dict[str, Any]:
+    with open(path, 'rb') as f:
+        if f.read(len(RAW_MAGIC)) != RAW_MAGIC:
+            raise ValueError(f'{path} is not a raw field file')
+        n, = struct.unpack('<Q', f.read(8))
+        return json.loads(f.read(n))
+
+
+def _raw_metadata(header: Dict[str, Any]) -> Dict[str, Any]:
+    dtype = np.dtype(header['dtype']).type
+    return dict(
+        shape=tuple(header['shape']),
+        size=np.array([dtype(s) for s in header['size']]),
+        precision=header['precision'],
+        fft_axes=tuple(header['fft_axes'])
+    )
+
+
+class MappedRealField2D(tg.RealField2D):
+    """
+    A RealField2D whose psi is a read-only view of a memory-mapped raw field
+    file. Pages are read on demand and shared with the page cache. Since psi
+    cannot be written, FFT plans cannot be initialized and the field cannot
+    be evolved; use copy() to get an ordinary, writable field (also before
+    passing it to tg functions that build new fields of the same class, e.g.
+    tg.crop).
+    """
+    def __init__(self, psi: np.ndarray, metadata: Dict[str, Any]):
+        self._mapped = psi
+        super().__init__(
+                metadata['size'], tuple(metadata['shape']),
+                precision=metadata['precision'],
+                fft_axes=metadata['fft_axes'])
+
+    def _init_grid_data(self, shape):
+        self._psi = self._mapped
+        # only its shape is used; np.empty does not touch the pages
+        shape_k = (*shape[:-1], shape[-1]//2 + 1)
+        self._psi_k = np.empty(shape_k, dtype=tg.get_complex_dtype(self._precision))
+
+    def copy(self) -> tg.RealField2D: # type: ignore
+        return tg.RealField2D.from_array(np.array(self.psi), metadata=self.metadata())
+
+
+def load_field(path: str, *, mmap: bool = True) -> tg.RealField2D:
+    """
+    Load a field saved in any format. Raw files are memory-mapped (read
+    only) unless mmap=False, in which case psi is read into a new field.
+    """
+    with get_timings().timer('field.load'):
+        member = find_member(path)
+        if member is not None:
+            series, name = member
+            psi, header = series.read(name)
+            return tg.RealField2D.from_array(psi, metadata=_raw_metadata(header))
+
+        if not is_raw_field(path):
+            return tg.load(tg.RealField2D, path)
+
+        header = read_raw_header(path)
+        meta = _raw_metadata(header)
+
+        psi = np.memmap(path, dtype=np.dtype(header['dtype']), mode='r',
+                        offset=header['offset'], shape=meta['shape'])
+
+        field = MappedRealField2D(psi, meta)
+        if not mmap:
+            return field.copy()
+        return field
+
+
+def save_npz(field: tg.RealField2D, path: str):
+    """
+    Same file as tg.save, but written to a temporary path, synced and renamed
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, **field.metadata(), psi=field.psi)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def save_field(field: tg.RealField2D, path: str, fmt: FieldFormat = 'npz'):
+    """
+    Save a field atomically in the given format; with 'series', as a member
+    of the series in path's directory, replacing any file at path
+    """
+    with get_timings().timer('field.save'):
+        if fmt == 'raw':
+            save_raw(field, path)
+        elif fmt == 'npz':
+            save_npz(field, path)
+        elif fmt == 'series':
+            get_series(series_of(path)).append(field, os.path.basename(path))
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            raise ValueError(f'Invalid field format: {fmt}')
+
+
+def read_field_header(path: str) -> Dict[str, Any]:
+    """
+    Read lx, ly, shape and dtype of a saved field (any format) without
+    loading psi
+    """
+    member = find_member(path)
+    if member is not None:
+        series, name = member
+        header = series.header(name)
+    elif is_raw_field(path):
+        header = read_raw_header(path)
+    else:
+        header = None
+
+    if header is not None:
+        meta = _raw_metadata(header)
+        lx, ly = meta['size']
+        return dict(
+            lx=lx, ly=ly,
+            shape=list(meta['shape']),
+            dtype=np.dtype(tg.get_real_dtype(meta['precision'])).str
+        )
+
+    with open(path, 'rb') as f:
+        d = np.load(f)
+        lx, ly = d['size']
+        return dict(
+            lx=lx, ly=ly,
+            shape=[int(n) for n in d['shape']],
+            dtype=np.dtype(tg.get_real_dtype(str(d['precision']))).str
+        )
+
+
+def field_format(path: str) -> FieldFormat:
+    if find_member(path) is not None:
+        return 'series'
+    return 'raw' if is_raw_field(path) else 'npz'
+
+
+def field_stat(path: str) -> Dict[str, int]:
+    """
+    size and mtime_ns of a field file, or the stored size and write time of
+    a series member
+    """
+    member = find_member(path)
+    if member is not None:
+        series, name = member
+        return series.stat(name)
+    st = os.stat(path)
+    return dict(size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+
+def convert_field(path: str, fmt: FieldFormat) -> bool:
+    """
+    Convert a field file in place to the given format. Return whether the
+    file was rewritten.
+    """
+    if field_format(path) == fmt:
+        return False
+
+    save_field(load_field(path, mmap=False), path, fmt)
+    return True
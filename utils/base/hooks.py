@@ -0,0 +1,258 @@
+from typing import Any, Dict, Iterator, Optional, Tuple, Type
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import signal
+import sys
+import threading
+import time
+import numpy as np
+import torusgrid as tg
+import pfc_util as pfc
+
+from rich import get_console
+
+from .. import global_cfg as G
+from .config import CommandLineConfig
+from .jobs import ReportProgress
+
+
+class QuietDetectSlow(tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]):
+    """
+    Same stopping rule as tg.dynamics.DetectSlow (relative tolerance on a
+    monitored value, with patience), but without any live display.
+    """
+    def __init__(self, target: str, rtol: tg.FloatLike, patience: int, *, period: int = 1):
+        self.target = target
+        self.rtol = rtol
+        self.patience = patience
+        self.period = period
+
+    def on_start(self, n_steps: int, n_epochs: Optional[int]):
+        self._badness = 0
+        self._val_prev = None
+
+    def on_step(self, step: int):
+        if step % self.period != 0:
+            return
+
+        val = self.evolver.data[self.target]
+        if self._val_prev is not None and np.isclose(val, self._val_prev, rtol=self.rtol, atol=0):
+            self._badness += 1
+        else:
+            self._badness = 0
+        self._val_prev = val
+
+        if self._badness >= self.patience:
+            self.evolver.set_continue_flag(False)
+
+
+class QuietExitOnInterrupt(tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]):
+    """
+    Same as tg.dynamics.ExitOnInterrupt, without any live display, exiting
+    with status 130 (as a shell does on SIGINT) so that an interrupted
+    headless stage is not taken for a finished one
+    """
+    def on_interrupt(self):
+        get_console().log('Interrupted')
+        self.evolver.set_continue_flag(False)
+        self.evolver.wait()
+        sys.exit(130)
+
+
+class LogOnEnd(tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]):
+    """
+    Log a one-line summary of the monitored values when evolution ends
+    """
+    def __init__(self, label: str, keys: Tuple[str, ...] = ('age', 'psibar', 'F')):
+        self.label = label
+        self.keys = keys
+
+    def on_end(self):
+        values = ' '.join(f'{k}={self.evolver.data[k]}'
+                          for k in self.keys if k in self.evolver.data.keys())
+        get_console().log(f'{self.label}: {values}', highlight=False)
+
+
+class StopOnEvent(tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]):
+    """
+    Stop evolution as soon as the event is set (e.g. by a signal handler)
+    """
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def on_step(self, step: int):
+        if self.event.is_set():
+            self.evolver.set_continue_flag(False)
+
+
+class Stopped(Exception):
+    """
+    Raised by a stage whose stop event was set (see stop_on_sigterm) once its
+    progress is checkpointed
+    """
+
+
+@contextmanager
+def stop_on_sigterm(stop: threading.Event) -> Iterator[threading.Event]:
+    """
+    Set stop on SIGTERM instead of terminating, so that the stage can stop
+    after the current step (see StopOnEvent) and checkpoint; the previous
+    handler is restored on leaving
+    """
+    def on_sigterm(signum, frame):
+        get_console().log('SIGTERM received, stopping after the current step', style='bold red')
+        stop.set()
+
+    prev_handler = signal.signal(signal.SIGTERM, on_sigterm)
+    try:
+        yield stop
+    finally:
+        signal.signal(signal.SIGTERM, prev_handler)
+
+
+class RecordProgress(tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]):
+    """
+    Append a compact JSON record of the evolution (step, age, F, psibar, mu,
+    dt and steps/s since the previous record, with the monitored values of
+    the latest refresh) to path at most once every interval seconds, and
+    once when evolution ends. If path is None, records are logged instead.
+    """
+    keys = ('age', 'F', 'psibar', 'mu', 'dt')
+
+    def __init__(self, path: Optional[str], label: str, *, interval: float, **state):
+        self.path = path
+        self.label = label
+        self.interval = interval
+        self.state = state
+
+    def on_start(self, n_steps: int, n_epochs: Optional[int]):
+        self._n_steps = n_steps
+        self._steps = self._steps_prev = 0
+        self._rate = None
+        self._t_prev = time.perf_counter()
+
+    def on_step(self, step: int):
+        self._steps = (step + 1) * self._n_steps
+        if time.perf_counter() - self._t_prev >= self.interval:
+            self._record()
+
+    def on_end(self):
+        self._record(end=True)
+
+    def _record(self, **extra):
+        t = time.perf_counter()
+        if self._steps > self._steps_prev or self._rate is None:
+            self._rate = (self._steps - self._steps_prev) / max(t - self._t_prev, 1e-9)
+        self._steps_prev, self._t_prev = self._steps, t
+
+        data = self.evolver.data
+        rec = dict(time=round(time.time(), 3), label=self.label, **self.state,
+                   step=self._steps)
+        rec.update({k: float(data[k]) for k in self.keys if data.get(k) is not None})
+        rec['steps_per_s'] = round(self._rate, 2)
+        rec.update(extra)
+        _append_record(self.path, rec)
+
+
+def _append_record(path: Optional[str], rec: Dict[str, Any]):
+    """
+    Append rec as one JSON line to path (a single write, so that records of
+    worker processes do not interleave), or log it if path is None
+    """
+    line = json.dumps(rec, separators=(',', ':'))
+    if path is None:
+        get_console().log(line, highlight=False, markup=False)
+        return
+    with open(path, 'a') as f:
+        f.write(line + '\n')
+
+
+class Progress:
+    """
+    Progress records of a headless stage, appended to G.PROGRESS_FILE in its
+    directory (logged instead in a dry run), see RecordProgress
+    """
+    def __init__(self, dir: str, *, dry: bool, interval: float = G.PROGRESS_INTERVAL):
+        self.path = None if dry else str(Path(dir) / G.PROGRESS_FILE)
+        self.interval = interval
+        if self.path is not None:
+            Path(dir).mkdir(parents=True, exist_ok=True)
+
+    def hooks(self, label: str, **state) -> RecordProgress:
+        return RecordProgress(self.path, label, interval=self.interval, **state)
+
+    def record(self, label: str, **values):
+        """
+        Record values of a step that is not an evolution (e.g. a width
+        evaluated by the width scan)
+        """
+        _append_record(self.path, dict(time=round(time.time(), 3), label=label, **values))
+
+
+def get_progress(CC: CommandLineConfig, dir: str) -> Optional[Progress]:
+    """
+    The progress records of a stage writing to dir, if run with --headless
+    """
+    if not CC.headless:
+        return None
+    return Progress(dir, dry=CC.dry)
+
+
+def get_pfc_hooks(
+    progress: Optional[Progress], *,
+    label: str = '',
+    state: Dict[str, Any] = {},
+    **kwargs
+) -> tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]:
+    """
+    pfc.toolkit.get_pfc_hooks(**kwargs), or if progress is given (headless
+    mode), the same monitoring and stopping rule without live display,
+    recording progress instead (labelled with label and state). Either way
+    the evolution is reported to the job registry, see ReportProgress.
+    """
+    report = ReportProgress(
+            label, detect_slow=kwargs.get('detect_slow'),
+            period=kwargs.get('refresh_interval', 8), **state)
+
+    if progress is None:
+        return pfc.toolkit.get_pfc_hooks(**kwargs) + report
+
+    return (get_quiet_hooks(
+                state_function_cls=kwargs['state_function_cls'],
+                refresh_interval=kwargs.get('refresh_interval', 8),
+                detect_slow=kwargs['detect_slow'],
+                label=label, progress=progress, state=state)
+            + QuietExitOnInterrupt()
+            + report)
+
+
+def get_quiet_hooks(*,
+    state_function_cls: Type[pfc.core.FieldStateFunction2D],
+    refresh_interval: int,
+    detect_slow: Tuple[str, tg.FloatLike, int],
+    label: str = '',
+    progress: Optional[Progress] = None,
+    state: Dict[str, Any] = {}
+) -> tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]:
+    """
+    Counterpart of pfc.toolkit.get_pfc_hooks() without live display, for
+    evolvers that do not own the terminal (e.g. in worker processes). If
+    progress is given (headless mode), progress is recorded as well
+    (labelled with label and state).
+    """
+
+    def monitor(evolver: tg.dynamics.FieldEvolver[tg.RealField2D]) -> Dict[str, Any]:
+        environment = {p: evolver.data[p] for p in state_function_cls.environment_params()[0]}
+        environment.update({p: evolver.data.get(p, None) for p in state_function_cls.environment_params()[1]})
+        return state_function_cls.from_field(evolver.field, **environment).data
+
+    target, tol, patience = detect_slow
+
+    hooks = (tg.dynamics.MonitorValues[tg.dynamics.FieldEvolver[tg.RealField2D]](
+                monitor, period=refresh_interval)
+            + QuietDetectSlow(target, tol, patience, period=refresh_interval)
+            + LogOnEnd(label))
+    if progress is not None:
+        hooks = hooks + progress.hooks(label, **state)
+    return hooks
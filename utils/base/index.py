@@ -0,0 +1,73 @@
+from typing import Any, Dict, Optional
+from pathlib import Path
+import json
+import os
+
+import numpy as np
+import torusgrid as tg
+
+from .. import global_cfg as G
+from .fieldio import field_stat
+
+
+def index_entry(
+    field: tg.RealField2D, path: str, *,
+    F: tg.FloatLike, psibar: tg.FloatLike,
+    wall_time: float
+) -> Dict[str, Any]:
+    """
+    Index entry of a saved interface field.
+
+    size is the size of the file (or series member) in bytes; an entry whose
+    size does not match the file on disk is ignored. Floating point values
+    are stored as strings so that longdouble values are not truncated.
+    """
+    return dict(
+        file=Path(path).name,
+        shape=[int(n) for n in field.shape],
+        lx=str(field.lx), ly=str(field.ly),
+        size=field_stat(path)['size'],
+        dtype=field.psi.dtype.str,
+        F=str(F), psibar=str(psibar),
+        wall_time=wall_time
+    )
+
+
+def append_to_index(dir: str, entry: Dict[str, Any]):
+    """
+    Append an entry to the interface index of dir
+    """
+    with open(Path(dir) / G.INTERFACE_INDEX_FILE, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_index(dir: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Read the interface index of dir as {file name: entry}. Later entries of
+    the same file replace earlier ones; incomplete lines (e.g. from a process
+    killed while appending) are skipped.
+    """
+    path = Path(dir) / G.INTERFACE_INDEX_FILE
+    if not path.exists():
+        return {}
+
+    entries = {}
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[entry['file']] = entry
+    return entries
+
+
+def entry_float(entry: Dict[str, Any], key: str) -> Optional[tg.FloatLike]:
+    """
+    Read a floating point value of an index entry in the field's precision
+    """
+    if entry.get(key) is None:
+        return None
+    return np.dtype(entry['dtype']).type(entry[key])
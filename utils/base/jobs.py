@@ -0,0 +1,222 @@
+from typing import Any, Dict, List, Optional, Tuple
+from collections import deque
+from pathlib import Path
+import json
+import os
+import socket
+import threading
+import time
+
+import numpy as np
+import torusgrid as tg
+
+from .. import global_cfg as G
+from .lease import lease_is_stale
+
+
+Hooks = tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]
+
+
+def registry_dir() -> Path:
+    return Path(G.DATA_DIR) / G.JOBS_DIR
+
+
+class Job:
+    """
+    The stage running in this process, as registered in the job registry
+    (G.DATA_DIR/G.JOBS_DIR): one JSON file per process, rewritten atomically
+    every interval seconds by a heartbeat thread with the stage, its
+    directory, host, pid and the latest report of its evolution (see
+    ReportProgress), and removed by stop(). Reports made while no stage is
+    started are kept in memory only.
+
+    steps_per_s is measured between two heartbeats over all evolutions of
+    the stage.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.path: Optional[Path] = None
+        self.info: Dict[str, Any] = {}
+        self.report: Dict[str, Any] = {}
+        self.total_steps = 0
+        self._rate: Optional[float] = None
+        self._prev: Tuple[int, float] = (0, time.perf_counter())
+
+    def start(self, stage: str, dir: str, *, interval: float = G.JOB_HEARTBEAT_INTERVAL):
+        self.stop()
+        self.info = dict(stage=stage, dir=str(dir), host=socket.gethostname(),
+                         pid=os.getpid(), started=time.time())
+        self.report = {}
+        self.total_steps = 0
+        self._rate = None
+        self._prev = (0, time.perf_counter())
+
+        registry_dir().mkdir(parents=True, exist_ok=True)
+        self.path = registry_dir() / f'{self.info["host"]}-{self.info["pid"]}.json'
+        self._write()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._heartbeat, args=(interval,),
+                                        name='job-heartbeat', daemon=True)
+        self._thread.start()
+
+    def update(self, *, steps: int = 0, **values):
+        """
+        Add steps to the step count of the stage and replace the given
+        values of the report
+        """
+        with self._lock:
+            self.total_steps += steps
+            self.report.update(values)
+
+    def record(self) -> Dict[str, Any]:
+        with self._lock:
+            t = time.perf_counter()
+            steps_prev, t_prev = self._prev
+            if self.total_steps > steps_prev or self._rate is None:
+                self._rate = (self.total_steps - steps_prev) / max(t - t_prev, 1e-9)
+            self._prev = (self.total_steps, t)
+            return dict(self.info, **self.report, total_steps=self.total_steps,
+                        steps_per_s=round(self._rate, 2), heartbeat=time.time())
+
+    def _write(self):
+        assert self.path is not None
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.record(), f)
+        os.replace(tmp, self.path)
+
+    def _heartbeat(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self._write()
+            except OSError:
+                pass
+
+    def stop(self):
+        """
+        Stop the heartbeat and remove the registry entry
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+
+_job = Job()
+
+
+def get_job() -> Job:
+    """
+    The job of this process
+    """
+    return _job
+
+
+class ReportProgress(Hooks):
+    """
+    Report the evolution to the job of this process: label and state (e.g.
+    the interface index), the step within the evolution, the monitored F,
+    psibar, mu and dt, and the steps left until the stopping rule
+    detect_slow (relative change of target below rtol, patience times) is
+    expected to be met.
+
+    The estimate assumes the relative change of target per check decays
+    exponentially, fitted over the last window checks.
+    """
+    keys = ('F', 'psibar', 'mu', 'dt')
+
+    def __init__(
+        self, label: str, *,
+        detect_slow: Optional[Tuple[str, tg.FloatLike, int]],
+        period: int, window: int = 16,
+        **state
+    ):
+        self.label = label
+        self.detect_slow = detect_slow
+        self.period = period
+        self.state = state
+        self._changes: deque = deque(maxlen=window)
+
+    def on_start(self, n_steps: int, n_epochs: Optional[int]):
+        self._n_steps = n_steps
+        self._val_prev = None
+        self._changes.clear()
+        get_job().update(label=self.label, **self.state, step=0, steps_left=None)
+
+    def _steps_left(self, step: int) -> Optional[float]:
+        assert self.detect_slow is not None
+        _, rtol, patience = self.detect_slow
+        remaining = patience * self.period * self._n_steps
+        if len(self._changes) < 2:
+            return None
+        s, c = np.array(self._changes).T
+        if c[-1] <= rtol:
+            return remaining
+        slope, intercept = np.polyfit(s, np.log(c), 1)
+        if slope >= 0:
+            return None
+        return max((np.log(float(rtol)) - intercept) / slope - step, 0) + remaining
+
+    def on_step(self, step: int):
+        steps = (step + 1) * self._n_steps
+        values: Dict[str, Any] = dict(step=steps)
+
+        if step % self.period == 0:
+            data = self.evolver.data
+            values.update({k: float(data[k]) for k in self.keys if data.get(k) is not None})
+            if self.detect_slow is not None and data.get(self.detect_slow[0]) is not None:
+                val = float(data[self.detect_slow[0]])
+                if self._val_prev not in (None, 0):
+                    change = abs(val - self._val_prev) / abs(self._val_prev)
+                    if change > 0:
+                        self._changes.append((steps, change))
+                    values['steps_left'] = self._steps_left(steps)
+                self._val_prev = val
+
+        get_job().update(steps=self._n_steps, **values)
+
+
+def read_jobs() -> List[Dict[str, Any]]:
+    """
+    The registry entries, oldest first
+    """
+    jobs = []
+    d = registry_dir()
+    if not d.exists():
+        return jobs
+    for p in d.glob('*.json'):
+        try:
+            with open(p, 'r') as f:
+                info = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        info['file'] = str(p)
+        jobs.append(info)
+    return sorted(jobs, key=lambda j: j.get('started', 0))
+
+
+def job_is_stale(info: Dict[str, Any], ttl: float = G.LEASE_TTL) -> bool:
+    """
+    Whether a registry entry outlived its process (see lease_is_stale)
+    """
+    return lease_is_stale(info, ttl)
+
+
+def job_eta(info: Dict[str, Any]) -> Optional[float]:
+    """
+    Seconds until the current evolution of a job is expected to meet its
+    stopping rule, counted from now
+    """
+    steps_left, rate = info.get('steps_left'), info.get('steps_per_s')
+    if steps_left is None or not rate:
+        return None
+    return max(steps_left / rate - (time.time() - info['heartbeat']), 0)
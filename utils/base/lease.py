@@ -0,0 +1,226 @@
+from typing import Callable, Optional
+from pathlib import Path
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from .. import global_cfg as G
+
+
+def lease_path(dir: str) -> Path:
+    return Path(dir) / G.RUNNING_FILE
+
+
+def read_lease(dir: str) -> Optional[dict]:
+    """
+    The holder of the lease on dir (host, pid, token, acquired) together with
+    the time of its last heartbeat, or None if dir is not leased. Markers
+    written before leases existed have no holder fields.
+    """
+    path = lease_path(dir)
+    try:
+        heartbeat = path.stat().st_mtime
+        with open(path, 'r') as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+
+    try:
+        info = json.loads(text)
+        if not isinstance(info, dict):
+            info = {}
+    except json.JSONDecodeError:
+        info = {}
+
+    info['heartbeat'] = heartbeat
+    return info
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def lease_is_stale(info: dict, ttl: float = G.LEASE_TTL) -> bool:
+    """
+    Whether a lease (as returned by read_lease()) can be taken over: its
+    heartbeat is older than ttl, or its holder is a process on this host that
+    no longer exists
+    """
+    if time.time() - info['heartbeat'] > ttl:
+        return True
+
+    if info.get('host') == socket.gethostname() and 'pid' in info.keys():
+        return not _pid_alive(int(info['pid']))
+
+    return False
+
+
+def is_leased(dir: str, ttl: float = G.LEASE_TTL) -> bool:
+    """
+    Whether dir is held by a live lease
+    """
+    info = read_lease(dir)
+    return info is not None and not lease_is_stale(info, ttl)
+
+
+def describe_lease(info: Optional[dict]) -> str:
+    """
+    Holder and ages of a lease as returned by read_lease()
+    """
+    if info is None:
+        return 'another process'
+
+    now = time.time()
+    holder = f'{info.get("host", "?")}:{info.get("pid", "?")}'
+    s = f'{holder}, heartbeat {now - info["heartbeat"]:.0f}s ago'
+    if 'acquired' in info.keys():
+        s += f', held for {now - float(info["acquired"]):.0f}s'
+    return s
+
+
+class Lease:
+    """
+    An exclusive lease on a data directory, held through its .running file,
+    so that several processes or nodes sharing a data tree never write to
+    the same directory.
+
+    The lease file is created atomically (O_CREAT | O_EXCL) and records the
+    holder's host, pid and a random token. While held, a heartbeat thread
+    refreshes its modification time every ttl/4 seconds. A lease whose
+    heartbeat is older than ttl, or whose holder died on this host, is stale
+    and can be taken over: the stale file is renamed away (only one of
+    several contenders succeeds) and a new one is created.
+
+    If the heartbeat finds that the lease was lost (taken over after a long
+    stall, or removed), on_lost is called; the holder should stop writing.
+    """
+    def __init__(
+        self, dir: str, *,
+        ttl: float = G.LEASE_TTL,
+        on_lost: Optional[Callable[[], None]] = None
+    ):
+        self.dir = dir
+        self.path = lease_path(dir)
+        self.ttl = ttl
+        self.on_lost = on_lost
+
+        self.token = uuid.uuid4().hex
+        self.held = False
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _create(self) -> bool:
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+
+        info = dict(host=socket.gethostname(), pid=os.getpid(),
+                    token=self.token, acquired=time.time())
+        with os.fdopen(fd, 'w') as f:
+            json.dump(info, f)
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+
+    def _take_over(self, info: dict) -> bool:
+        """
+        Move a stale lease file out of the way, unless it was refreshed or
+        replaced since it was read
+        """
+        stale = self.path.with_name(f'{self.path.name}.stale.{self.token}')
+        try:
+            os.rename(self.path, stale)
+        except FileNotFoundError:
+            return True
+
+        try:
+            heartbeat = stale.stat().st_mtime
+            with open(stale, 'r') as f:
+                text = f.read()
+            moved = json.loads(text) if text else {}
+        except (OSError, json.JSONDecodeError):
+            heartbeat, moved = None, {}
+
+        if moved.get('token') != info.get('token') or heartbeat != info['heartbeat']:
+            # another process took over first, or the holder came back to
+            # life, and we moved a live lease: put it back (unless yet another
+            # lease was created meanwhile)
+            try:
+                os.link(stale, self.path)
+            except FileExistsError:
+                pass
+            os.remove(stale)
+            return False
+
+        os.remove(stale)
+        return True
+
+    def acquire(self) -> bool:
+        """
+        Try to acquire the lease, taking over a stale one. Return whether the
+        lease is now held.
+        """
+        Path(self.dir).mkdir(parents=True, exist_ok=True)
+
+        for _ in range(3):
+            if self._create():
+                self.held = True
+                self._thread = threading.Thread(target=self._heartbeat, name='lease-heartbeat', daemon=True)
+                self._thread.start()
+                return True
+
+            info = read_lease(self.dir)
+            if info is None:
+                continue
+            if not lease_is_stale(info, self.ttl):
+                return False
+            if not self._take_over(info):
+                return False
+
+        return False
+
+    def owned(self) -> bool:
+        info = read_lease(self.dir)
+        return info is not None and info.get('token') == self.token
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.ttl / 4):
+            if not self.owned():
+                self.held = False
+                if self.on_lost is not None:
+                    self.on_lost()
+                return
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                pass
+
+    def release(self):
+        """
+        Stop the heartbeat and remove the lease file if still held
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self.held and self.owned():
+            os.remove(self.path)
+        self.held = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
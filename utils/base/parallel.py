@@ -0,0 +1,62 @@
+from typing import Optional, Tuple
+from multiprocessing import shared_memory
+import numpy as np
+import os
+
+
+def max_workers(
+    requested: int, *,
+    n_tasks: Optional[int] = None,
+    bytes_per_worker: Optional[int] = None,
+    memory_limit: Optional[int] = None
+) -> int:
+    """
+    Number of worker processes to use given the requested number, the number
+    of tasks and an optional memory cap. Always at least 1.
+
+    requested <= 0 means one worker per CPU.
+    """
+    n = requested if requested > 0 else (os.cpu_count() or 1)
+
+    if n_tasks is not None:
+        n = min(n, n_tasks)
+
+    if memory_limit is not None and bytes_per_worker is not None and bytes_per_worker > 0:
+        n = min(n, memory_limit // bytes_per_worker)
+
+    return max(1, int(n))
+
+
+class SharedArray:
+    """
+    A numpy array backed by multiprocessing.shared_memory, used to move large
+    arrays between processes without pickling them.
+
+    The creating process owns the segment and must call unlink(); other
+    processes attach with SharedArray.attach(*shared.spec()).
+    """
+    def __init__(self, shm: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype: str):
+        self.shm = shm
+        self.array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+    @classmethod
+    def from_array(cls, arr: np.ndarray) -> 'SharedArray':
+        shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+        shared = cls(shm, arr.shape, arr.dtype.str)
+        shared.array[...] = arr
+        return shared
+
+    @classmethod
+    def attach(cls, name: str, shape: Tuple[int, ...], dtype: str) -> 'SharedArray':
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype)
+
+    def spec(self) -> Tuple[str, Tuple[int, ...], str]:
+        return self.shm.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        del self.array
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
@@ -1,5 +1,7 @@
 from __future__ import annotations
-from typing import Optional, overload
+from typing import Dict, Optional, Tuple, overload
+from pathlib import Path
+import re
 import pfc_util as pfc
 
 
@@ -41,3 +43,45 @@ def get_path(
     return s
 
 
+
+
+def parse_path(path: str) -> Dict[str, str]:
+    """
+    Inverse of get_path(): return the parameters encoded in a data path, i.e.
+    nx, ny, eps, alpha, beta and theta (as formatted in the directory name).
+    Levels absent from the path are omitted.
+    """
+    params = {}
+    for part in Path(path).parts:
+        m = re.fullmatch(r'(\d+)x(\d+)', part)
+        if m is not None:
+            params['nx'], params['ny'] = m.group(1), m.group(2)
+            continue
+
+        key, _, val = part.partition('_')
+        if key in ['eps', 'alpha', 'beta', 'theta'] and val:
+            params[key] = val
+
+    return params
+
+
+def find_rotation(theta: str, max_index: int = 32) -> Tuple[int, int]:
+    """
+    Find the orientation vector (na, nb) whose rotation angle, formatted as in
+    get_path(), equals theta. Smaller |na|+|nb| are tried first.
+    """
+    pairs = [(na, nb) 
+             for na in range(-max_index, max_index+1)
+             for nb in range(-max_index, max_index+1)
+             if (na, nb) != (0, 0)]
+
+    pairs.sort(key=lambda p: (abs(p[0])+abs(p[1]), p))
+
+    for na, nb in pairs:
+        try:
+            if f'{pfc.toolkit.UnitCellRotator(na, nb).theta:.4f}' == theta:
+                return na, nb
+        except (ValueError, ZeroDivisionError):
+            continue
+
+    raise ValueError(f'No orientation (na, nb) with |na|,|nb| <= {max_index} gives theta={theta}')
@@ -0,0 +1,314 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+import csv
+import json
+import pickle
+import sqlite3
+import sys
+import time
+
+from .. import global_cfg as G
+from .data import put_val
+from .index import read_index
+from .paths import parse_path
+
+
+_SCHEMA_VERSION = 1
+
+_SCHEMA = '''
+CREATE TABLE angles (
+    dir TEXT PRIMARY KEY,
+    nx INTEGER, ny INTEGER,
+    eps TEXT, alpha TEXT, beta TEXT, theta TEXT,
+    eps_f REAL, alpha_f REAL, beta_f REAL, theta_f REAL,
+    na INTEGER, nb INTEGER,
+    mu TEXT,
+    n_interfaces INTEGER, lx_max REAL, wall_time REAL,
+    gamma REAL, n_gamma INTEGER, n_widths INTEGER,
+    calc TEXT, calc_mtime_ns INTEGER, index_mtime_ns INTEGER,
+    updated REAL
+)
+'''
+
+COLUMNS = ['nx', 'ny', 'eps', 'alpha', 'beta', 'theta', 'na', 'nb', 'mu',
+           'n_interfaces', 'lx_max', 'wall_time', 'gamma', 'n_gamma', 'n_widths', 'dir']
+"""
+Columns of query results, see ResultStore
+"""
+
+RANGE_KEYS = ['nx', 'ny', 'eps', 'alpha', 'beta', 'theta']
+"""
+Parameters queries can be restricted to a range of
+"""
+
+
+def parse_range(s: Optional[str]) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """
+    'A:B', 'A:' or ':B' as (min, max) (None for an open end), 'A' as (A, A)
+    """
+    if s is None:
+        return None
+    lo, sep, hi = s.partition(':')
+    if not sep:
+        hi = lo
+    return (float(lo) if lo else None, float(hi) if hi else None)
+
+
+def _float(x: Optional[str]) -> Optional[float]:
+    return None if x is None else float(x)
+
+
+def _mtimes(angle_dir: Path) -> Tuple[Optional[int], Optional[int]]:
+    """
+    mtime of the calc.json and of the interface index of angle_dir (None if
+    absent), which a row is up to date with
+    """
+    files = [angle_dir / G.CALC_FILE, angle_dir / G.INTERFACES_DIR / G.INTERFACE_INDEX_FILE]
+    calc, index = (p.stat().st_mtime_ns if p.exists() else None for p in files)
+    return calc, index
+
+
+class ResultStore:
+    """
+    SQLite index (G.DATA_DIR/G.RESULTS_FILE) of the theta_* directories of the
+    data tree: one row per angle with its path parameters, (na, nb), mu, the
+    interfaces recorded in its index (count, largest Lx, total wall time) and
+    its calc.json (the whole file, plus the last gamma and the number of
+    gamma and width values).
+
+    Rows are keyed by the directory relative to G.DATA_DIR and are replaced
+    by update(), which calc, calc_gamma and calc_width call after writing
+    calc.json; rebuild() rescans a tree written without it. Directories
+    outside G.DATA_DIR are not indexed. The database is only a cache of the
+    files and is recreated when its schema changes.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.data_dir = Path(G.DATA_DIR).resolve()
+        self.path = Path(path) if path is not None else Path(G.DATA_DIR) / G.RESULTS_FILE
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.path), timeout=60)
+        db.row_factory = sqlite3.Row
+        version, = db.execute('PRAGMA user_version').fetchone()
+        if version != _SCHEMA_VERSION:
+            with db:
+                db.execute('DROP TABLE IF EXISTS angles')
+                db.execute(_SCHEMA)
+                db.execute(f'PRAGMA user_version = {_SCHEMA_VERSION}')
+        return db
+
+    def key(self, angle_dir: str) -> Optional[str]:
+        """
+        angle_dir relative to G.DATA_DIR, or None if it is outside
+        """
+        try:
+            return Path(angle_dir).resolve().relative_to(self.data_dir).as_posix()
+        except ValueError:
+            return None
+
+    def _prefix(self, root: str) -> str:
+        key = self.key(root)
+        if key is None:
+            raise ValueError(f'Invalid data root: {root}')
+        return '' if key == '.' else key + '/'
+
+    @staticmethod
+    def _row(angle_dir: Path, key: str) -> Dict[str, Any]:
+        params = parse_path(key)
+        row: Dict[str, Any] = dict(
+            dir=key,
+            nx=int(params['nx']) if 'nx' in params else None,
+            ny=int(params['ny']) if 'ny' in params else None,
+            eps=params.get('eps'), alpha=params.get('alpha'),
+            beta=params.get('beta'), theta=params.get('theta'),
+            na=None, nb=None, mu=None,
+            calc=None,
+            gamma=None, n_gamma=None, n_widths=None,
+            updated=time.time())
+        for k in ['eps', 'alpha', 'beta', 'theta']:
+            row[f'{k}_f'] = _float(row[k])
+
+        data_file = angle_dir / G.INTERFACE_DATA_FILE
+        if data_file.exists():
+            with open(data_file, 'r') as f:
+                data = json.load(f)
+            row['na'], row['nb'] = data.get('na'), data.get('nb')
+
+        log_file = angle_dir.parent / 'log.pkl'
+        if log_file.exists():
+            try:
+                with open(log_file, 'rb') as f:
+                    row['mu'] = str(pickle.load(f)[-1].mu[-1])
+            except (pickle.UnpicklingError, EOFError, AttributeError, IndexError, ImportError):
+                pass
+
+        row['calc_mtime_ns'], row['index_mtime_ns'] = _mtimes(angle_dir)
+
+        entries = read_index(str(angle_dir / G.INTERFACES_DIR)).values()
+        row['n_interfaces'] = len(entries)
+        row['lx_max'] = max((float(e['lx']) for e in entries), default=None)
+        row['wall_time'] = sum(float(e.get('wall_time') or 0) for e in entries)
+
+        calc_file = angle_dir / G.CALC_FILE
+        if calc_file.exists():
+            with open(calc_file, 'r') as f:
+                calc = json.load(f)
+            row['calc'] = json.dumps(calc)
+            gamma = calc.get('gamma')
+            if gamma:
+                row['gamma'], row['n_gamma'] = gamma[-1], len(gamma)
+            widths = calc.get('widths')
+            if widths is not None:
+                row['n_widths'] = sum(w is not None for w in widths)
+        return row
+
+    @staticmethod
+    def _put(db: sqlite3.Connection, row: Dict[str, Any]):
+        keys = list(row.keys())
+        db.execute(f'INSERT OR REPLACE INTO angles ({", ".join(keys)}) '
+                   f'VALUES ({", ".join("?" for _ in keys)})', [row[k] for k in keys])
+
+    def update(self, angle_dir: str):
+        """
+        Re-read the files of angle_dir into its row
+        """
+        key = self.key(angle_dir)
+        if key is None:
+            return
+        db = self.connect()
+        try:
+            with db:
+                self._put(db, self._row(Path(angle_dir), key))
+        finally:
+            db.close()
+
+    def rebuild(self, root: str) -> Tuple[int, int]:
+        """
+        Index every theta_* directory under root (with interfaces or a
+        calc.json) whose calc.json or interface index changed since it was
+        indexed, and drop the rows of directories under root that no longer
+        exist. Return the numbers of rows updated and removed.
+        """
+        prefix = self._prefix(root)
+        dirs = set(p.parent for p in Path(root).rglob(G.INTERFACES_DIR) if p.is_dir())
+        dirs |= set(p.parent for p in Path(root).rglob(G.CALC_FILE))
+
+        db = self.connect()
+        try:
+            indexed = {r['dir']: (r['calc_mtime_ns'], r['index_mtime_ns']) for r in db.execute(
+                'SELECT dir, calc_mtime_ns, index_mtime_ns FROM angles WHERE substr(dir, 1, ?) = ?',
+                (len(prefix), prefix))}
+
+            n_updated = 0
+            keys = set()
+            with db:
+                for d in sorted(dirs):
+                    key = self.key(str(d))
+                    if key is None or 'theta' not in parse_path(key):
+                        continue
+                    keys.add(key)
+                    if indexed.get(key) == _mtimes(d):
+                        continue
+                    self._put(db, self._row(d, key))
+                    n_updated += 1
+
+                removed = [k for k in indexed if k not in keys]
+                db.executemany('DELETE FROM angles WHERE dir = ?', [(k,) for k in removed])
+            return n_updated, len(removed)
+        finally:
+            db.close()
+
+    def query(
+        self, root: Optional[str] = None, *,
+        ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+        with_calc: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Rows under root (default: all) with every parameter in ranges
+        (RANGE_KEYS -> (min, max), None for an open end) within its range,
+        sorted by parameters. With with_calc, each row also holds its calc.json
+        (None where absent) under 'calc'.
+        """
+        where, args = [], []
+        if root is not None:
+            prefix = self._prefix(root)
+            where.append('substr(dir, 1, ?) = ?')
+            args += [len(prefix), prefix]
+
+        for k, (lo, hi) in (ranges or {}).items():
+            if k not in RANGE_KEYS:
+                raise ValueError(f'Cannot filter by {k}, expected one of {RANGE_KEYS}')
+            col = k if k in ['nx', 'ny'] else f'{k}_f'
+            # theta is formatted with 4 decimals in directory names
+            tol = 5e-5 if k == 'theta' else 0
+            if lo is not None:
+                where.append(f'{col} >= ?')
+                args.append(lo - tol)
+            if hi is not None:
+                where.append(f'{col} <= ?')
+                args.append(hi + tol)
+
+        sql = 'SELECT * FROM angles'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY nx, ny, eps_f, alpha_f, beta_f, theta_f'
+
+        db = self.connect()
+        try:
+            rows = []
+            for r in db.execute(sql, args):
+                row = {c: r[c] for c in COLUMNS}
+                if with_calc:
+                    row['calc'] = None if r['calc'] is None else json.loads(r['calc'])
+                rows.append(row)
+            return rows
+        finally:
+            db.close()
+
+
+def update_results(angle_dir: str):
+    """
+    Update the result index row of angle_dir after its calc.json was written
+    """
+    ResultStore().update(angle_dir)
+
+
+def export_rows(rows: List[Dict[str, Any]], fmt: str, output: Optional[str] = None):
+    """
+    Write query rows as csv or json to output (default: stdout)
+    """
+    f = open(output, 'w', newline='') if output is not None else sys.stdout
+    try:
+        if fmt == 'json':
+            json.dump(rows, f, indent=2)
+            f.write('\n')
+        elif fmt == 'csv':
+            writer = csv.DictWriter(f, fieldnames=COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            raise ValueError(f'Invalid export format: {fmt}')
+    finally:
+        if output is not None:
+            f.close()
+
+
+def rows_by_path(rows: Iterable[Dict[str, Any]], root: str) -> Dict[str, Any]:
+    """
+    calc.json of the rows (queried with_calc) as a nested dict keyed by the
+    affixes of their directories below root, e.g. d['32x16']['0.1']['0.0']
+    ['1.0']['1.5708']
+    """
+    prefix = ResultStore()._prefix(root)
+    d: Dict[str, Any] = {}
+    for row in rows:
+        if row['calc'] is None:
+            continue
+        affixes = [s.split('_')[-1] for s in Path(row['dir'][len(prefix):]).parts]
+        put_val(d, *affixes, val=row['calc'])
+    return d
@@ -0,0 +1,59 @@
+from typing import Callable, List, Optional
+import threading
+import torusgrid as tg
+import rich
+
+from .config import PhaseConfig
+from .checkpoint import Checkpoint
+from .timing import timed_hooks
+
+
+Hooks = tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]
+
+
+def run_phases(
+    field: tg.RealField2D,
+    phases: List[PhaseConfig],
+    supplier: Callable[[tg.RealField2D, PhaseConfig], tg.dynamics.FieldEvolver[tg.RealField2D]],
+    hooks: Callable[[PhaseConfig], Hooks],
+    checkpoint: Checkpoint, name: str, *,
+    stop: Optional[threading.Event] = None,
+    **state
+) -> bool:
+    """
+    Run the phases of a precision schedule on field, before its final
+    minimization in its own precision (which is left to the caller). Each
+    phase minimizes a copy of field converted to the phase's precision until
+    the phase's stopping criterion is met; the result is then promoted back
+    into field. The size of field is kept (rounding it through a lower
+    precision would change it), so the minimizers must not relax it.
+
+    Phases are checkpointed under name: completed ones are skipped and the
+    one in flight is resumed. The final minimization should then restore
+    with checkpoint.restore(name, minimizer, phase=len(phases)).
+
+    Return False if stopped by stop, in which case field is not updated.
+    """
+    console = rich.get_console()
+
+    for k, phase in enumerate(phases):
+        if checkpoint.get(f'{name}.phase', 0) > k:
+            continue
+
+        console.log(f'Phase {k+1}/{len(phases)+1}: precision={phase.precision} '
+                    f'tol={float(phase.tol):g}', highlight=False)
+
+        copy = tg.change_precision(field, phase.precision)
+        m = supplier(copy, phase)
+        checkpoint.restore(name, m, phase=k)
+        m.run(phase.n_steps, timed_hooks(hooks(phase) + checkpoint.hook(name, stop=stop, **state)))
+
+        if stop is not None and stop.is_set():
+            return False
+
+        field.psi[...] = copy.psi
+        checkpoint.advance(name, field, k+1, **state)
+
+    if phases:
+        console.log(f'Phase {len(phases)+1}/{len(phases)+1}: precision={field.precision}', highlight=False)
+    return True
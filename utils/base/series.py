@@ -0,0 +1,358 @@
+"""
+Interface series: the fields of an interfaces directory stored as members of
+one append-only, chunked and compressed file (G.SERIES_FILE).
+
+Series layout, a sequence of records:
+
+    magic (8 bytes) | header length (uint64, little endian) | JSON header |
+    chunks
+
+The header holds the member's name, write time, shape, size (lx, ly as
+strings), precision, fft_axes and dtype, and its chunks (rows, compressed
+bytes and encoding of each). A chunk is a range of rows whose bytes are
+shuffled (the first byte of every value, then the second, ...) and
+zlib-compressed. A delta chunk is XORed with the prediction of its rows
+before, where the prediction is the member the record refers to (ref) with
+its rows moved by the header's segments: the halves of the previous
+interface placed where elongate_interface puts them, the inserted cells left
+unpredicted. Chunks are delta-encoded only where that compresses better, and
+chains of references are at most KEYFRAME_INTERVAL long, so reading any
+member decodes a bounded number of records.
+
+A record is only valid once completely written; an incomplete last record
+(e.g. of a killed process) is ignored by readers and overwritten by the next
+append. A later member replaces an earlier one of the same name.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from pathlib import Path
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+import torusgrid as tg
+
+from .. import global_cfg as G
+
+
+SERIES_MAGIC = b'PFCSERIE'
+"""
+First 8 bytes of every record of a series file
+"""
+
+KEYFRAME_INTERVAL = 8
+"""
+Maximum number of records decoded to read one member
+"""
+
+CHUNK_BYTES = 4 * 1024**2
+"""
+Uncompressed size of a chunk (rounded to whole rows)
+"""
+
+COMPRESSION_LEVEL = 6
+"""
+zlib level of the chunks
+"""
+
+_PREFIX = len(SERIES_MAGIC) + 8
+
+
+def _shuffle(block: np.ndarray, itemsize: int) -> bytes:
+    return np.ascontiguousarray(block.reshape(-1, itemsize).T).tobytes()
+
+
+def _unshuffle(data: bytes, itemsize: int) -> np.ndarray:
+    return np.ascontiguousarray(np.frombuffer(data, dtype=np.uint8).reshape(itemsize, -1).T).ravel()
+
+
+def _as_rows(psi: np.ndarray) -> np.ndarray:
+    """
+    The bytes of psi (C order), one row per x index
+    """
+    return psi.view(np.uint8).reshape(psi.shape[0], -1)
+
+
+def _predict(ref: np.ndarray, shape: Tuple[int, ...], segments: List[List[int]]) -> np.ndarray:
+    pred = np.zeros(shape, dtype=ref.dtype)
+    for dst, src, n in segments:
+        pred[dst:dst+n] = ref[src:src+n]
+    return pred
+
+
+def _segments(psi: np.ndarray, ref: np.ndarray) -> List[List[int]]:
+    """
+    Where the rows of ref (the previous interface) are in psi, assuming psi
+    is ref elongated as LIISSIIL: the left half after nl inserted rows, the
+    right half before nl inserted rows, with nl chosen to best match the
+    first few columns
+    """
+    nx, px = psi.shape[0], ref.shape[0]
+    h, d = px // 2, nx - px
+    cols = min(psi.shape[1], 4)
+    a = psi[:, :cols].astype(np.float64)
+    b = ref[:, :cols].astype(np.float64)
+
+    def mismatch(nl: int) -> float:
+        return float(np.abs(a[nl:nl+h] - b[:h]).sum() + np.abs(a[h+d-nl:nx-nl] - b[h:]).sum())
+
+    nl = min(range(d//2 + 1), key=mismatch)
+    return [[nl, 0, h], [h+d-nl, h, px-h]]
+
+
+class FieldSeries:
+    """
+    Reader and appender of a series file. Records appended by other
+    processes are picked up by refresh(). The last member read or written is
+    kept decoded, so that reading members in order decodes each record once.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._clear()
+        self.refresh()
+
+    def _clear(self):
+        self.records: List[Dict[str, Any]] = []
+        self._members: Dict[str, int] = {}
+        self._end = 0
+        self._decoded: Optional[Tuple[int, np.ndarray]] = None
+
+    def refresh(self):
+        """
+        Read the headers of the records appended since the last call (all
+        of them if the file was removed or truncated since)
+        """
+        with self._lock:
+            if not os.path.exists(self.path):
+                self._clear()
+                return
+            with open(self.path, 'rb') as f:
+                file_size = os.fstat(f.fileno()).st_size
+                if file_size < self._end:
+                    self._clear()
+                f.seek(self._end)
+                while True:
+                    prefix = f.read(_PREFIX)
+                    if len(prefix) < _PREFIX or prefix[:len(SERIES_MAGIC)] != SERIES_MAGIC:
+                        return
+                    n, = struct.unpack('<Q', prefix[len(SERIES_MAGIC):])
+                    header_bytes = f.read(n)
+                    if len(header_bytes) < n:
+                        return
+                    try:
+                        header = json.loads(header_bytes)
+                    except ValueError:
+                        return
+
+                    offset = self._end + _PREFIX + n
+                    end = offset + sum(nbytes for _, nbytes, _ in header['chunks'])
+                    if end > file_size:
+                        return
+
+                    header.update(offset=offset, nbytes=end - self._end, position=len(self.records))
+                    self._members[header['name']] = len(self.records)
+                    self.records.append(header)
+                    self._end = end
+                    f.seek(end)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return sorted(self._members.keys())
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._members
+
+    def header(self, name: str) -> Dict[str, Any]:
+        with self._lock:
+            return self.records[self._members[name]]
+
+    def stat(self, name: str) -> Dict[str, int]:
+        """
+        Stored size (header and chunks) and write time of a member, in place
+        of a file's st_size and st_mtime_ns
+        """
+        h = self.header(name)
+        return dict(size=h['nbytes'], mtime_ns=h['time_ns'])
+
+    def _psi(self, position: int) -> np.ndarray:
+        """
+        The decoded array of a record (not to be modified)
+        """
+        if self._decoded is not None and self._decoded[0] == position:
+            return self._decoded[1]
+
+        rec = self.records[position]
+        dtype = np.dtype(rec['dtype'])
+        shape = tuple(rec['shape'])
+
+        pred = None
+        if any(enc == 'delta' for _, _, enc in rec['chunks']):
+            pred = _as_rows(_predict(self._psi(rec['ref']), shape, rec['segments']))
+
+        psi = np.empty(shape, dtype=dtype)
+        rows = _as_rows(psi)
+        with open(self.path, 'rb') as f:
+            f.seek(rec['offset'])
+            r0 = 0
+            for n_rows, nbytes, enc in rec['chunks']:
+                block = _unshuffle(zlib.decompress(f.read(nbytes)), dtype.itemsize)
+                if enc == 'delta':
+                    assert pred is not None
+                    block ^= pred[r0:r0+n_rows].ravel()
+                rows[r0:r0+n_rows] = block.reshape(n_rows, -1)
+                r0 += n_rows
+
+        self._decoded = (position, psi)
+        return psi
+
+    def read(self, name: str) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        psi (read only, owned by the series) and header of a member
+        """
+        with self._lock:
+            position = self._members[name]
+            return self._psi(position), self.records[position]
+
+    def _reference(self, psi: np.ndarray, lx: tg.FloatLike, ly: tg.FloatLike) -> Optional[Dict[str, Any]]:
+        """
+        The last record, if psi can be predicted from it
+        """
+        if not self.records:
+            return None
+        rec = self.records[-1]
+        if rec['depth'] + 1 >= KEYFRAME_INTERVAL:
+            return None
+
+        dtype = np.dtype(rec['dtype'])
+        nx, ny = rec['shape']
+        rlx, rly = dtype.type(rec['size'][0]), dtype.type(rec['size'][1])
+        if (np.dtype(psi.dtype) != dtype or psi.shape[1] != ny or psi.shape[0] < nx
+                or rly != ly or not np.isclose(rlx / nx, lx / psi.shape[0], rtol=1e-9, atol=0)):
+            return None
+        return rec
+
+    def append(self, field: tg.RealField2D, name: str):
+        """
+        Append field as member name, durably (written and synced) on return
+        """
+        with self._lock:
+            self.refresh()
+
+            psi = np.ascontiguousarray(field.psi)
+            itemsize = psi.dtype.itemsize
+            rows = _as_rows(psi)
+
+            ref = self._reference(psi, field.lx, field.ly)
+            segments, pred = [], None
+            if ref is not None:
+                ref_psi = self._psi(ref['position'])
+                segments = _segments(psi, ref_psi)
+                pred = _as_rows(_predict(ref_psi, psi.shape, segments))
+
+            chunk_rows = max(1, CHUNK_BYTES // rows.shape[1])
+            chunks, blobs = [], []
+            for r0 in range(0, psi.shape[0], chunk_rows):
+                block = rows[r0:r0+chunk_rows]
+                blob, enc = zlib.compress(_shuffle(block, itemsize), COMPRESSION_LEVEL), 'plain'
+                if pred is not None:
+                    delta = zlib.compress(_shuffle(block ^ pred[r0:r0+chunk_rows], itemsize), COMPRESSION_LEVEL)
+                    if len(delta) < len(blob):
+                        blob, enc = delta, 'delta'
+                chunks.append([block.shape[0], len(blob), enc])
+                blobs.append(blob)
+
+            if not any(enc == 'delta' for _, _, enc in chunks):
+                ref, segments = None, []
+
+            header = dict(
+                name=name,
+                time_ns=time.time_ns(),
+                shape=[int(n) for n in psi.shape],
+                size=[str(field.lx), str(field.ly)],
+                precision=field.precision.name,
+                fft_axes=[int(a) for a in field.fft_axes],
+                dtype=psi.dtype.str,
+                ref=None if ref is None else ref['position'],
+                depth=0 if ref is None else ref['depth'] + 1,
+                segments=segments,
+                chunks=chunks
+            )
+            header_bytes = json.dumps(header).encode()
+
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            with os.fdopen(fd, 'r+b') as f:
+                # drop an incomplete record left by a killed writer
+                f.truncate(self._end)
+                f.seek(self._end)
+                f.write(SERIES_MAGIC)
+                f.write(struct.pack('<Q', len(header_bytes)))
+                f.write(header_bytes)
+                for blob in blobs:
+                    f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+
+            offset = self._end + _PREFIX + len(header_bytes)
+            end = offset + sum(len(b) for b in blobs)
+            header.update(offset=offset, nbytes=end - self._end, position=len(self.records))
+            self._members[name] = len(self.records)
+            self.records.append(header)
+            self._end = end
+            self._decoded = (header['position'], psi.copy())
+
+
+_series: Dict[str, FieldSeries] = {}
+_series_lock = threading.Lock()
+
+
+def get_series(path: str) -> FieldSeries:
+    """
+    The (refreshed) FieldSeries of a series file, shared within the process
+    """
+    key = os.path.abspath(path)
+    with _series_lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = FieldSeries(path)
+    series.refresh()
+    return series
+
+
+def series_of(field_path: str) -> str:
+    """
+    Path of the series file that a field path of an interfaces directory
+    would be a member of
+    """
+    return str(Path(field_path).parent / G.SERIES_FILE)
+
+
+def find_member(field_path: str) -> Optional[Tuple[FieldSeries, str]]:
+    """
+    The series and member name of a field path that is not a file but a
+    member of its directory's series, or None
+    """
+    p = Path(field_path)
+    if p.exists():
+        return None
+    series_path = p.parent / G.SERIES_FILE
+    if not series_path.exists():
+        return None
+    series = get_series(str(series_path))
+    if p.name not in series:
+        return None
+    return series, p.name
+
+
+def member_paths(dir: str) -> List[str]:
+    """
+    Field paths (dir/name) of the members of the series in dir, if any
+    """
+    series_path = Path(dir) / G.SERIES_FILE
+    if not series_path.exists():
+        return []
+    return [str(Path(dir) / name) for name in get_series(str(series_path)).names()]
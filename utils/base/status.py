@@ -1,20 +1,70 @@
-from pathlib import Path
+from typing import Any, Dict, Optional
+import os
+import time
 
 import rich
-from .. import global_cfg as G
+from rich.table import Table
 
+from .jobs import read_jobs, job_is_stale, job_eta
 
 
-def show_status():
+def _duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '?'
+    seconds = int(seconds)
+    h, m, s = seconds // 3600, seconds // 60 % 60, seconds % 60
+    return f'{h}:{m:02d}:{s:02d}' if h else f'{m}:{s:02d}'
 
+
+def _row(info: Dict[str, Any], now: float):
+    where = info.get('label', '')
+    if info.get('interface') is not None:
+        where += f' #{info["interface"]}'
+    F = info.get('F')
+    return (
+        info.get('stage', '?'), info.get('dir', '?'),
+        f'{info.get("host", "?")}:{info.get("pid", "?")}',
+        _duration(now - info['started']) if 'started' in info else '?',
+        f'{now - info["heartbeat"]:.0f}s',
+        where, str(info.get('step', '')),
+        f'{info.get("steps_per_s", 0):.1f}',
+        '' if F is None else f'{F:.10g}',
+        _duration(job_eta(info)))
+
+
+def show_status(*, prune: bool = False):
+    """
+    List the jobs in the registry (see Job) with their throughput and ETA
+    of the current evolution, and stale entries separately (removed with
+    prune). Only the registry is read.
+    """
     console = rich.get_console()
-    
-    data_path = Path(G.DATA_DIR)
+    now = time.time()
+
+    jobs = read_jobs()
+    running = [j for j in jobs if not job_is_stale(j)]
+    stale = [j for j in jobs if job_is_stale(j)]
 
-    running = list(data_path.rglob('.running'))
+    columns = ['stage', 'dir', 'holder', 'running', 'heartbeat', 'evolving', 'step', 'steps/s', 'F', 'ETA']
 
-    console.print(f'[bold orange1] {len(running)} Running: [/bold orange1]') 
+    console.print(f'[bold orange1] {len(running)} Running: [/bold orange1]')
+    if running:
+        table = Table(*columns)
+        for j in running:
+            table.add_row(*_row(j, now))
+        console.print(table)
 
-    for r in running:
-        console.print('    ' + str(r.parent), highlight=False)
+    if stale:
+        console.print(f'[bold red] {len(stale)} Stale: [/bold red]')
+        table = Table(*columns)
+        for j in stale:
+            table.add_row(*_row(j, now))
+        console.print(table)
 
+        if prune:
+            for j in stale:
+                try:
+                    os.remove(j['file'])
+                except FileNotFoundError:
+                    pass
+            console.print(f'removed {len(stale)} stale entries', highlight=False)
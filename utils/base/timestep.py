@@ -0,0 +1,174 @@
+from typing import Dict, Optional, Tuple, Type
+import numpy as np
+import torusgrid as tg
+import pfc_util as pfc
+
+from rich import get_console
+
+from .timing import get_timings
+
+
+Hooks = tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]
+
+
+_DT_FACTORS: Dict[Type, Tuple[str, ...]] = {
+    pfc.pfc6.NonlocalConservedRK4: (),
+    pfc.pfc6.ConstantMuMinimizer: ('_kernel', '_exp_dt_kernel', '_mu_dt_half'),
+}
+"""
+Minimizers whose time step set_dt can change, with the (private) attributes
+holding the dt-dependent factors they precompute; RK4 minimizers read dt at
+every step
+"""
+
+
+def dt_adjustable(evolver: tg.dynamics.FieldEvolver[tg.RealField2D]) -> bool:
+    """
+    Whether set_dt can change the time step of evolver, i.e. it is one of the
+    minimizers of _DT_FACTORS and has the attributes listed there (which may
+    not be the case with another version of pfc_util)
+    """
+    for cls, attrs in _DT_FACTORS.items():
+        if isinstance(evolver, cls):
+            return all(hasattr(evolver, a) for a in attrs)
+    return False
+
+
+def set_dt(evolver: tg.dynamics.FieldEvolver[tg.RealField2D], dt: tg.FloatLike):
+    """
+    Change the time step of a pfc_util minimizer, including the dt-dependent
+    factors that ConstantMuMinimizer precomputes
+
+    :raises TypeError: if the time step of evolver cannot be changed (see
+        dt_adjustable)
+    """
+    if not dt_adjustable(evolver):
+        raise TypeError(f'Cannot change the time step of {type(evolver).__name__} '
+                        f'(unsupported minimizer or pfc_util version)')
+
+    evolver.dt = dt # type: ignore
+    evolver.data['dt'] = dt
+
+    if hasattr(evolver, '_exp_dt_kernel'):
+        evolver._exp_dt_kernel = np.exp(-dt*evolver._kernel) # type: ignore
+    if hasattr(evolver, '_mu_dt_half'):
+        evolver._mu_dt_half = dt * evolver.mu / 2 # type: ignore
+
+
+def energy(evolver: tg.dynamics.FieldEvolver[tg.RealField2D]) -> tg.FloatLike:
+    """
+    The quantity a pfc_util minimizer decreases: the grand potential at
+    constant mu, the free energy otherwise
+    """
+    mu = getattr(evolver, 'mu', None)
+    with get_timings().timer('energy'):
+        if mu is not None:
+            return evolver.fef.grand_potential(evolver.field, mu) # type: ignore
+        return evolver.fef.free_energy(evolver.field) # type: ignore
+
+
+class AdaptiveTimeStep(Hooks):
+    """
+    Every period steps (rounded to a multiple of the n_steps that hooks are
+    called after), compare the energy with the previous check: if it
+    decreased, keep the state and grow dt by grow (up to dt_max); if it
+    increased, roll the field (and momentum, age) back to the previous check
+    and shrink dt by shrink (down to dt_min, where increases are accepted).
+
+    The current dt is exposed as data['dt']; it is logged on every rollback
+    and whenever it has changed by a factor of 2 since last logged. If the
+    time step of the evolver cannot be changed (see dt_adjustable), a
+    warning is logged and dt is left as is.
+    """
+    def __init__(
+        self, *,
+        period: int,
+        grow: float, shrink: float,
+        dt_min: Optional[tg.FloatLike] = None,
+        dt_max: Optional[tg.FloatLike] = None,
+        label: str = ''
+    ):
+        self.period = period
+        self.grow = grow
+        self.shrink = shrink
+        self.dt_min = dt_min
+        self.dt_max = dt_max
+        self.label = label
+
+    def on_start(self, n_steps: int, n_epochs: Optional[int]):
+        e = self.evolver
+        self.enabled = dt_adjustable(e)
+        if not self.enabled:
+            self._log(f'adaptive dt disabled: cannot change the time step of {type(e).__name__}')
+            return
+        self._every = max(1, round(self.period / n_steps))
+        self.dt_min_ = e.dt if self.dt_min is None else self.dt_min # type: ignore
+        self.dt_max_ = np.inf if self.dt_max is None else self.dt_max
+        self.rollbacks = 0
+        self._logged_dt = e.dt # type: ignore
+        self._save(energy(e))
+
+    def _save(self, F: tg.FloatLike):
+        e = self.evolver
+        self._F = F
+        self._psi = e.field.psi.copy()
+        dgrid = getattr(e, 'dgrid', None)
+        self._dpsi = None if dgrid is None else dgrid.psi.copy()
+        self._age = getattr(e, 'age', None)
+
+    def _rollback(self):
+        e = self.evolver
+        e.field.psi[...] = self._psi
+        if self._dpsi is not None:
+            e.dgrid.psi[...] = self._dpsi # type: ignore
+        if self._age is not None:
+            e.set_age(self._age) # type: ignore
+
+    def _log(self, msg: str):
+        get_console().log(f'{self.label}{msg}', highlight=False)
+
+    def on_step(self, step: int):
+        if not self.enabled or (step + 1) % self._every != 0:
+            return
+
+        e = self.evolver
+        dt = e.dt # type: ignore
+        F = energy(e)
+
+        if F <= self._F or dt <= self.dt_min_:
+            self._save(F)
+            new_dt = min(dt * self.grow, self.dt_max_)
+        else:
+            self._rollback()
+            self.rollbacks += 1
+            new_dt = max(dt * self.shrink, self.dt_min_)
+            self._log(f'energy increased at dt={dt:.3e}, rolled back to '
+                      f'age={self._age}, dt={new_dt:.3e}')
+            self._logged_dt = new_dt
+
+        new_dt = type(dt)(new_dt)
+        if new_dt != dt:
+            set_dt(e, new_dt)
+
+        ratio = new_dt / self._logged_dt
+        if ratio >= 2 or ratio <= 0.5:
+            self._log(f'age={getattr(e, "age", None)} dt={new_dt:.3e}')
+            self._logged_dt = new_dt
+
+    def on_end(self):
+        if not self.enabled:
+            return
+        self._log(f'final dt={self.evolver.dt:.3e}, {self.rollbacks} rollbacks') # type: ignore
+
+
+def with_adaptive_dt(hooks: Hooks, cfg, *, label: str = '') -> Hooks:
+    """
+    hooks, plus an AdaptiveTimeStep if cfg (a SpecifiesAdaptiveTimeStep)
+    enables it
+    """
+    a = cfg.adaptive_dt
+    if a is None:
+        return hooks
+    return hooks + AdaptiveTimeStep(
+            period=a.period, grow=a.grow, shrink=a.shrink,
+            dt_min=a.dt_min, dt_max=a.dt_max, label=label)
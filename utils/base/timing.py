@@ -0,0 +1,231 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from pathlib import Path
+import json
+import os
+import resource
+import threading
+import time
+
+import torusgrid as tg
+
+
+Hooks = tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]
+
+
+SAMPLE_INTERVAL = 1.
+"""
+Seconds between two RSS samples of a section
+"""
+
+
+def current_rss() -> int:
+    """
+    Resident set size of this process in bytes (peak RSS where /proc is not
+    available)
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def peak_rss(who: int = resource.RUSAGE_SELF) -> int:
+    """
+    Peak resident set size in bytes of this process (or of its terminated
+    children, with resource.RUSAGE_CHILDREN)
+    """
+    return resource.getrusage(who).ru_maxrss * 1024
+
+
+class Timings:
+    """
+    Named timers and counters of one stage run, plus its sections (e.g. the
+    steps of gen_interface, the interfaces of run_interface) with their wall
+    time and the peak RSS sampled (every SAMPLE_INTERVAL seconds) during
+    each.
+
+    Timers may overlap (e.g. field.save on the writer thread while evolving)
+    and are safe to use from any thread. Worker processes keep their own
+    (unsaved) timings; only their peak RSS is reflected in peak_rss_children.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self.reset()
+
+    def reset(self, stage: str = ''):
+        with self._lock:
+            self.stage = stage
+            self.timers: Dict[str, List[float]] = {}
+            self.counters: Dict[str, int] = {}
+            self.sections: List[Dict[str, Any]] = []
+            self._t0 = time.perf_counter()
+            self._started = time.time()
+            self._section: Optional[Tuple[str, float]] = None
+            self._section_peak = current_rss()
+
+    def add(self, name: str, seconds: float, count: int = 1):
+        """
+        Add seconds (spent on count events) to the timer name
+        """
+        with self._lock:
+            t = self.timers.setdefault(name, [0., 0])
+            t[0] += seconds
+            t[1] += count
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def sample(self):
+        """
+        Fold the current RSS into the peak of the current section
+        """
+        rss = current_rss()
+        with self._lock:
+            self._section_peak = max(self._section_peak, rss)
+
+    def _sample_forever(self, interval: float):
+        while True:
+            time.sleep(interval)
+            self.sample()
+
+    def begin(self, name: str):
+        """
+        End the current section, if any, and start a new one
+        """
+        self.end()
+        if self._sampler is None:
+            self._sampler = threading.Thread(
+                    target=self._sample_forever, args=(SAMPLE_INTERVAL,),
+                    name='rss-sampler', daemon=True)
+            self._sampler.start()
+        with self._lock:
+            self._section = (name, time.perf_counter())
+            self._section_peak = current_rss()
+
+    def end(self):
+        """
+        End the current section, if any
+        """
+        self.sample()
+        with self._lock:
+            if self._section is None:
+                return
+            name, t0 = self._section
+            self.sections.append(dict(
+                name=name, wall=time.perf_counter() - t0,
+                peak_rss=self._section_peak))
+            self._section = None
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def to_dict(self) -> Dict[str, Any]:
+        self.end()
+        with self._lock:
+            return dict(
+                started=self._started,
+                wall=time.perf_counter() - self._t0,
+                peak_rss=peak_rss(),
+                peak_rss_children=peak_rss(resource.RUSAGE_CHILDREN),
+                timers={k: dict(total=t, count=n, mean=t/n if n else None)
+                        for k, (t, n) in sorted(self.timers.items())},
+                counters=dict(sorted(self.counters.items())),
+                sections=list(self.sections))
+
+    def save(self, dir: str, file: str):
+        """
+        Write to file under dir, keyed by stage so that stages sharing a
+        directory (gen_interface, calc_gamma, calc_width) keep each other's
+        """
+        path = Path(dir) / file
+        data = {}
+        if path.exists():
+            with open(path, 'r') as f:
+                data = json.load(f)
+        data[self.stage] = self.to_dict()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = str(path) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+
+
+_timings = Timings()
+
+
+def get_timings() -> Timings:
+    """
+    The timings of the stage running in this process
+    """
+    return _timings
+
+
+class StepClock:
+    """
+    Splits the time of an evolver run into evolve.steps (time between hook
+    calls, counted per step) and evolve.hooks (time spent in the wrapped
+    hooks), see wrap(). The time evolution ended is kept in ended.
+    """
+    def __init__(self, timings: Optional[Timings] = None):
+        self.timings = timings or get_timings()
+        self.ended: Optional[float] = None
+
+    def wrap(self, hooks: Hooks) -> Hooks:
+        return _ClockStart(self) + hooks + _ClockEnd(self)
+
+
+class _ClockStart(Hooks):
+    def __init__(self, clock: StepClock):
+        self.clock = clock
+
+    def on_step(self, step: int):
+        c = self.clock
+        t = time.perf_counter()
+        c.timings.add('evolve.steps', t - c.t, count=c.n_steps)
+        c.t = t
+
+
+class _ClockEnd(Hooks):
+    def __init__(self, clock: StepClock):
+        self.clock = clock
+
+    def on_start(self, n_steps: int, n_epochs: Optional[int]):
+        # called after every wrapped hook's on_start
+        self.clock.n_steps = n_steps
+        self.clock.t = time.perf_counter()
+
+    def on_step(self, step: int):
+        c = self.clock
+        t = time.perf_counter()
+        c.timings.add('evolve.hooks', t - c.t)
+        c.t = t
+
+    def on_end(self):
+        # called before every wrapped hook's on_end
+        self.clock.ended = time.perf_counter()
+
+
+def timed_hooks(hooks: Hooks) -> Hooks:
+    """
+    hooks, with the time spent in evolution steps and in hooks recorded
+    """
+    return StepClock().wrap(hooks)
@@ -0,0 +1,69 @@
+from typing import Optional
+
+
+_BYTE_UNITS = {
+    '': 1,
+    'K': 1024,
+    'M': 1024**2,
+    'G': 1024**3,
+    'T': 1024**4,
+}
+
+
+def parse_bytes(s: Optional[str]) -> Optional[int]:
+    """
+    Parse a human readable byte count, e.g. '512M', '8G', '1.5T'.
+
+    None, '', 'none' and 'inf' are interpreted as no limit (None).
+    """
+    if s is None:
+        return None
+
+    s = str(s).strip().upper()
+    if s in ['', 'NONE', 'INF']:
+        return None
+
+    s = s.removesuffix('IB').removesuffix('B')
+
+    unit = s[-1] if s[-1] in _BYTE_UNITS.keys() else ''
+    num = s[:-1] if unit else s
+
+    return int(float(num) * _BYTE_UNITS[unit])
+
+
+_TIME_UNITS = {
+    's': 1,
+    'm': 60,
+    'h': 3600,
+    'd': 86400,
+}
+
+
+def parse_duration(s: Optional[str]) -> Optional[float]:
+    """
+    Parse a duration in seconds, e.g. '3600', '90m', '12h', '1.5d' or
+    '[D-]HH:MM:SS' as used by batch schedulers.
+
+    None, '', 'none' and 'inf' are interpreted as no limit (None).
+    """
+    if s is None:
+        return None
+
+    s = str(s).strip().lower()
+    if s in ['', 'none', 'inf']:
+        return None
+
+    if ':' in s:
+        days = 0
+        if '-' in s:
+            d, s = s.split('-', 1)
+            days = int(d)
+        seconds = 0.
+        for part in s.split(':'):
+            seconds = seconds * 60 + float(part)
+        return days * _TIME_UNITS['d'] + seconds
+
+    unit = s[-1] if s[-1] in _TIME_UNITS.keys() else 's'
+    num = s[:-1] if s[-1] in _TIME_UNITS.keys() else s
+
+    return float(num) * _TIME_UNITS[unit]
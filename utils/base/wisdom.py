@@ -0,0 +1,108 @@
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+import hashlib
+import platform
+import re
+
+import numpy as np
+import torusgrid as tg
+
+from .fftplan import FFTPlanCache, PlanKey
+
+
+def host_cpu_id() -> str:
+    """
+    Identifier of the host CPU model, e.g. x86_64-intel-r-xeon-r-processor-1a2b3c4d.
+    FFTW wisdom measured on one CPU model is not meaningful on another.
+    """
+    model = platform.processor()
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    model = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+
+    slug = re.sub(r'[^a-z0-9]+', '-', model.lower()).strip('-')[:40]
+    digest = hashlib.sha1(model.encode()).hexdigest()[:8]
+    return f'{platform.machine()}-{slug}-{digest}'
+
+
+class WisdomStore:
+    """
+    FFTW wisdom saved under root, one directory per host CPU model and one
+    file per (precision, threads):
+
+        root/[cpu id]/[precision]_t[threads].pkl
+
+    Each file holds FFTW wisdom and the plan keys (see FFTPlanCache) it was
+    saved for. Saving merges with what is already on disk, so concurrent runs
+    only ever add wisdom.
+    """
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.dir = self.root / host_cpu_id()
+
+    @staticmethod
+    def _precision_name(dtype: str) -> str:
+        return tg.FloatingPointPrecision.from_dtype(np.dtype(dtype)).name.lower()
+
+    def path(self, precision: tg.PrecisionLike, threads: int) -> Path:
+        name = tg.FloatingPointPrecision.cast(precision).name.lower()
+        return self.dir / f'{name}_t{threads}.pkl'
+
+    def files(self, precision: Optional[tg.PrecisionLike] = None) -> List[Path]:
+        if not self.dir.exists():
+            return []
+        pattern = '*.pkl'
+        if precision is not None:
+            pattern = f'{tg.FloatingPointPrecision.cast(precision).name.lower()}_t*.pkl'
+        return sorted(self.dir.glob(pattern))
+
+    def load(self, cache: FFTPlanCache, precision: Optional[tg.PrecisionLike] = None):
+        """
+        Import the wisdom of this host (of the given precision, if any) into
+        the process and cache
+        """
+        for p in self.files(precision):
+            cache.load(str(p))
+
+    def save(self, cache: FFTPlanCache, keys: Iterable[PlanKey]):
+        """
+        Merge the process wisdom into the files of the given keys' (precision,
+        threads)
+        """
+        groups: Dict[Tuple[str, int], List[PlanKey]] = {}
+        for key in keys:
+            _, dtype, threads, _ = key
+            groups.setdefault((self._precision_name(dtype), threads), []).append(key)
+
+        for (precision, threads), group in groups.items():
+            cache.save_to(str(self.path(precision, threads)), group)
+
+
+def get_store(root: Optional[str]) -> Optional[WisdomStore]:
+    """
+    WisdomStore at root, or None if root is None or empty (store disabled)
+    """
+    if not root:
+        return None
+    return WisdomStore(root)
+
+
+def preplan(
+    store: Optional[WisdomStore],
+    shapes: Iterable[Tuple[Tuple[int, ...], tg.PrecisionLike, int]]
+) -> FFTPlanCache:
+    """
+    Plan minimizer FFTs for each (shape, precision, threads) and save the
+    result to store
+    """
+    cache = FFTPlanCache(store)
+    for shape, precision, threads in shapes:
+        cache.plan_minimizer(shape, precision, threads)
+    cache.save()
+    return cache
@@ -0,0 +1,2 @@
+from .main import run
+from .config import parse_bench
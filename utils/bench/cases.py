@@ -0,0 +1,201 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import tempfile
+import time
+import numpy as np
+import torusgrid as tg
+import pfc_util as pfc
+
+from .config import BenchConfig
+
+from .. import base
+from ..calc._widthlib import calculate_widths
+from ..calc._amplitudes import HexagonalAmplitudeEngine
+from ..calc.gamma import field_values
+
+
+Result = Dict[str, Any]
+"""
+One measurement: case, variant, shape, precision, threads, metric, value
+and whether higher or lower values are better
+"""
+
+STEPS_PER_CALL = 10
+"""
+Minimizer steps per timed call
+"""
+
+
+def result(
+    case: str, field: tg.RealField2D, threads: Optional[int],
+    metric: str, value: float, *, better: str = 'higher', variant: str = '',
+    **extra
+) -> Result:
+    return dict(case=case, variant=variant, shape=[int(n) for n in field.shape],
+                precision=field.precision.name, threads=threads,
+                metric=metric, value=float(value), better=better, **extra)
+
+
+def measure(fn: Callable[[], Any], *, min_time: float, repeat: int) -> float:
+    """
+    Seconds per call of fn: after one warm-up call, fn is called until
+    min_time has passed, repeat times, and the best average is returned
+    """
+    fn()
+    best = np.inf
+    for _ in range(repeat):
+        n = 0
+        t0 = time.perf_counter()
+        while True:
+            fn()
+            n += 1
+            elapsed = time.perf_counter() - t0
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / n)
+    return best
+
+
+def synthetic_unit_cell(
+    shape: Tuple[int, int], precision: tg.PrecisionLike, *,
+    eps: str, psibar: str, liquid: bool = False
+) -> tg.RealField2D:
+    """
+    One-mode approximation of a hexagonal PFC unit cell (4pi x 4pi/sqrt3),
+    or a constant liquid of the same size and mean density
+    """
+    dtype = tg.get_real_dtype(precision)
+    field = tg.RealField2D(4*tg.pi(precision), 4*tg.pi(precision)/np.sqrt(dtype(3)),
+                           *shape, precision=precision)
+
+    p = dtype(psibar)
+    field.psi[...] = p
+    if not liquid:
+        disc = max(15*dtype(eps) - 36*p**2, dtype(0))
+        amplitude = dtype(4)/5 * (abs(p) + np.sqrt(disc)/3)
+        x, y = field.x, field.y
+        s3 = np.sqrt(dtype(3))
+        field.psi[...] += amplitude * (np.cos(x) + np.cos(-x/2 + s3*y/2) + np.cos(-x/2 - s3*y/2))
+    return field
+
+
+class Fields:
+    """
+    Synthetic fields of one precision: unit cells, and the long solid,
+    liquid and interface of each extension of the first unit cell
+    """
+    def __init__(self, C: BenchConfig, precision: tg.FloatingPointPrecision):
+        self.C = C
+        self.precision = precision
+
+    def to_float(self, x: str) -> tg.FloatLike:
+        return tg.get_real_dtype(self.precision)(x)
+
+    def unit_cell(self, shape: Tuple[int, int], *, liquid: bool = False) -> tg.RealField2D:
+        return synthetic_unit_cell(shape, self.precision, eps=self.C.eps,
+                                   psibar=self.C.psibar, liquid=liquid)
+
+    def long(self, extension: Tuple[int, int]) -> Tuple[tg.RealField2D, tg.RealField2D]:
+        shape = self.C.unit_cells[0]
+        return (tg.extend(self.unit_cell(shape), extension),
+                tg.extend(self.unit_cell(shape, liquid=True), extension))
+
+    def interface(self, extension: Tuple[int, int]) -> tg.RealField2D:
+        sol, liq = self.long(extension)
+        return tg.blend(sol, liq, axis=0, interface_width=self.to_float(self.C.width))
+
+
+def bench_uc(C: BenchConfig, fields: Fields, plans: base.FFTPlanCache, threads: int) -> List[Result]:
+    results = []
+    f = fields.to_float
+    for shape in C.unit_cells:
+        field = fields.unit_cell(shape)
+        plans.plan_minimizer(field.shape, field.precision, threads)
+        m = pfc.pfc6.ConstantMuMinimizer(field, f(C.dt), f(C.eps), f(C.alpha), f(C.beta), f(C.mu))
+        m.initialize_fft(threads=threads, destroy_input=True)
+
+        t = measure(lambda: m.run_steps(STEPS_PER_CALL), min_time=C.min_time, repeat=C.repeat)
+        results.append(result('uc', field, threads, 'steps_per_s', STEPS_PER_CALL / t))
+    return results
+
+
+def bench_rk4(C: BenchConfig, fields: Fields, plans: base.FFTPlanCache, threads: int) -> List[Result]:
+    results = []
+    f = fields.to_float
+    for extension in C.extensions:
+        field, _ = fields.long(extension)
+        plans.plan_minimizer(field.shape, field.precision, threads)
+        m = pfc.pfc6.NonlocalConservedRK4(
+                field, f(C.dt), f(C.eps), f(C.alpha), f(C.beta),
+                inertia=f(C.inertia), k_regularizer=f(C.k_regularizer))
+        m.initialize_fft(threads=threads, destroy_input=True)
+
+        t = measure(lambda: m.run_steps(STEPS_PER_CALL), min_time=C.min_time, repeat=C.repeat)
+        results.append(result('rk4', field, threads, 'steps_per_s', STEPS_PER_CALL / t,
+                              nbytes=field.psi.nbytes))
+    return results
+
+
+def bench_blend(C: BenchConfig, fields: Fields, plans: base.FFTPlanCache, threads: int) -> List[Result]:
+    results = []
+    f = fields.to_float
+    fef = pfc.pfc6.FreeEnergyFunctional(f(C.eps), f(C.alpha), f(C.beta))
+    width = f(C.width)
+    for extension in C.extensions:
+        sol, liq = fields.long(extension)
+
+        def blend():
+            ifc = tg.blend(sol, liq, axis=0, interface_width=width)
+            fef.free_energy(ifc)
+
+        t = measure(blend, min_time=C.min_time, repeat=C.repeat)
+        results.append(result('blend', sol, None, 'seconds', t, better='lower'))
+    return results
+
+
+def bench_widths(C: BenchConfig, fields: Fields, plans: base.FFTPlanCache, threads: int) -> List[Result]:
+    results = []
+    engine = HexagonalAmplitudeEngine(threads=threads)
+    for extension in C.extensions:
+        ifc = fields.interface(extension)
+        t = measure(lambda: calculate_widths(ifc, 0., engine=engine), min_time=C.min_time, repeat=C.repeat)
+        results.append(result('widths', ifc, threads, 'seconds', t, better='lower'))
+    return results
+
+
+def bench_gamma(C: BenchConfig, fields: Fields, plans: base.FFTPlanCache, threads: int) -> List[Result]:
+    results = []
+    f = fields.to_float
+    fef = pfc.pfc6.FreeEnergyFunctional(f(C.eps), f(C.alpha), f(C.beta))
+    for extension in C.extensions:
+        ifc = fields.interface(extension)
+        t = measure(lambda: field_values(ifc, fef, f(C.mu)), min_time=C.min_time, repeat=C.repeat)
+        results.append(result('gamma', ifc, None, 'seconds', t, better='lower'))
+    return results
+
+
+def bench_io(C: BenchConfig, fields: Fields, plans: base.FFTPlanCache, threads: int) -> List[Result]:
+    results = []
+    with tempfile.TemporaryDirectory(dir=C.io_dir) as tmp:
+        for extension in C.extensions:
+            ifc = fields.interface(extension)
+            mb = ifc.psi.nbytes / 1024**2
+            for fmt in ['raw', 'npz']:
+                path = f'{tmp}/bench.field'
+                t_save = measure(lambda: base.save_field(ifc, path, fmt), min_time=C.min_time, repeat=C.repeat)
+                t_load = measure(lambda: base.load_field(path, mmap=False), min_time=C.min_time, repeat=C.repeat)
+                results.append(result('io', ifc, None, 'save_MB_per_s', mb / t_save, variant=fmt))
+                results.append(result('io', ifc, None, 'load_MB_per_s', mb / t_load, variant=fmt))
+    return results
+
+
+BENCHMARKS: Dict[str, Callable[[BenchConfig, Fields, base.FFTPlanCache, int], List[Result]]] = dict(
+    uc=bench_uc, rk4=bench_rk4, blend=bench_blend,
+    widths=bench_widths, gamma=bench_gamma, io=bench_io)
+"""
+Benchmark of each case
+"""
+
+FFT_CASES = ['uc', 'rk4', 'widths']
+"""
+Cases run for every thread count; the others are run once per precision
+"""
@@ -0,0 +1,74 @@
+from typing import List, Optional, Tuple
+from pathlib import Path
+import yaml
+import torusgrid as tg
+
+
+CASES = ['uc', 'rk4', 'blend', 'widths', 'gamma', 'io']
+"""
+Benchmark cases: constant mu unit cell minimization, NonlocalConservedRK4
+on extended fields, tg.blend + free_energy, calculate_widths, gamma
+evaluation and field save/load
+"""
+
+
+def _as_list(x) -> list:
+    return x if isinstance(x, list) else [x]
+
+
+class BenchConfig:
+    """
+    A benchmark ladder: every case is run on synthetic fields for every
+    precision and thread count, on unit cells of each shape in unit_cells
+    (uc) or on the first unit cell extended by each factor in extensions
+    (every other case).
+
+    min_time, repeat: every measurement is repeated until it takes at least
+    min_time seconds, repeat times, and the best is kept
+
+    tolerance: relative slowdown against the baseline reported as a
+    regression
+    """
+    def __init__(self, config: dict, name: str):
+        self.name = str(config.get('name', name))
+
+        self.eps = str(config.get('eps', '0.1'))
+        self.alpha = str(config.get('alpha', '0.0'))
+        self.beta = str(config.get('beta', '1.0'))
+        self.mu = str(config.get('mu', '0.19'))
+        self.psibar = str(config.get('psibar', '0.19'))
+
+        self.dt = str(config.get('dt', '1.e-3'))
+        self.inertia = str(config.get('inertia', '200'))
+        self.k_regularizer = str(config.get('k_regularizer', '0.1'))
+        self.width = str(config.get('width', '10'))
+
+        self.precisions: List[tg.FloatingPointPrecision] = [
+                tg.FloatingPointPrecision.cast(p) for p in _as_list(config.get('precisions', ['single', 'double']))]
+        self.fft_threads: List[int] = [int(t) for t in _as_list(config.get('fft_threads', 1))]
+
+        self.unit_cells: List[Tuple[int, int]] = [
+                (int(nx), int(ny)) for nx, ny in config.get('unit_cells', [[32, 16]])]
+        self.extensions: List[Tuple[int, int]] = [
+                (int(mx), int(my)) for mx, my in config.get('extensions', [[16, 1], [64, 1]])]
+
+        self.cases: List[str] = [str(c) for c in _as_list(config.get('cases', CASES))]
+        for case in self.cases:
+            if case not in CASES:
+                raise ValueError(f'Unknown benchmark case {case}, expected one of {CASES}')
+
+        self.min_time = float(config.get('min_time', 1))
+        self.repeat = int(config.get('repeat', 3))
+        self.tolerance = float(config.get('tolerance', 0.1))
+
+        # where save/load throughput is measured (default: the system's
+        # temporary directory)
+        self.io_dir: Optional[str] = config.get('io_dir', None)
+
+        self.wisdom_store: str = config.get('wisdom_store', 'data/wisdom')
+
+
+def parse_bench(path: str) -> BenchConfig:
+    with open(path, 'r') as f:
+        config = yaml.safe_load(f)
+    return BenchConfig(config, Path(path).stem)
@@ -0,0 +1,169 @@
+from typing import Dict, List, Optional, Tuple
+from importlib import metadata
+from pathlib import Path
+import json
+import os
+import time
+
+import rich
+
+from .config import BenchConfig, parse_bench
+from .cases import BENCHMARKS, FFT_CASES, Fields, Result
+
+from .. import base
+from .. import global_cfg as G
+
+
+def result_key(r: Result) -> Tuple:
+    return (r['case'], r['variant'], tuple(r['shape']), r['precision'], r['threads'], r['metric'])
+
+
+def describe(r: Result) -> str:
+    variant = f'.{r["variant"]}' if r['variant'] else ''
+    threads = '' if r['threads'] is None else f' t{r["threads"]}'
+    return f'{r["case"]}{variant} {r["shape"][0]}x{r["shape"][1]} {r["precision"].lower()}{threads} {r["metric"]}'
+
+
+def default_path(C: BenchConfig, suffix: str) -> str:
+    """
+    Results (suffix: timestamp) or baseline (suffix: 'baseline') of C on this
+    host, under DATA_DIR/BENCH_DIR/[cpu id]/
+    """
+    return f'{G.DATA_DIR}/{G.BENCH_DIR}/{base.host_cpu_id()}/{C.name}.{suffix}.json'
+
+
+def _versions() -> Dict[str, str]:
+    versions = {}
+    for pkg in ['numpy', 'pyfftw', 'torusgrid', 'pfc-util']:
+        try:
+            versions[pkg] = metadata.version(pkg)
+        except metadata.PackageNotFoundError:
+            versions[pkg] = 'unknown'
+    return versions
+
+
+def compare(
+    results: List[Result], baseline: List[Result], tolerance: float
+) -> Tuple[List[Tuple[Result, float]], List[Tuple[Result, float]]]:
+    """
+    Relative slowdown of every result present in the baseline, e.g. 0.2 for
+    20% fewer steps per second or 25% more seconds; return the regressions
+    (slowdown > tolerance) and the others
+    """
+    base_values = {result_key(r): r['value'] for r in baseline}
+    regressions, others = [], []
+    for r in results:
+        b = base_values.get(result_key(r))
+        if b is None:
+            continue
+        if r['better'] == 'higher':
+            slowdown = 1 - r['value'] / b
+        else:
+            slowdown = 1 - b / r['value']
+        (regressions if slowdown > tolerance else others).append((r, slowdown))
+    return regressions, others
+
+
+def _write(path: str, data: dict):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def run(
+    config_path: str, *,
+    cases: Optional[List[str]] = None,
+    output: Optional[str] = None,
+    baseline: Optional[str] = None,
+    save_baseline: bool = False
+) -> int:
+    """
+    Run the benchmarks of the config, write the results and compare them
+    with the baseline. Return the number of regressions and failed cases.
+
+    The results file is rewritten after every case, so an interrupted run
+    keeps what it measured. A case that raises is recorded under errors
+    (case, precision, threads and the error) and the others go on.
+    """
+    console = rich.get_console()
+    C = parse_bench(config_path)
+    if cases is not None:
+        C.cases = [c for c in C.cases if c in cases]
+
+    console.log(f'Benchmark {C.name} on {base.host_cpu_id()} ({os.cpu_count()} CPUs): '
+                f'cases={C.cases} precisions={[p.name.lower() for p in C.precisions]} '
+                f'threads={C.fft_threads}', highlight=False)
+
+    started = time.time()
+    results: List[Result] = []
+    errors: List[Dict] = []
+
+    output = output or default_path(C, time.strftime('%Y%m%d-%H%M%S', time.localtime(started)))
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+
+    data = dict(
+        name=C.name, host=base.host_cpu_id(), cpus=os.cpu_count(),
+        started=started, wall=0.,
+        versions=_versions(),
+        results=results, errors=errors)
+
+    with base.FFTPlanCache(base.get_store(C.wisdom_store)) as plans:
+        for precision in C.precisions:
+            fields = Fields(C, precision)
+            for case in C.cases:
+                threads_list = C.fft_threads if case in FFT_CASES else [C.fft_threads[0]]
+                for threads in threads_list:
+                    try:
+                        case_results = BENCHMARKS[case](C, fields, plans, threads)
+                    except Exception as e:
+                        error = f'{type(e).__name__}: {e}'
+                        console.log(f'[bold red]{case} {precision.name.lower()} t{threads} failed: '
+                                    f'{error}[/bold red]', highlight=False)
+                        errors.append(dict(case=case, precision=precision.name, threads=threads,
+                                           error=error))
+                        case_results = []
+
+                    for r in case_results:
+                        console.log(f'{describe(r)} = {r["value"]:.6g}', highlight=False)
+                    results.extend(case_results)
+
+                    data['wall'] = time.time() - started
+                    _write(output, data)
+
+    console.log(f'results saved to {output}', highlight=False)
+
+    baseline = baseline or default_path(C, 'baseline')
+
+    if errors:
+        console.log(f'[bold red]{len(errors)} failed cases[/bold red]', highlight=False)
+
+    if save_baseline:
+        with open(baseline, 'w') as f:
+            json.dump(data, f, indent=2)
+        console.log(f'baseline saved to {baseline}', highlight=False)
+        return len(errors)
+
+    if not Path(baseline).exists():
+        console.log(f'No baseline at {baseline}, pass --save-baseline to create it', highlight=False)
+        return len(errors)
+
+    with open(baseline, 'r') as f:
+        base_data = json.load(f)
+
+    if base_data.get('host') != data['host']:
+        console.log(f'[bold orange1]Baseline was measured on {base_data.get("host")}[/bold orange1]',
+                    highlight=False)
+
+    regressions, others = compare(results, base_data['results'], C.tolerance)
+
+    console.rule(title=f'Against {baseline}')
+    for r, slowdown in others:
+        change = 'faster' if slowdown < 0 else 'slower'
+        console.log(f'{describe(r)}: {abs(slowdown):.1%} {change}', highlight=False)
+    for r, slowdown in regressions:
+        console.log(f'[bold red]{describe(r)}: {slowdown:.1%} slower[/bold red]', highlight=False)
+
+    console.log(f'{len(regressions)} regressions (tolerance {C.tolerance:.0%}) '
+                f'out of {len(regressions) + len(others)} compared results', highlight=False)
+    return len(regressions) + len(errors)
@@ -1,2 +1,3 @@
 from . import gamma
 from . import width
+from . import tree
@@ -0,0 +1,141 @@
+from collections import OrderedDict
+from typing import Literal, Optional, Tuple
+
+import numpy as np
+import scipy.fft
+
+import torusgrid as tg
+
+try:
+    import pyfftw
+    import pyfftw.builders
+except ImportError:  # pragma: no cover
+    pyfftw = None
+
+
+class HexagonalAmplitudeEngine:
+    '''
+    Compute the amplitudes of the three principal RLVs of a hexagonal lattice
+    by filtering psi with plane waves windowed by a unit cell.
+
+    For each RLV k, the amplitude is
+
+        A = exp(-ik.r) * [(exp(ik.r) * uc) (*) psi] / sum(uc)
+
+    where (*) is the circular convolution. Since psi and uc are real, the
+    convolution is split into the real and imaginary parts of the filter so
+    that every transform is a real-input FFT:
+
+        - psi is transformed once
+        - the 6 real filters (cos/sin for each k) are transformed in one
+          batched rfft2, multiplied by psi_k and transformed back in one
+          batched irfft2
+        - exp(ik.r) is evaluated once per RLV
+
+    FFTW plans are built once per (shape, dtype, output shape) and reused by
+    later calls;
+    the max_plans most recently used plans (and their buffers) are kept. If
+    pyfftw is unavailable, scipy.fft is used with `threads` workers.
+    '''
+    def __init__(
+        self, *,
+        threads: int = 1,
+        precision: Optional[Literal['single', 'double']] = None,
+        backend: Literal['pyfftw', 'scipy'] = 'pyfftw',
+        planner_effort: str = 'FFTW_ESTIMATE',
+        max_plans: int = 6
+    ):
+        '''
+        :param threads: number of FFT threads
+        :param precision: floating point precision of the transforms; None
+                          keeps the precision of the field
+        :param backend: pyfftw (plan-cached) or scipy
+        :param planner_effort: FFTW planner effort used when building plans
+        :param max_plans: number of cached plans, each plan holds its own
+                          input and output buffers
+        '''
+        self.threads = threads
+        self.precision = precision
+        self.backend = backend if pyfftw is not None else 'scipy'
+        self.planner_effort = planner_effort
+        self.max_plans = max_plans
+
+        self._plans: OrderedDict[Tuple[str, Tuple[int, ...], str, Tuple[int, int]], object] = OrderedDict()
+
+    def _dtype(self, field: tg.RealField2D):
+        if self.precision is None:
+            return field.psi.dtype
+        return np.dtype(tg.get_real_dtype(self.precision))
+
+    def _plan(self, kind: Literal['rfft2', 'irfft2'], template: np.ndarray, s: Tuple[int, int]):
+        # irfft2 to widths n and n-1 (n odd) share the input shape, s tells
+        # them apart
+        key = (kind, template.shape, template.dtype.str, tuple(s))
+        if key in self._plans.keys():
+            self._plans.move_to_end(key)
+            return self._plans[key]
+
+        builder = getattr(pyfftw.builders, kind)
+        self._plans[key] = builder(
+                pyfftw.empty_aligned(template.shape, dtype=template.dtype),
+                s=s, axes=(-2, -1),
+                threads=self.threads,
+                planner_effort=self.planner_effort)
+
+        while len(self._plans) > self.max_plans:
+            self._plans.popitem(last=False)
+
+        return self._plans[key]
+
+    def rfft2(self, a: np.ndarray) -> np.ndarray:
+        s = a.shape[-2:]
+        if self.backend == 'scipy':
+            return scipy.fft.rfft2(a, workers=self.threads)
+        # the output array of a plan is its own buffer, overwritten by the
+        # next call
+        return self._plan('rfft2', a, s)(a).copy() # type: ignore
+
+    def irfft2(self, a: np.ndarray, s: Tuple[int, int]) -> np.ndarray:
+        if self.backend == 'scipy':
+            return scipy.fft.irfft2(a, s=s, workers=self.threads)
+        return self._plan('irfft2', a, s)(a).copy() # type: ignore
+
+    def __call__(
+        self,
+        field: tg.RealField2D,
+        unit_cell: np.ndarray,
+        theta: tg.FloatLike, *,
+        uc_stretch_factor: tg.FloatLike = 1.
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        Return: 3 complex 2D ndarrays
+        '''
+        dtype = self._dtype(field)
+        s = field.shape
+
+        num_points_uc = np.sum(unit_cell)
+
+        k0 = 1 / uc_stretch_factor
+        angles = [-theta, -theta+2*np.pi/3, -theta+4*np.pi/3]
+
+        # plane waves exp(ik.r), evaluated once per RLV
+        cdtype = np.result_type(dtype, np.complex64)
+        phases = [np.exp(1j * (k0*np.cos(a)*field.x + k0*np.sin(a)*field.y)).astype(cdtype, copy=False)
+                  for a in angles]
+
+        filters = np.empty((6, *s), dtype=dtype)
+        for i, ph in enumerate(phases):
+            filters[2*i] = ph.real * unit_cell
+            filters[2*i+1] = ph.imag * unit_cell
+
+        psi_k = self.rfft2(np.asarray(field.psi, dtype=dtype))
+        conv_k = self.rfft2(filters) * psi_k
+        del filters
+
+        conv = self.irfft2(conv_k, s)
+        del conv_k
+
+        return tuple( # type: ignore
+            np.conj(ph) * (conv[2*i] + 1j*conv[2*i+1]) / num_points_uc
+            for i, ph in enumerate(phases)
+        )
@@ -1,17 +1,37 @@
-from typing import Tuple
+from collections import OrderedDict
+from typing import Optional, Tuple
 
 
 import numpy as np
-from scipy.fft import fft2, ifft2
 from scipy.optimize import curve_fit
 
 import torusgrid as tg
 
+from ._amplitudes import HexagonalAmplitudeEngine
+
+
+_default_engine = HexagonalAmplitudeEngine()
+
 
 def _sigmoid(x, b):
     return .5 * (1. + np.tanh((b*x)/2))
 
 
+_UNIT_CELL_MIRRORS = [(0, 1), (0, 0), (0, -1), (0, -2), (-1, 1), (-1, 0), (-1, -1), (-1, -2)]
+
+_UNIT_CELL_CACHE_SIZE = 8
+_unit_cell_cache: OrderedDict[tuple, np.ndarray] = OrderedDict()
+
+
+def _index_range(lo, hi, d, n: int) -> Tuple[int, int]:
+    '''
+    Indices i such that lo <= i*d <= hi, clipped to [0, n)
+    '''
+    a = max(int(np.floor(lo / d)), 0)
+    b = min(int(np.ceil(hi / d)) + 1, n)
+    return a, max(a, b)
+
+
 def get_rotated_unit_cell(
         field: tg.RealField2D, theta: tg.FloatLike, *, 
         uc_stretch_factor: tg.FloatLike= 1.
@@ -19,23 +39,60 @@ def get_rotated_unit_cell(
     '''
         Return a field with the same dimensions as input, but with one region
         corresponding to a unit cell set to 1, while the remaining area is 0.
+
+        The mask is accumulated one mirror image at a time, and each image is
+        only evaluated on the window where its sigmoids are numerically
+        non-zero. Results are cached by (shape, lx, ly, theta, uc_factor) and
+        returned read-only.
     '''
-    mirror_matrix = [(0, 1), (0, 0), (0, -1), (0, -2), (-1, 1), (-1, 0), (-1, -1), (-1, -2)]
+    key = (field.shape, field.lx, field.ly, theta, uc_stretch_factor)
+    if key in _unit_cell_cache.keys():
+        _unit_cell_cache.move_to_end(key)
+        return _unit_cell_cache[key]
 
-    X_cloned = np.array([field.x + p[0]*field.lx for p in mirror_matrix])
-    Y_cloned = np.array([field.y + p[1]*field.ly for p in mirror_matrix])
+    b = 1/field.dx * 20
 
-    # rotation
-    X0 = np.cos(theta)*X_cloned - np.sin(theta)*Y_cloned
-    Y0 = np.sin(theta)*X_cloned + np.cos(theta)*Y_cloned 
+    # beyond this distance from the unit cell edges, tanh(b*x/2) saturates
+    # to -1 and the product of sigmoids is exactly 0
+    margin = 80 / b
 
-    
-    b = 1/field.dx * 20
-    WEIGHTS = (_sigmoid(4*np.pi*uc_stretch_factor-X0, b) * 
-               _sigmoid(X0, b) * _sigmoid(4*np.pi/np.sqrt(3)*uc_stretch_factor-Y0, b) * 
-               _sigmoid(Y0, b))
+    a_x = 4*np.pi*uc_stretch_factor
+    a_y = 4*np.pi/np.sqrt(3)*uc_stretch_factor
+
+    # unit cell corners in unrotated coordinates
+    c, s = np.cos(theta), np.sin(theta)
+    corners = [(u, v) for u in (-margin, a_x+margin) for v in (-margin, a_y+margin)]
+    X_corners = [c*u + s*v for u, v in corners]
+    Y_corners = [-s*u + c*v for u, v in corners]
+
+    x = field.x[:,0]
+    y = field.y[0,:]
+
+    unit_cell = np.zeros(field.shape, dtype=np.result_type(field.x, a_x))
+
+    for p in _UNIT_CELL_MIRRORS:
+        i0, i1 = _index_range(min(X_corners) - p[0]*field.lx, max(X_corners) - p[0]*field.lx, field.dx, field.nx)
+        j0, j1 = _index_range(min(Y_corners) - p[1]*field.ly, max(Y_corners) - p[1]*field.ly, field.dy, field.ny)
+
+        if i0 == i1 or j0 == j1:
+            continue
+
+        X = (x[i0:i1] + p[0]*field.lx)[:,None]
+        Y = (y[j0:j1] + p[1]*field.ly)[None,:]
+
+        # rotation
+        X0 = c*X - s*Y
+        Y0 = s*X + c*Y
+
+        unit_cell[i0:i1,j0:j1] += (_sigmoid(a_x-X0, b) * _sigmoid(X0, b) *
+                                   _sigmoid(a_y-Y0, b) * _sigmoid(Y0, b))
+
+    unit_cell.setflags(write=False)
+
+    _unit_cell_cache[key] = unit_cell
+    while len(_unit_cell_cache) > _UNIT_CELL_CACHE_SIZE:
+        _unit_cell_cache.popitem(last=False)
 
-    unit_cell = np.sum(WEIGHTS, axis=(0,))
     return unit_cell
 
 
@@ -43,7 +100,8 @@ def hexagonal_amplitudes(
         field: tg.RealField2D, 
         unit_cell: np.ndarray, 
         theta: tg.FloatLike, *,
-        uc_strech_factor: tg.FloatLike= 1.
+        uc_strech_factor: tg.FloatLike= 1.,
+        engine: Optional[HexagonalAmplitudeEngine] = None
         ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     '''
     Calculate the amplitudes of principal RLVs of the hexagonal lattice of the
@@ -51,34 +109,10 @@ def hexagonal_amplitudes(
 
     Return: 3 complex 2D ndarrays
     '''
-    # calculate amplitude
-    
-    # number of points in a unit cell
-    num_points_uc = np.sum(unit_cell)
-
-    k0 = 1 / uc_strech_factor
-    k1_x, k1_y = k0*np.cos(-theta), k0*np.sin(-theta)
-    k2_x, k2_y = k0*np.cos(-theta+2*np.pi/3), k0*np.sin(-theta+2*np.pi/3)
-    k3_x, k3_y = k0*np.cos(-theta+4*np.pi/3), k0*np.sin(-theta+4*np.pi/3)
-
-    # plane waves filtered with unit cell
-    H1: np.ndarray = np.exp(1j* (k1_x*field.x + k1_y*field.y)) * unit_cell
-    H1_k = fft2(H1)
-
-    H2 = np.exp(1j* (k2_x*field.x + k2_y*field.y)) * unit_cell
-    H2_k = fft2(H2)
-
-    H3 = np.exp(1j* (k3_x*field.x + k3_y*field.y)) * unit_cell
-    H3_k = fft2(H3)
-
-    psi_k = fft2(field.psi)
-
-    # amplitudes
-    A1 = np.exp(-1j*(k1_x*field.x + k1_y*field.y)) * ifft2(H1_k * psi_k) / num_points_uc # type: ignore
-    A2 = np.exp(-1j*(k2_x*field.x + k2_y*field.y)) * ifft2(H2_k * psi_k) / num_points_uc # type: ignore
-    A3 = np.exp(-1j*(k3_x*field.x + k3_y*field.y)) * ifft2(H3_k * psi_k) / num_points_uc # type: ignore
+    if engine is None:
+        engine = _default_engine
 
-    return A1, A2, A3
+    return engine(field, unit_cell, theta, uc_stretch_factor=uc_strech_factor)
 
 
 def test_tanh(x, w, a, A0):
@@ -108,7 +142,10 @@ def fit_tanh(
         amp0: tg.FloatLike = 0.05
     ) -> TanhParams:
 
-    param, _ = curve_fit(test_tanh, x, y, p0=[width0, shift0, amp0])
+    # MINPACK only works in double precision (e.g. for longdouble fields)
+    param, _ = curve_fit(
+            test_tanh, np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64),
+            p0=[float(width0), float(shift0), float(amp0)])
     return TanhParams(*param)
 
 
@@ -116,6 +153,7 @@ def calculate_widths(
         field: tg.RealField2D,
         theta: tg.FloatLike, *,
         uc_factor: tg.FloatLike = 1.,
+        engine: Optional[HexagonalAmplitudeEngine] = None
         ):
     # rotated unit cell
     rotated_uc = get_rotated_unit_cell(
@@ -125,7 +163,8 @@ def calculate_widths(
     A1, A2, A3 = hexagonal_amplitudes(
             field, 
             rotated_uc, theta, 
-            uc_strech_factor=uc_factor)
+            uc_strech_factor=uc_factor,
+            engine=engine)
 
 
     # extract x-dependence
@@ -0,0 +1,127 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import json
+import os
+
+import torusgrid as tg
+
+from .. import base
+from .. import global_cfg as G
+
+
+class FieldResultCache:
+    """
+    Per-interface calc results of one angle directory, stored in
+    calc_cache.json next to calc.json.
+
+    An entry is keyed by the field's file name and is valid as long as the
+    file's size and mtime (for series members, their stored size and write
+    time) are unchanged. Each kind of result (gamma, widths)
+    also records the parameters it depends on (mu, theta, ...); if those
+    change, all results of that kind are dropped.
+
+    Values are stored as strings so that longdouble results survive the round
+    trip; use FieldResultCache.to_float to read them back.
+
+    With use_cached=False, get() always misses but existing entries are kept
+    and overwritten by put().
+    """
+    def __init__(self, angle_dir: str, *, use_cached: bool = True):
+        self.path = Path(angle_dir) / G.CALC_CACHE_FILE
+        self.use_cached = use_cached
+        self.params: Dict[str, Dict[str, str]] = {}
+        self.entries: Dict[str, Dict[str, Any]] = {}
+
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.params = data.get('params', {})
+            self.entries = data.get('entries', {})
+
+    def set_params(self, kind: str, **params: Any):
+        """
+        Declare the parameters results of this kind depend on, dropping cached
+        results computed with different ones. Numbers (and numeric strings)
+        are compared in double precision, so '0.10', 0.1 and longdouble 0.1
+        count as the same parameter.
+        """
+        params_str = {k: _param_str(v) for k, v in params.items()}
+        if self.params.get(kind) != params_str:
+            for entry in self.entries.values():
+                entry.pop(kind, None)
+        self.params[kind] = params_str
+
+    @staticmethod
+    def _stat(field_path: str) -> Dict[str, int]:
+        return base.field_stat(field_path)
+
+    def get(self, field_path: str, kind: str) -> Optional[Any]:
+        if not self.use_cached:
+            return None
+
+        entry = self.entries.get(Path(field_path).name)
+        if entry is None or kind not in entry.keys():
+            return None
+
+        if {k: entry[k] for k in ['size', 'mtime_ns']} != self._stat(field_path):
+            return None
+
+        return entry[kind]
+
+    def put(self, field_path: str, kind: str, value: Any):
+        name = Path(field_path).name
+        stat = self._stat(field_path)
+
+        entry = self.entries.get(name)
+        if entry is None or {k: entry[k] for k in ['size', 'mtime_ns']} != stat:
+            entry = dict(stat)
+            self.entries[name] = entry
+
+        entry[kind] = _stringify(value)
+
+    def save(self, field_paths: List[str]):
+        """
+        Write the cache atomically, keeping only entries of the given fields
+        """
+        names = set(Path(p).name for p in field_paths)
+        self.entries = {k: v for k, v in self.entries.items() if k in names}
+
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(dict(params=self.params, entries=self.entries), f, indent=1)
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def to_float(value: Any, dtype: type) -> Any:
+        """
+        Convert a cached value back to dtype (recursively for lists and dicts)
+        """
+        if value is None:
+            return None
+        if isinstance(value, dict):
+            return {k: FieldResultCache.to_float(v, dtype) for k, v in value.items()}
+        if isinstance(value, list):
+            return [FieldResultCache.to_float(v, dtype) for v in value]
+        return dtype(value)
+
+
+def _param_str(value: Any) -> str:
+    try:
+        return repr(float(value))
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _stringify(value: Any) -> Any:
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return {k: _stringify(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_stringify(v) for v in value]
+    return str(value)
+
+
+def in_lx_range(values: Optional[dict], lx_min: tg.FloatLike, lx_max: tg.FloatLike) -> bool:
+    return values is not None and lx_max >= values['lx'] >= lx_min
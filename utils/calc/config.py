@@ -1,6 +1,6 @@
 from .. import base
 import yaml
-from typing import List, final
+from typing import List, Optional, final
 import pickle
 import pfc_util as pfc
 
@@ -31,6 +31,9 @@ class CalcConfig(
 
         self.solid_file = f'{self.file_path("pfc")}/unit_sol.field'
         self.liquid_file = f'{self.file_path("pfc")}/unit_liq.field'
+
+        self.fft_threads = int(config.get('fft_threads', 1))
+        self.amplitude_precision = config.get('amplitude_precision', None)
         
 
 def parse_config(path: str):
@@ -40,3 +43,27 @@ def parse_config(path: str):
 
 
 
+
+
+class TreeCalcConfig:
+    """
+    Options of `manage.py calc`
+    """
+    def __init__(self, args):
+        self.root: str = args.root
+
+        self.workers: int = int(args.jobs)
+        self.queue_size: int = int(args.queue) if args.queue is not None else 2*max(self.workers, 1)
+
+        self.gamma: bool = args.only in [None, 'gamma']
+        self.width: bool = args.only in [None, 'width']
+
+        self.precision: str = args.precision
+        self.lx_min: str = args.lx_min
+        self.lx_max: str = args.lx_max
+
+        self.fft_threads: int = int(args.fft_threads)
+        self.amplitude_precision: Optional[str] = args.amplitude_precision
+
+        self.dry: bool = args.dry
+        self.overwrite: bool = args.overwrite
@@ -9,24 +9,64 @@ from rich import get_console
 
 
 from .config import parse_config
+from .cache import FieldResultCache, in_lx_range
 
 from ..base import CommandLineConfig
 from .. import base
 from .. import global_cfg as G
 
 
+def field_values(
+    ifc: tg.RealField2D,
+    fef: pfc.pfc6.FreeEnergyFunctional,
+    mu: tg.FloatLike
+) -> dict:
+    """
+    Per-interface quantities needed for gamma
+    """
+    return dict(
+        lx=ifc.lx, ly=ifc.ly, volume=ifc.volume,
+        f=fef.mean_free_energy_density(ifc),
+        omega=fef.mean_grand_potential_density(ifc, mu)
+    )
+
+
+def reference_omega(
+    path: str,
+    fef: pfc.pfc6.FreeEnergyFunctional,
+    mu: tg.FloatLike
+):
+    """
+    Mean grand potential density of a unit cell field
+    """
+    return fef.mean_grand_potential_density(base.load_field(path), mu)
+
+
+def compute_gamma(
+    Ly_ar: np.ndarray, Vol_ar: np.ndarray, om_ar: np.ndarray,
+    omega_l: tg.FloatLike
+) -> np.ndarray:
+    """
+    Interfacial energy per interface (each field contains two interfaces)
+    """
+    Om_excess = om_ar*Vol_ar - omega_l*Vol_ar
+    return Om_excess / Ly_ar / 2
+
+
 def run(config_path: str, CC: CommandLineConfig):
 
     C = parse_config(config_path)
     console = get_console()
     fef = pfc.pfc6.FreeEnergyFunctional(C.eps_, C.alpha_, C.beta_)
 
+    timings = base.get_timings()
+    timings.reset('calc_gamma')
+
     
     calc_file = f'{C.file_path("angle")}/{G.CALC_FILE}'
-    if (not CC.dry) and (not CC.overwrite):
-        if base.json_has_key(calc_file, 'gamma'):
-            raise base.DataExistsError(f'File {calc_file} already has key \'gamma\'')
 
+    cache = FieldResultCache(C.file_path('angle'), use_cached=not CC.overwrite)
+    cache.set_params('gamma', eps=C.eps, alpha=C.alpha, beta=C.beta, mu=C.mu_)
 
     console.log(f'file prefix: {C.file_prefix("angle")}', highlight=False)
     console.log(f'theta={C.theta:.4f}')
@@ -35,12 +75,13 @@ def run(config_path: str, CC: CommandLineConfig):
     console.print()
 
     ifcs_path = f'data/{C.file_prefix("angle")}/interfaces'
-    ifcs = base.get_interface_list(ifcs_path)
+    all_ifcs = base.get_interface_list(ifcs_path)
+    ifcs = base.get_interface_list(ifcs_path, lx_min=C.lx_min, lx_max=C.lx_max)
 
     console.print()
-    console.log(f'Loaded {len(ifcs)} interfaces from {ifcs_path}', highlight=False)
-    console.log(f'Lx max: {ifcs[-1]().lx}')
-    console.log(f'Lx min: {ifcs[0]().lx}')
+    console.log(f'Found {len(all_ifcs)} interfaces in {ifcs_path}, {len(ifcs)} within Lx range', highlight=False)
+    console.log(f'Lx max: {all_ifcs[-1].lx}')
+    console.log(f'Lx min: {all_ifcs[0].lx}')
     console.print()
 
     Lx_ar = []
@@ -51,17 +92,32 @@ def run(config_path: str, CC: CommandLineConfig):
     Om_ar = []
 
 
+    n_cached = 0
     for ifc_loader in track(ifcs, description='Calculating interfacial energies'):
-        try:
-            ifc = ifc_loader()
-            if C.lx_max >= ifc.lx >= C.lx_min:
-                    Lx_ar.append(ifc.lx) 
-                    Ly_ar.append(ifc.ly) 
-                    Vol_ar.append(ifc.volume)
-                    f_ar.append(fef.mean_free_energy_density(ifc))
-                    om_ar.append(fef.mean_grand_potential_density(ifc, C.mu_))
-        except Exception as e:
-            console.log(f'error occured when loading interface: {e.args}')
+        values = FieldResultCache.to_float(cache.get(ifc_loader.path, 'gamma'), C.dtype)
+
+        if values is None:
+            try:
+                ifc = ifc_loader()
+                if C.lx_max >= ifc.lx >= C.lx_min:
+                    with timings.timer('energy'):
+                        values = field_values(ifc, fef, C.mu_)
+                    cache.put(ifc_loader.path, 'gamma', values)
+            except Exception as e:
+                console.log(f'error occured when loading interface: {e.args}')
+        else:
+            n_cached += 1
+            timings.count('cached')
+
+        if in_lx_range(values, C.lx_min, C.lx_max):
+            assert values is not None
+            Lx_ar.append(values['lx'])
+            Ly_ar.append(values['ly'])
+            Vol_ar.append(values['volume'])
+            f_ar.append(values['f'])
+            om_ar.append(values['omega'])
+
+    console.log(f'{n_cached} interfaces read from cache', highlight=False)
 
     console.rule()
     console.log(f'Using Lx={Lx_ar[0]:.5f}~{Lx_ar[-1]:.5f} ({len(Lx_ar)} interfaces)', highlight=False)
@@ -76,20 +132,16 @@ def run(config_path: str, CC: CommandLineConfig):
     console.print()
     console.log(f'Reading {C.liquid_file} for reference grand potential', highlight=False)
 
-    unit_liq = tg.load(tg.RealField2D, C.liquid_file)
-    omega_l = fef.mean_grand_potential_density(unit_liq, C.mu_)
+    omega_l = reference_omega(C.liquid_file, fef, C.mu_)
 
     console.log(f'omega_l = {omega_l}')
 
     console.log(f'Reading {C.solid_file} for reference grand potential', highlight=False)
-    unit_sol = tg.load(tg.RealField2D, C.solid_file)
-    omega_s = fef.mean_grand_potential_density(unit_sol, C.mu_)
+    omega_s = reference_omega(C.solid_file, fef, C.mu_)
 
     console.log(f'omega_s = {omega_s}')
 
-    Om_excess = Om_ar - omega_l*Vol_ar
-
-    gamma = Om_excess / Ly_ar / 2
+    gamma = compute_gamma(Ly_ar, Vol_ar, om_ar, omega_l)
 
     console.rule()
 
@@ -118,7 +170,7 @@ def run(config_path: str, CC: CommandLineConfig):
         plt.show()
 
     if not CC.dry:
-
+        cache.save([ifc.path for ifc in all_ifcs])
 
         base.put_val_into_json(
                 calc_file, 'gamma',
@@ -126,5 +178,8 @@ def run(config_path: str, CC: CommandLineConfig):
         )
 
         console.log(f'interfacial energies saved to {calc_file}', highlight=False)
+        base.update_results(C.file_path('angle'))
+
+        timings.save(C.file_path('angle'), G.TIMINGS_FILE)
 
 
@@ -0,0 +1,282 @@
+from __future__ import annotations
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import json
+import pickle
+import numpy as np
+
+import torusgrid as tg
+import pfc_util as pfc
+
+from rich import get_console
+from rich.progress import Progress
+
+from .config import TreeCalcConfig
+from . import gamma as _gamma
+from . import width as _width
+from ._widthlib import calculate_widths
+from ._amplitudes import HexagonalAmplitudeEngine
+from .cache import FieldResultCache, in_lx_range
+
+from .. import base
+from .. import global_cfg as G
+
+
+class AngleJob:
+    """
+    Calculation state of one theta_* directory
+    """
+    def __init__(self, angle_dir: Path, C: TreeCalcConfig):
+        self.dir = angle_dir
+        self.calc_file = str(angle_dir / G.CALC_FILE)
+
+        params = base.parse_path(str(angle_dir))
+        self.dtype = tg.get_real_dtype(C.precision)
+        self.eps = self.dtype(params['eps'])
+        self.alpha = self.dtype(params['alpha'])
+        self.beta = self.dtype(params['beta'])
+
+        pfc_dir = angle_dir.parent
+        with open(pfc_dir / 'log.pkl', 'rb') as f:
+            log: List[pfc.toolkit.MuSearchRecord] = pickle.load(f)
+        self.mu = log[-1].mu[-1]
+
+        self.solid_file = str(pfc_dir / 'unit_sol.field')
+        self.liquid_file = str(pfc_dir / 'unit_liq.field')
+
+        self.theta = _get_theta(angle_dir, params['theta'])
+
+        ifcs_dir = str(angle_dir / G.INTERFACES_DIR)
+        self.fields = [loader.path for loader in base.get_interface_list(ifcs_dir)]
+
+        self.do_gamma = C.gamma
+        self.do_width = C.width
+
+        self.uc_factor = None
+        if self.do_width:
+            self.uc_factor = _width.unit_cell_factors(self.solid_file, C.precision)[2]
+
+        self.cache = FieldResultCache(str(angle_dir), use_cached=not C.overwrite)
+        self.cache.set_params('gamma', eps=params['eps'], alpha=params['alpha'],
+                              beta=params['beta'], mu=self.mu)
+        if self.do_width:
+            self.cache.set_params('widths', theta=self.theta, uc_factor=self.uc_factor,
+                                  amplitude_precision=C.amplitude_precision)
+
+        self.gamma_values: Dict[int, Optional[dict]] = {}
+        self.widths: Dict[int, Optional[Tuple]] = {}
+
+        for i, path in enumerate(self.fields):
+            if self.do_gamma:
+                cached = self.cache.get(path, 'gamma')
+                if cached is not None:
+                    self.gamma_values[i] = FieldResultCache.to_float(cached, self.dtype)
+            if self.do_width:
+                cached = self.cache.get(path, 'widths')
+                if cached is not None:
+                    self.widths[i] = FieldResultCache.to_float(cached, self.dtype)
+
+        # gamma only needs the fields within the Lx range, which is known from
+        # the interfaces index without loading them
+        gamma_fields = set()
+        if self.do_gamma:
+            gamma_fields = set(loader.path for loader in base.get_interface_list(
+                ifcs_dir, lx_min=self.dtype(C.lx_min), lx_max=self.dtype(C.lx_max)))
+
+        self.todo: List[Tuple[str, int]] = []
+        for i, path in enumerate(self.fields):
+            if path in gamma_fields and i not in self.gamma_values.keys():
+                self.todo.append(('gamma', i))
+            if self.do_width and i not in self.widths.keys():
+                self.todo.append(('width', i))
+
+        self.pending = len(self.todo)
+
+    def store(self, kind: str, i: int, res):
+        """
+        Record the result of one task; successful results are also cached
+        """
+        if kind == 'gamma':
+            self.gamma_values[i] = res
+        else:
+            self.widths[i] = res
+
+        if res is not None:
+            self.cache.put(self.fields[i], 'gamma' if kind == 'gamma' else 'widths', res)
+
+    @property
+    def name(self) -> str:
+        return str(self.dir)
+
+    def finalize(self, C: TreeCalcConfig):
+        """
+        Combine per-field results and write them to calc.json
+        """
+        console = get_console()
+
+        if self.do_gamma:
+            lx_min, lx_max = self.dtype(C.lx_min), self.dtype(C.lx_max)
+            values = [self.gamma_values[i] for i in sorted(self.gamma_values.keys())]
+            values = [v for v in values if in_lx_range(v, lx_min, lx_max)]
+
+            fef = pfc.pfc6.FreeEnergyFunctional(self.eps, self.alpha, self.beta)
+            omega_l = _gamma.reference_omega(self.liquid_file, fef, self.mu)
+
+            gamma = _gamma.compute_gamma(
+                    np.array([v['ly'] for v in values]),
+                    np.array([v['volume'] for v in values]),
+                    np.array([v['omega'] for v in values]),
+                    omega_l)
+
+            if not C.dry:
+                base.put_val_into_json(self.calc_file, 'gamma', val=gamma.astype(float).tolist())
+
+            console.log(f'{self.name}: gamma from {len(values)} interfaces', highlight=False)
+
+        if self.do_width:
+            widths = [self.widths[i] for i in range(len(self.fields))]
+
+            if not C.dry:
+                base.put_val_into_json(
+                        self.calc_file, 'widths',
+                        val=[None if w is None else np.array(w).astype(float).tolist()
+                             for w in widths])
+
+            console.log(f'{self.name}: widths of {len(widths)} interfaces', highlight=False)
+
+        if not C.dry:
+            self.cache.save(self.fields)
+            base.update_results(str(self.dir))
+
+
+def _get_theta(angle_dir: Path, theta_str: str):
+    """
+    Exact rotation angle of a theta_* directory, from the (na, nb) recorded by
+    gen_interface or, for older data, by searching for a matching (na, nb).
+    """
+    data_file = angle_dir / G.INTERFACE_DATA_FILE
+    if base.json_has_key(str(data_file), 'na') and base.json_has_key(str(data_file), 'nb'):
+        with open(data_file, 'r') as f:
+            data = json.load(f)
+        na, nb = int(data['na']), int(data['nb'])
+    else:
+        na, nb = base.find_rotation(theta_str)
+
+    return pfc.toolkit.UnitCellRotator(na, nb).theta
+
+
+def discover(root: str) -> List[Path]:
+    """
+    Return all theta_* directories under root that have an interfaces
+    directory
+    """
+    return sorted(p.parent for p in Path(root).rglob(G.INTERFACES_DIR)
+                  if p.is_dir() and p.parent.name.startswith('theta_'))
+
+
+_engine: Optional[HexagonalAmplitudeEngine] = None
+
+
+def _gamma_task(
+    path: str,
+    eps: tg.FloatLike, alpha: tg.FloatLike, beta: tg.FloatLike,
+    mu: tg.FloatLike
+) -> dict:
+    ifc = base.FieldLoader(path)()
+    fef = pfc.pfc6.FreeEnergyFunctional(eps, alpha, beta)
+    return _gamma.field_values(ifc, fef, mu)
+
+
+def _width_task(
+    path: str,
+    theta: tg.FloatLike, uc_factor: tg.FloatLike,
+    fft_threads: int, amplitude_precision: Optional[str]
+) -> Tuple:
+    global _engine
+    if _engine is None:
+        _engine = HexagonalAmplitudeEngine(threads=fft_threads, precision=amplitude_precision) # type: ignore
+    return calculate_widths(base.FieldLoader(path)(), theta, uc_factor=uc_factor, engine=_engine)
+
+
+def _tasks(jobs: List[AngleJob], C: TreeCalcConfig) -> Iterator[Tuple[AngleJob, str, int, tuple]]:
+    for job in jobs:
+        for kind, i in job.todo:
+            path = job.fields[i]
+            if kind == 'gamma':
+                yield job, kind, i, (_gamma_task, path, job.eps, job.alpha, job.beta, job.mu)
+            else:
+                yield job, kind, i, (_width_task, path, job.theta, job.uc_factor,
+                                     C.fft_threads, C.amplitude_precision)
+
+
+def run(C: TreeCalcConfig):
+    """
+    Calculate gamma and/or widths for every angle under C.root.
+
+    Per-interface work is distributed over a process pool with at most
+    C.queue_size tasks in flight; each angle's calc.json is written as soon
+    as all of its interfaces are done. Interfaces whose results are in the
+    angle's calc_cache.json (and unchanged since) are not recomputed.
+    """
+    console = get_console()
+
+    angle_dirs = discover(C.root)
+    console.log(f'Found {len(angle_dirs)} angles under {C.root}', highlight=False)
+
+    jobs: List[AngleJob] = []
+    for d in angle_dirs:
+        try:
+            job = AngleJob(d, C)
+        except Exception as e:
+            console.log(f'{d}: skipped ({e})', highlight=False, style='bold red')
+            continue
+
+        if job.pending == 0:
+            console.log(f'{d}: all results cached', highlight=False)
+            job.finalize(C)
+            continue
+        jobs.append(job)
+
+    n_tasks = sum(job.pending for job in jobs)
+    workers = base.max_workers(C.workers, n_tasks=n_tasks)
+    queue_size = max(C.queue_size, workers)
+
+    console.log(f'{n_tasks} tasks from {len(jobs)} angles, {workers} workers', highlight=False)
+
+    tasks = _tasks(jobs, C)
+    in_flight: Dict[Future, Tuple[AngleJob, str, int]] = {}
+
+    def submit_next(pool: ProcessPoolExecutor) -> bool:
+        try:
+            job, kind, i, (func, *args) = next(tasks)
+        except StopIteration:
+            return False
+        in_flight[pool.submit(func, *args)] = (job, kind, i)
+        return True
+
+    with Progress(console=console) as progress, ProcessPoolExecutor(max_workers=workers) as pool:
+        bar = progress.add_task('Calculating', total=n_tasks)
+
+        while len(in_flight) < queue_size and submit_next(pool): ...
+
+        while in_flight:
+            done: Set[Future]
+            done, _ = wait(in_flight.keys(), return_when=FIRST_COMPLETED)
+
+            for fut in done:
+                job, kind, i = in_flight.pop(fut)
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    console.log(f'{job.fields[i]}: {kind} failed ({e})', highlight=False, style='bold red')
+                    res = None
+
+                job.store(kind, i, res)
+                job.pending -= 1
+                progress.advance(bar)
+
+                if job.pending == 0:
+                    job.finalize(C)
+
+                submit_next(pool)
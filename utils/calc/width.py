@@ -12,20 +12,34 @@ from .config import parse_config
 from .. import base
 
 from ._widthlib import calculate_widths
+from ._amplitudes import HexagonalAmplitudeEngine
+from .cache import FieldResultCache
 
 from .. import global_cfg as G
 
 
+def unit_cell_factors(solid_file: str, precision: tg.PrecisionLike):
+    """
+    Ratio of the relaxed unit cell size to (4pi, 4pi/sqrt3)
+
+    Return: (uc_factor_x, uc_factor_y, uc_factor)
+    """
+    solid = base.load_field(solid_file)
+    dtype = tg.get_real_dtype(precision)
+    uc_factor_x = solid.lx / (4*tg.pi(precision))
+    uc_factor_y = solid.ly / (4*tg.pi(precision)/np.sqrt(dtype('3')))
+    return uc_factor_x, uc_factor_y, (uc_factor_x + uc_factor_y) / 2
+
+
 def run(config_path: str, CC: base.CommandLineConfig):
 
     console = get_console()
     C = parse_config(config_path)
 
-    calc_file = f'{C.file_path("angle")}/{G.CALC_FILE}'
-    if (not CC.dry) and (not CC.overwrite):
-        if base.json_has_key(calc_file, 'width'):
-            raise base.DataExistsError(f'File {calc_file} already has key \'width\'')
+    timings = base.get_timings()
+    timings.reset('calc_width')
 
+    calc_file = f'{C.file_path("angle")}/{G.CALC_FILE}'
 
     ifcs_path = f'data/{C.file_prefix("angle")}/interfaces'
     ifcs = base.get_interface_list(ifcs_path)
@@ -33,30 +47,47 @@ def run(config_path: str, CC: base.CommandLineConfig):
 
     console.log(f'Loaded {len(ifcs)} fields from {ifcs_path}', highlight=False)
 
-    solid = tg.load(tg.RealField2D, C.solid_file)
-    uc_factor_x = solid.lx / (4*tg.pi(C.precision))
-    uc_factor_y = solid.ly / (4*tg.pi(C.precision)/np.sqrt(C.to_float('3')))
-    uc_factor = (uc_factor_x + uc_factor_y) / 2
+    uc_factor_x, uc_factor_y, uc_factor = unit_cell_factors(C.solid_file, C.precision)
 
     console.log(f'UCFACTOR_X = {uc_factor_x}')
     console.log(f'UCFACTOR_Y = {uc_factor_y}')
     console.log(f'UCFACTOR = {uc_factor}')
 
 
+    engine = HexagonalAmplitudeEngine(
+            threads=C.fft_threads,
+            precision=C.amplitude_precision)
+
+    cache = FieldResultCache(C.file_path('angle'), use_cached=not CC.overwrite)
+    cache.set_params('widths', theta=C.theta, uc_factor=uc_factor,
+                     amplitude_precision=C.amplitude_precision)
+
     widths = []
     for ifc in track(ifcs, description='Calculating widths'):
-        w1, w2, w3 = calculate_widths(ifc(), C.theta, uc_factor=uc_factor)
-        widths.append([w1, w2, w3])
+        w = FieldResultCache.to_float(cache.get(ifc.path, 'widths'), C.dtype)
+        if w is None:
+            field = ifc()
+            with timings.timer('width'):
+                w = list(calculate_widths(field, C.theta, uc_factor=uc_factor, engine=engine))
+            cache.put(ifc.path, 'widths', w)
+        else:
+            timings.count('cached')
+        widths.append(w)
 
     console.print('widths:')
     console.print(widths)
 
     if not CC.dry:
+        cache.save([ifc.path for ifc in ifcs])
+
         base.put_val_into_json(
                 calc_file,
                 'widths',
                 val=np.array(widths).astype(float).tolist())
 
         console.print(f'interface widths saved to {calc_file}', highlight=False)
+        base.update_results(C.file_path('angle'))
+
+        timings.save(C.file_path('angle'), G.TIMINGS_FILE)
 
 
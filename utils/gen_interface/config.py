@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import List, final
+from typing import List, Union, final
 import yaml
 import torusgrid as tg
 import pfc_util as pfc
@@ -9,16 +9,21 @@ from .. import base
 
 @final
 class BaseFieldConfig(
+    base.SpecifiesPrecisionSchedule,
+    base.SpecifiesAdaptiveTimeStep,
     base.SpecifiesSimulationParams,
     base.SpecifiesPrecision,
     base.ConfigBase
     ):
     def __init__(self, config: dict):
         super().__init__(config)
+        self.concurrent_pair = bool(config.get('concurrent_pair', False))
 
 
 @final
 class LongFieldConfig(
+    base.SpecifiesPrecisionSchedule,
+    base.SpecifiesAdaptiveTimeStep,
     base.SpecifiesSimulationParams,
     base.SpecifiesPrecision,
     base.SpecifiesKRegularizer,
@@ -39,9 +44,18 @@ class LongFieldConfig(
         else:
             self.width = self.to_float(config['width'])
 
+        self.concurrent_pair = bool(config.get('concurrent_pair', False))
+
+        self.width_workers = int(config.get('width_workers', 1))
+        self.width_memory_limit = base.parse_bytes(config.get('width_memory_limit', None))
+
+
+FieldConfig = Union[BaseFieldConfig, LongFieldConfig]
+
 
 @final
 class InterfaceGenConfig(
+    base.SpecifiesCheckpoints,
     base.SpecifiesShape,
     base.SpecifiesRotationAngle,
     base.SpecifiesFFTWisdoms,
@@ -1,3 +1,4 @@
+from typing import Callable, List, Tuple, Union
 import numpy as np
 from pathlib import Path
 import torusgrid as tg
@@ -5,41 +6,114 @@ import pfc_util as pfc
 import rich
 import pyfftw
 
-from .config import InterfaceGenConfig, parse_config
+from .config import InterfaceGenConfig, FieldConfig, parse_config
+from .widthscan import scan_widths
+from .pair import (minimize_pair_phased, pair_threads, const_mu_minimizer, nonlocal_rk4_minimizer,
+                   MinimizerSupplier)
+from functools import partial
 import os
+import threading
 
 from .. import base
 from ..base import CommandLineConfig
 from .. import global_cfg as G
 
 
+Hooks = tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]
+
+
 def run(config_path: str, CC: CommandLineConfig):
     C = parse_config(config_path)
     console = rich.get_console()
 
     savedir = C.file_path('angle')
-    
-    _running_marker = Path(savedir + '/' + G.RUNNING_FILE)
-    
-    if _running_marker.exists():
-        console.log(f'{str(_running_marker.parent)} is already occupied by another process. Aborted.', style='bold red', highlight=False)
+
+    stop = threading.Event()
+    lost = threading.Event()
+
+    def on_lease_lost():
+        console.log(f'Lease on {savedir} lost, stopping after the current step without saving',
+                    style='bold red', highlight=False)
+        lost.set()
+        stop.set()
+
+    lease = base.Lease(savedir, on_lost=on_lease_lost)
+
+    acquired = not base.is_leased(savedir) if CC.dry else lease.acquire()
+
+    if not acquired:
+        console.log(f'{savedir} is already occupied by {base.describe_lease(base.read_lease(savedir))}. Aborted.',
+                    style='bold red', highlight=False)
         return
 
-    if not CC.dry:
-        Path(savedir).mkdir(parents=True, exist_ok=True)
-        base.check_dir_empty(savedir, overwrite=CC.overwrite)
+    phased = bool(C.base.phases or C.long.phases)
+    plans = base.FFTPlanCache(base.get_store(C.wisdom_store), precision=None if phased else C.precision)
+
+    timings = base.get_timings()
+    timings.reset('gen_interface')
+
+    job = base.get_job()
 
     try:
-        if not CC.dry:
-            _running_marker.touch()
-        _run(C, CC)
+        with base.stop_on_sigterm(stop):
+            if not CC.dry:
+                base.check_dir_empty(savedir, overwrite=CC.overwrite)
+                job.start('gen_interface', savedir)
+            _run(C, CC, plans, stop, lost)
+    except base.Stopped:
+        if not lost.is_set():
+            console.log('Stopped, progress checkpointed', style='bold red')
     finally:
-        if not CC.dry:
-            os.remove(_running_marker)
-
+        plans.save()
+        if not CC.dry and not lost.is_set():
+            timings.save(savedir, G.TIMINGS_FILE)
+        job.stop()
+        lease.release()
+
+
+def fft_shapes(C: InterfaceGenConfig) -> List[Tuple[Tuple[int, int], tg.PrecisionLike, int]]:
+    """
+    (shape, precision, threads) of the minimizers: rotated unit cells, then
+    long fields and interface
+    """
+    sol0 = tg.change_precision(
+        base.load_field(f'{C.file_path("pfc")}/unit_sol.field', mmap=False),
+        C.precision)
+    solid = C.rotator(sol0, pfc.toolkit.SNAP)
 
-def _run(C: InterfaceGenConfig, CC: CommandLineConfig):
+    base_threads = C.base.fft_threads
+    if C.base.concurrent_pair:
+        base_threads = pair_threads(base_threads)
+
+    long_threads = C.long.fft_threads
+    long_shape = (solid.nx * C.long.mx, solid.ny * C.long.my)
+
+    shapes = []
+    for p in C.base.phases:
+        threads = pair_threads(p.fft_threads) if C.base.concurrent_pair else p.fft_threads
+        shapes.append((solid.shape, p.precision, threads))
+    shapes.append((solid.shape, C.precision, base_threads))
+
+    # the interface is always minimized serially
+    for p in C.long.phases:
+        if C.long.concurrent_pair:
+            shapes.append((long_shape, p.precision, pair_threads(p.fft_threads)))
+        shapes.append((long_shape, p.precision, p.fft_threads))
+    if C.long.concurrent_pair:
+        shapes.append((long_shape, C.precision, pair_threads(long_threads)))
+    shapes.append((long_shape, C.precision, long_threads))
+    return shapes
+
+
+def _run(C: InterfaceGenConfig, CC: CommandLineConfig, plans: base.FFTPlanCache,
+         stop: threading.Event, lost: threading.Event):
+    """
+    Generate the interface, raising base.Stopped once stop is set (after
+    checkpointing the minimization in flight, unless lost is set, i.e. the
+    lease was lost, in which case nothing is written anymore)
+    """
     console = rich.get_console()
+    timings = base.get_timings()
 
 
     for wisdom in C.fftw_wisdoms:
@@ -67,18 +141,53 @@ def _run(C: InterfaceGenConfig, CC: CommandLineConfig):
 
     console.log(f'width0 = {C.long.width}')
 
-    console.input('Press enter to proceed')
+    if not CC.headless:
+        console.input('Press enter to proceed')
+
+    # steps completed by a previous run of the same config
+    ckpt = base.Checkpoint(savedir_with_angle, interval=None if CC.dry else C.checkpoint_interval,
+                           config=C.config_hash, overwrite=CC.overwrite, lost=lost)
+    done = ckpt.get('step', 1)
+    progress = base.get_progress(CC, savedir_with_angle)
+    if done > 1:
+        console.log(f'resuming from checkpoint after step {done}', highlight=False)
+
+    def minimize(
+        field: tg.RealField2D, name: str, cfg: FieldConfig,
+        supplier: MinimizerSupplier,
+        supplier_for: Callable[[base.PhaseConfig], MinimizerSupplier],
+        get_hooks: Callable[[Union[FieldConfig, base.PhaseConfig], str], Hooks]
+    ):
+        """
+        Minimize field through the phases of cfg, then with supplier,
+        checkpointing under run.<name>
+        """
+        if not base.run_phases(
+                field, cfg.phases,
+                lambda f, phase: supplier_for(phase)(f, phase.fft_threads),
+                partial(get_hooks, label=name), ckpt, f'run.{name}', stop=stop):
+            raise base.Stopped()
+
+        m = supplier(field, cfg.fft_threads)
+        ckpt.restore(f'run.{name}', m, phase=len(cfg.phases))
+        m.run(cfg.n_steps, base.timed_hooks(get_hooks(cfg, name) + ckpt.hook(f'run.{name}', stop=stop)))
+        if stop.is_set():
+            raise base.Stopped()
+
+    for shape, precision, threads in fft_shapes(C):
+        plans.plan_minimizer(shape, precision, threads)
 
 
     '''1. Generate rotated unit cell'''
     console.rule(title='1. Generate rotated unit cell')
+    timings.begin('1. Generate rotated unit cell')
 
     sol0 = tg.change_precision(
-        tg.load(tg.RealField2D, f'{savedir}/unit_sol.field'),
+        base.load_field(f'{savedir}/unit_sol.field', mmap=False),
         C.precision)
 
     liq0 = tg.change_precision(
-        tg.load(tg.RealField2D, f'{savedir}/unit_liq.field'),
+        base.load_field(f'{savedir}/unit_liq.field', mmap=False),
         C.precision)
 
     console.log(f'Loaded solid field, shape={sol0.shape}, size={sol0.size}')
@@ -96,30 +205,58 @@ def _run(C: InterfaceGenConfig, CC: CommandLineConfig):
 
     '''2. Minimize unit cells'''
     console.rule(title='2. Minimize rotated solid and liquid unit cells')
-    hooks_base = pfc.toolkit.get_pfc_hooks(
-        state_function_cls=pfc.pfc6.StateFunction,
-        display_digits=round(-np.log10(C.base.tol)), 
-        extra_display_digits=3,
-        detect_slow=(C.base.target, C.base.tol, C.base.patience),
-        refresh_interval=C.base.refresh_interval,
-        fps = C.base.fps,
-        title_params=['eps', 'alpha', 'beta', 'mu', 'dt']
-    )
-
-
-    console.log('Minimizing solid ...')
-    m = pfc.pfc6.ConstantMuMinimizer(solid, C.base.dt, C.eps_, C.alpha_, C.beta_, C.mu_)
-    m.initialize_fft(threads=C.base.fft_threads,
-                     wisdom_only=C.base.wisdom_only,
-                     destroy_input=True)
-    m.run(C.base.n_steps, hooks_base)
-
-    console.log('Minimizing liquid ...')
-    m = pfc.pfc6.ConstantMuMinimizer(liquid, C.base.dt, C.eps_, C.alpha_, C.beta_, C.mu_)
-    m.initialize_fft(threads=C.base.fft_threads,
-                     wisdom_only=C.base.wisdom_only,
-                     destroy_input=True)
-    m.run(C.base.n_steps, hooks_base)
+    timings.begin('2. Minimize rotated solid and liquid unit cells')
+    def base_hooks(cfg: Union[FieldConfig, base.PhaseConfig], label: str):
+        hooks = base.get_pfc_hooks(
+            progress, label=label,
+            state_function_cls=pfc.pfc6.StateFunction,
+            display_digits=round(-np.log10(cfg.tol)), 
+            extra_display_digits=3,
+            detect_slow=(cfg.target, cfg.tol, cfg.patience),
+            refresh_interval=cfg.refresh_interval,
+            fps = cfg.fps,
+            title_params=['eps', 'alpha', 'beta', 'mu', 'dt']
+        ) + base.StopOnEvent(stop)
+        return base.with_adaptive_dt(hooks, cfg)
+
+
+    base_supplier = partial(
+            const_mu_minimizer,
+            dt=C.base.dt, eps=C.eps_, alpha=C.alpha_, beta=C.beta_, mu=C.mu_,
+            wisdom_only=C.base.wisdom_only)
+
+    def base_supplier_for(phase: base.PhaseConfig) -> MinimizerSupplier:
+        return partial(
+                const_mu_minimizer,
+                dt=phase.dt, eps=phase.to_float(C.eps), alpha=phase.to_float(C.alpha),
+                beta=phase.to_float(C.beta), mu=phase.dtype(C.mu_),
+                wisdom_only=phase.wisdom_only)
+
+    if done >= 2:
+        solid, liquid = ckpt.field('solid'), ckpt.field('liquid')
+        for field in (solid, liquid):
+            field.initialize_fft(threads=C.base.fft_threads, effort='FFTW_ESTIMATE')
+        console.log('Restored minimized solid and liquid from checkpoint')
+    elif C.base.concurrent_pair:
+        console.log('Minimizing solid and liquid concurrently ...')
+        with timings.timer('minimize_pair'):
+            if not minimize_pair_phased(
+                    solid, liquid, C.base, base_supplier, base_supplier_for,
+                    names=('run.solid', 'run.liquid'), labels=('solid', 'liquid'),
+                    checkpoint=ckpt, stop=stop, progress=progress):
+                raise base.Stopped()
+    else:
+        console.log('Minimizing solid ...')
+        minimize(solid, 'solid', C.base, base_supplier, base_supplier_for, base_hooks)
+
+        console.log('Minimizing liquid ...')
+        minimize(liquid, 'liquid', C.base, base_supplier, base_supplier_for, base_hooks)
+
+    if done < 2:
+        ckpt.save(dict(solid=solid, liquid=liquid), step=2)
+        ckpt.discard('run')
+    if stop.is_set():
+        raise base.Stopped()
 
     console.log('Minimization done')
     console.log(f'omega_s = {fef.mean_grand_potential_density(solid, C.mu_)}')
@@ -128,6 +265,7 @@ def _run(C: InterfaceGenConfig, CC: CommandLineConfig):
 
     '''3. Elongate solid and liquid'''
     console.rule(title='3. Elongate solid and liquid')
+    timings.begin('3. Elongate solid and liquid')
     long_sol = tg.extend(solid, (C.long.mx, C.long.my))
     long_liq = tg.extend(liquid, (C.long.mx, C.long.my))
 
@@ -143,37 +281,61 @@ def _run(C: InterfaceGenConfig, CC: CommandLineConfig):
 
     '''4. Minimize elongated fields'''
     console.rule(title='4. Minimize long solid and liquid fields')
+    timings.begin('4. Minimize long solid and liquid fields')
+
+    def long_hooks(cfg: Union[FieldConfig, base.PhaseConfig], label: str):
+        hooks = base.get_pfc_hooks(
+            progress, label=label,
+            state_function_cls=pfc.pfc6.StateFunction,
+            display_digits=round(-np.log10(cfg.tol)), 
+            extra_display_digits=3,
+            detect_slow=(cfg.target, cfg.tol, cfg.patience),
+            refresh_interval=cfg.refresh_interval,
+            fps = cfg.fps,
+            display_params=['Lx', 'Ly', 'psibar', 'f', 'F'],
+            title_params=['eps', 'alpha', 'beta', 'dt', 'M', 'R']
+        ) + base.StopOnEvent(stop)
+        return base.with_adaptive_dt(hooks, cfg)
+
+    long_supplier = partial(
+            nonlocal_rk4_minimizer,
+            dt=C.long.dt, eps=C.eps_, alpha=C.alpha_, beta=C.beta_,
+            inertia=C.long.inertia_, k_regularizer=C.long.k_regularizer_,
+            wisdom_only=C.long.wisdom_only)
+
+    def long_supplier_for(phase: base.PhaseConfig) -> MinimizerSupplier:
+        return partial(
+                nonlocal_rk4_minimizer,
+                dt=phase.dt, eps=phase.to_float(C.eps), alpha=phase.to_float(C.alpha),
+                beta=phase.to_float(C.beta), inertia=phase.to_float(C.long.inertia),
+                k_regularizer=phase.to_float(C.long.k_regularizer),
+                wisdom_only=phase.wisdom_only)
+
+    if done >= 4:
+        long_sol, long_liq = ckpt.field('long_solid'), ckpt.field('long_liquid')
+        for field in (long_sol, long_liq):
+            field.initialize_fft(threads=C.long.fft_threads, effort='FFTW_ESTIMATE')
+        console.log('Restored minimized long solid and long liquid from checkpoint')
+    elif C.long.concurrent_pair:
+        console.log('Minimizing long solid and long liquid concurrently ...')
+        with timings.timer('minimize_pair'):
+            if not minimize_pair_phased(
+                    long_sol, long_liq, C.long, long_supplier, long_supplier_for,
+                    names=('run.long_solid', 'run.long_liquid'), labels=('long solid', 'long liquid'),
+                    checkpoint=ckpt, stop=stop, progress=progress):
+                raise base.Stopped()
+    else:
+        console.log('Minimizing long solid ...')
+        minimize(long_sol, 'long_solid', C.long, long_supplier, long_supplier_for, long_hooks)
 
-    hooks_long = pfc.toolkit.get_pfc_hooks(
-        state_function_cls=pfc.pfc6.StateFunction,
-        display_digits=round(-np.log10(C.long.tol)), 
-        extra_display_digits=3,
-        detect_slow=(C.long.target, C.long.tol, C.long.patience),
-        refresh_interval=C.long.refresh_interval,
-        fps = C.long.fps,
-        display_params=['Lx', 'Ly', 'psibar', 'f', 'F'],
-        title_params=['eps', 'alpha', 'beta', 'dt', 'M', 'R']
-    )
-
-    console.log('Minimizing long solid ...')
-    m = pfc.pfc6.NonlocalConservedRK4(
-            long_sol, C.long.dt,
-            C.eps_, C.alpha_, C.beta_,
-            inertia=C.long.inertia_, k_regularizer=C.long.k_regularizer_)
-    m.initialize_fft(threads=C.long.fft_threads,
-                     wisdom_only=C.long.wisdom_only,
-                     destroy_input=True)
-    m.run(C.long.n_steps, hooks_long)
-
-    console.log('Minimizing long liquid ...')
-    m = pfc.pfc6.NonlocalConservedRK4(
-            long_liq, C.long.dt,
-            C.eps_, C.alpha_, C.beta_,
-            inertia=C.long.inertia_, k_regularizer=C.long.k_regularizer_)
-    m.initialize_fft(threads=C.long.fft_threads,
-                     wisdom_only=C.long.wisdom_only,
-                     destroy_input=True)
-    m.run(C.long.n_steps, hooks_long)
+        console.log('Minimizing long liquid ...')
+        minimize(long_liq, 'long_liquid', C.long, long_supplier, long_supplier_for, long_hooks)
+
+    if done < 4:
+        ckpt.save(dict(long_solid=long_sol, long_liquid=long_liq), step=4)
+        ckpt.discard('run')
+    if stop.is_set():
+        raise base.Stopped()
 
     console.log(f'Long solid mean chemical potential = {fef.derivative(long_sol).mean()}')
     console.log(f'Long liquid mean chemical potential = {fef.derivative(long_liq).mean()}')
@@ -187,43 +349,48 @@ def _run(C: InterfaceGenConfig, CC: CommandLineConfig):
 
     '''5. Make interface'''
     console.rule(title='5. Make and minimize interface field')
+    timings.begin('5. Make and minimize interface field')
+
+    width = ckpt.get('width')
+    if width is not None:
+        console.log(f'Using width {width} from checkpoint')
 
-    if isinstance(C.long.width, list):
+    elif isinstance(C.long.width, list):
         # test to see which width gives the least energy
         assert len(C.long.width) > 0, 'Supply at least one width'
         console.log(f'Received {len(C.long.width)} widths')
         console.log(f'Testing to see which width gives the least energy')
 
-        F0 = C.long.to_float('inf')
-        best = 0
+        console.log(f'Using up to {C.long.width_workers} workers')
 
-        for i, w in enumerate(C.long.width):
-            ifc = tg.blend(long_sol, long_liq, axis=0, interface_width=w)
-            F = fef.free_energy(ifc)
+        with timings.timer('width_scan'):
+            scan = scan_widths(
+                    long_sol, long_liq, C.long.width, fef,
+                    workers=C.long.width_workers,
+                    memory_limit=C.long.width_memory_limit,
+                    progress=progress)
+
+        best = 0
+        for i, (w, F) in enumerate(scan):
             console.log(f'width = {w}, free energy = {F}')
-            if F0 is None:
-                F0, best = F, i
+            if F < scan[best][1]:
                 best = i
-            elif F < F0:
-                F0, best = F, i
 
         console.log(f'Using width {C.long.width[best]}')
-        ifc = tg.blend(long_sol, long_liq, axis=0, interface_width=C.long.width[best])
+        width = C.long.width[best]
+        ckpt.save(width=width)
+        if stop.is_set():
+            raise base.Stopped()
 
     else:
         console.log(f'Received width = {C.long.width}')
-        ifc = tg.blend(long_sol, long_liq, axis=0, interface_width=C.long.width)
+        width = C.long.width
 
-    console.log('Minimizing interface ...')
-    m = pfc.pfc6.NonlocalConservedRK4(
-            ifc, C.long.dt,
-            C.eps_, C.alpha_, C.beta_,
-            inertia=C.long.inertia_, k_regularizer=C.long.k_regularizer_)
+    with timings.timer('blend'):
+        ifc = tg.blend(long_sol, long_liq, axis=0, interface_width=width)
 
-    m.initialize_fft(threads=C.long.fft_threads,
-                     wisdom_only=C.long.wisdom_only,
-                     destroy_input=True)
-    m.run(C.long.n_steps, hooks_long)
+    console.log('Minimizing interface ...')
+    minimize(ifc, 'interface', C.long, long_supplier, long_supplier_for, long_hooks)
 
     console.log(f'Interface mean density: {ifc.psi.mean()}')
     console.log(f'Interface grand potiential = {fef.grand_potential(ifc, C.mu_)}')
@@ -231,16 +398,27 @@ def _run(C: InterfaceGenConfig, CC: CommandLineConfig):
 
 
     '''5. Save fields'''
+    if stop.is_set():
+        raise base.Stopped()
+
     if not CC.dry:
         console.log(f'saving under {savedir_with_angle}')
         Path(savedir_with_angle).mkdir(parents=True, exist_ok=True)
+        timings.begin('save')
+
+        with timings.timer('field.save'):
+            tg.save(solid, f'{savedir_with_angle}/solid.field')
+            tg.save(liquid, f'{savedir_with_angle}/liquid.field')
+
+            tg.save(long_sol, f'{savedir_with_angle}/long_solid.field')
+            tg.save(long_liq, f'{savedir_with_angle}/long_liquid.field')
 
-        tg.save(solid, f'{savedir_with_angle}/solid.field')
-        tg.save(liquid, f'{savedir_with_angle}/liquid.field')
+            tg.save(ifc, f'{savedir_with_angle}/interface.field')
 
-        tg.save(long_sol, f'{savedir_with_angle}/long_solid.field')
-        tg.save(long_liq, f'{savedir_with_angle}/long_liquid.field')
+        data_file = f'{savedir_with_angle}/{G.INTERFACE_DATA_FILE}'
+        base.put_val_into_json(data_file, 'na', val=C.na)
+        base.put_val_into_json(data_file, 'nb', val=C.nb)
 
-        tg.save(ifc, f'{savedir_with_angle}/interface.field')
+        ckpt.clear()
 
 
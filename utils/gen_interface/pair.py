@@ -0,0 +1,268 @@
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Any, Callable, List, Optional, Sequence, Tuple, Union
+import multiprocessing as mp
+import threading
+import time
+import pyfftw
+import torusgrid as tg
+import pfc_util as pfc
+import rich
+
+from .. import base
+from .config import FieldConfig
+
+
+MinimizerSupplier = Callable[[tg.RealField2D, int], tg.dynamics.FieldEvolver[tg.RealField2D]]
+"""
+(field, fft_threads) -> minimizer with FFT initialized
+"""
+
+
+def const_mu_minimizer(
+    field: tg.RealField2D, threads: int, *,
+    dt: tg.FloatLike, eps: tg.FloatLike, alpha: tg.FloatLike, beta: tg.FloatLike,
+    mu: tg.FloatLike, wisdom_only: bool
+):
+    m = pfc.pfc6.ConstantMuMinimizer(field, dt, eps, alpha, beta, mu)
+    m.initialize_fft(threads=threads, wisdom_only=wisdom_only, destroy_input=True)
+    return m
+
+
+def nonlocal_rk4_minimizer(
+    field: tg.RealField2D, threads: int, *,
+    dt: tg.FloatLike, eps: tg.FloatLike, alpha: tg.FloatLike, beta: tg.FloatLike,
+    inertia: tg.FloatLike, k_regularizer: tg.FloatLike, wisdom_only: bool
+):
+    m = pfc.pfc6.NonlocalConservedRK4(
+            field, dt, eps, alpha, beta,
+            inertia=inertia, k_regularizer=k_regularizer)
+    m.initialize_fft(threads=threads, wisdom_only=wisdom_only, destroy_input=True)
+    return m
+
+
+def pair_threads(fft_threads: int) -> int:
+    """
+    FFT threads of each of the two concurrent minimizations
+    """
+    return max(1, fft_threads // 2)
+
+
+_stop: Any = None
+"""
+Event set by the parent process once its stop event is set
+"""
+
+_snapshots: Any = None
+"""
+Queue of evolver states sent to the parent process, which owns the checkpoint
+"""
+
+_checkpoint: Optional[base.Checkpoint] = None
+"""
+The parent's checkpoint as of the start of the workers, to restore from
+"""
+
+
+def _init_worker(stop, snapshots, checkpoint: base.Checkpoint):
+    global _stop, _snapshots, _checkpoint
+    _stop, _snapshots, _checkpoint = stop, snapshots, checkpoint
+
+
+class _SendSnapshot(tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]):
+    """
+    Counterpart of base.CheckpointHook in a worker: send the evolver state to
+    the parent every checkpoint.interval seconds and when stopped
+    """
+    def __init__(self, name: str, interval: Optional[float]):
+        self.name = name
+        self.interval = interval
+
+    def on_start(self, n_steps: int, n_epochs: Optional[int]):
+        self._last = time.monotonic()
+
+    def on_step(self, step: int):
+        if self.interval is None or time.monotonic() - self._last < self.interval:
+            return
+        self._send()
+        self._last = time.monotonic()
+
+    def on_end(self):
+        if _stop.is_set():
+            self._send()
+
+    def _send(self):
+        e = self.evolver
+        dgrid = getattr(e, 'dgrid', None)
+        _snapshots.put((
+            self.name,
+            e.field.psi.copy(), e.field.metadata(),
+            None if dgrid is None else (dgrid.psi.copy(), dgrid.metadata()),
+            getattr(e, 'age', None), getattr(e, 'dt', None)))
+
+
+def _save_snapshot(checkpoint: base.Checkpoint, snapshot: tuple):
+    name, psi, meta, momentum, age, dt = snapshot
+    checkpoint.save_state(
+            name, tg.RealField2D.from_array(psi, metadata=meta),
+            momentum=None if momentum is None else tg.RealField2D.from_array(momentum[0], metadata=momentum[1]),
+            age=age, dt=dt)
+
+
+def _minimize_worker(
+    spec: Tuple[str, Tuple[int, ...], str], meta: dict,
+    supplier: MinimizerSupplier, threads: int,
+    cfg: Union[FieldConfig, base.PhaseConfig],
+    name: str, label: str, phase: int,
+    progress: Optional[base.Progress]
+) -> Tuple[tg.FloatLike, tg.FloatLike, Tuple[bytes, ...]]:
+    assert _checkpoint is not None
+    shared = base.SharedArray.attach(*spec)
+    try:
+        field = tg.RealField2D.from_array(shared.array, metadata=meta)
+        m = supplier(field, threads)
+        _checkpoint.restore(name, m, phase=phase)
+
+        hooks = base.get_quiet_hooks(
+                state_function_cls=pfc.pfc6.StateFunction,
+                refresh_interval=cfg.refresh_interval,
+                detect_slow=(cfg.target, cfg.tol, cfg.patience),
+                label=label, progress=progress) + base.StopOnEvent(_stop)
+        hooks = base.with_adaptive_dt(hooks, cfg, label=f'{label}: ')
+        if _checkpoint.enabled:
+            hooks = hooks + _SendSnapshot(name, _checkpoint.interval)
+
+        m.run(cfg.n_steps, hooks)
+        shared.array[...] = field.psi
+        return field.lx, field.ly, pyfftw.export_wisdom()
+    finally:
+        shared.close()
+
+
+def minimize_pair(
+    fields: Sequence[tg.RealField2D],
+    supplier: MinimizerSupplier,
+    cfg: Union[FieldConfig, base.PhaseConfig], *,
+    names: Sequence[str],
+    labels: Sequence[str],
+    checkpoint: base.Checkpoint,
+    phase: int = 0,
+    stop: Optional[threading.Event] = None,
+    progress: Optional[base.Progress] = None
+) -> bool:
+    """
+    Minimize independent fields (a solid and liquid pair, or what is left of
+    it) concurrently, each in its own worker process with half of the FFT
+    thread budget of cfg. In headless mode (progress given), the workers
+    record their progress under their labels. The time step is adapted if
+    cfg enables it, see base.with_adaptive_dt.
+
+    Each minimization is checkpointed under its name as in the serial case
+    (a worker resumes from the checkpoint if it was saved in the given phase,
+    see Checkpoint.restore); the workers send their state to this process,
+    which writes it. Once stop is set, the workers stop after their current
+    step.
+
+    Field data is passed to and from the workers through shared memory; only
+    the (possibly relaxed) system size and the workers' FFTW wisdom are sent
+    back by pickling. The wisdom is imported into this process, so that
+    plans made by the workers reach the wisdom store when the stage saves
+    it. The fields are updated in place and, as after a serial run, left
+    with FFT plans initialized.
+
+    Return False if stopped by stop, in which case the fields are not
+    updated.
+    """
+    threads = pair_threads(cfg.fft_threads)
+    shared = [base.SharedArray.from_array(f.psi) for f in fields]
+
+    ctx = mp.get_context('fork')
+    stop_workers = ctx.Event()
+    snapshots = ctx.SimpleQueue()
+
+    try:
+        # fork: the initializer arguments are inherited, not pickled
+        with ProcessPoolExecutor(
+                max_workers=len(fields), mp_context=ctx,
+                initializer=_init_worker, initargs=(stop_workers, snapshots, checkpoint)) as pool:
+            futures = [
+                pool.submit(
+                    _minimize_worker, s.spec(), f.metadata(), supplier, threads, cfg,
+                    name, label, phase, progress)
+                for f, s, name, label in zip(fields, shared, names, labels)
+            ]
+            while True:
+                done, _ = wait(futures, timeout=0.1)
+                if stop is not None and stop.is_set():
+                    stop_workers.set()
+                # a worker sends its last state before returning
+                while not snapshots.empty():
+                    _save_snapshot(checkpoint, snapshots.get())
+                if len(done) == len(futures):
+                    break
+            results = [fut.result() for fut in futures]
+
+        for _, _, wisdom in results:
+            pyfftw.import_wisdom(wisdom)
+
+        if stop_workers.is_set():
+            return False
+
+        for f, s, (lx, ly, _) in zip(fields, shared, results):
+            f.psi[...] = s.array
+            if (lx, ly) != (f.lx, f.ly):
+                f.set_size(lx, ly)
+            f.initialize_fft(threads=cfg.fft_threads, effort='FFTW_ESTIMATE')
+        return True
+    finally:
+        for s in shared:
+            s.unlink()
+
+
+def minimize_pair_phased(
+    field1: tg.RealField2D, field2: tg.RealField2D,
+    cfg: FieldConfig,
+    supplier: MinimizerSupplier,
+    supplier_for: Callable[[base.PhaseConfig], MinimizerSupplier], *,
+    names: Tuple[str, str],
+    labels: Tuple[str, str] = ('field 1', 'field 2'),
+    checkpoint: base.Checkpoint,
+    stop: Optional[threading.Event] = None,
+    progress: Optional[base.Progress] = None
+) -> bool:
+    """
+    minimize_pair() through the phases of cfg (on copies in the precision of
+    each phase, whose psi is promoted back after each phase), then with
+    supplier. Phases are checkpointed as in base.run_phases: a field skips
+    the phases it has completed.
+
+    Return False if stopped by stop.
+    """
+    console = rich.get_console()
+    fields = (field1, field2)
+
+    for k, phase in enumerate(cfg.phases):
+        todo: List[int] = [i for i, name in enumerate(names) if checkpoint.get(f'{name}.phase', 0) <= k]
+        if not todo:
+            continue
+
+        console.log(f'Phase {k+1}/{len(cfg.phases)+1}: precision={phase.precision} '
+                    f'tol={float(phase.tol):g}', highlight=False)
+
+        copies = [tg.change_precision(fields[i], phase.precision) for i in todo]
+        if not minimize_pair(
+                copies, supplier_for(phase), phase,
+                names=[names[i] for i in todo], labels=[labels[i] for i in todo],
+                checkpoint=checkpoint, phase=k, stop=stop, progress=progress):
+            return False
+
+        for i, c in zip(todo, copies):
+            fields[i].psi[...] = c.psi
+            checkpoint.advance(names[i], fields[i], k+1)
+
+    if cfg.phases:
+        console.log(f'Phase {len(cfg.phases)+1}/{len(cfg.phases)+1}: precision={field1.precision}',
+                    highlight=False)
+    return minimize_pair(
+            fields, supplier, cfg,
+            names=names, labels=labels, checkpoint=checkpoint,
+            phase=len(cfg.phases), stop=stop, progress=progress)
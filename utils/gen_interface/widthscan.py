@@ -0,0 +1,112 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+import multiprocessing as mp
+import numpy as np
+import torusgrid as tg
+import pfc_util as pfc
+import rich
+
+from .. import base
+
+
+_GRIDS_PER_WORKER = 10
+"""
+Rough number of full-size grids held by a worker while evaluating one width:
+its copies of the solid and liquid, the blended field and the temporaries of
+blend() and free_energy()
+"""
+
+
+_long_sol: Optional[tg.RealField2D] = None
+_long_liq: Optional[tg.RealField2D] = None
+_fef: Optional[pfc.pfc6.FreeEnergyFunctional] = None
+
+
+def _init_worker(
+    sol_psi: np.ndarray, sol_meta: dict,
+    liq_psi: np.ndarray, liq_meta: dict,
+    eps: tg.FloatLike, alpha: tg.FloatLike, beta: tg.FloatLike
+):
+    global _long_sol, _long_liq, _fef
+    _long_sol = tg.RealField2D.from_array(sol_psi, metadata=sol_meta)
+    _long_liq = tg.RealField2D.from_array(liq_psi, metadata=liq_meta)
+    _fef = pfc.pfc6.FreeEnergyFunctional(eps, alpha, beta)
+
+
+def _eval(
+    long_sol: tg.RealField2D, long_liq: tg.RealField2D,
+    fef: pfc.pfc6.FreeEnergyFunctional,
+    widths: List[tg.FloatLike]
+) -> List[Tuple[tg.FloatLike, tg.FloatLike]]:
+    res = []
+    for w in widths:
+        ifc = tg.blend(long_sol, long_liq, axis=0, interface_width=w)
+        res.append((w, fef.free_energy(ifc)))
+        del ifc
+    return res
+
+
+def _eval_widths(widths: List[tg.FloatLike]) -> List[Tuple[tg.FloatLike, tg.FloatLike]]:
+    assert _long_sol is not None and _long_liq is not None and _fef is not None
+    return _eval(_long_sol, _long_liq, _fef, widths)
+
+
+def scan_widths(
+    long_sol: tg.RealField2D, long_liq: tg.RealField2D,
+    widths: List[tg.FloatLike],
+    fef: pfc.pfc6.FreeEnergyFunctional, *,
+    workers: int = 1,
+    memory_limit: Optional[int] = None,
+    progress: Optional[base.Progress] = None
+) -> List[Tuple[tg.FloatLike, tg.FloatLike]]:
+    """
+    Evaluate the free energy of blend(long_sol, long_liq) for every width.
+
+    The widths are distributed over a process pool; each worker holds its
+    own copy of the solid and liquid and only sends back (width, F). The
+    number of workers is capped so that the estimated memory usage stays
+    below memory_limit (bytes); if even one worker does not fit, a warning
+    is logged and the widths are evaluated in this process. In headless mode
+    (progress given), each evaluated width is recorded as it arrives.
+
+    Return: a list of (width, F) in the same order as widths
+    """
+    bytes_per_worker = _GRIDS_PER_WORKER*long_sol.psi.nbytes
+    n = base.max_workers(
+            workers, n_tasks=len(widths),
+            bytes_per_worker=bytes_per_worker,
+            memory_limit=memory_limit)
+
+    if memory_limit is not None and memory_limit < bytes_per_worker:
+        rich.get_console().log(
+                f'warning: width_memory_limit ({memory_limit} bytes) is below the estimated usage '
+                f'of one worker ({bytes_per_worker} bytes), evaluating widths serially')
+
+    def record(res: List[Tuple[tg.FloatLike, tg.FloatLike]]):
+        if progress is not None:
+            for w, F in res:
+                progress.record('width', width=float(w), F=float(F))
+
+    if n == 1:
+        res = []
+        for w in widths:
+            res += _eval(long_sol, long_liq, fef, [w])
+            record(res[-1:])
+        return res
+
+    initargs = (long_sol.psi, long_sol.metadata(),
+                long_liq.psi, long_liq.metadata(),
+                fef.eps, fef.alpha, fef.beta)
+
+    chunks = [widths[i::n] for i in range(n)]
+
+    with ProcessPoolExecutor(
+            max_workers=n, mp_context=mp.get_context('fork'),
+            initializer=_init_worker, initargs=initargs) as pool:
+        results = dict()
+        for chunk_res in pool.map(_eval_widths, chunks):
+            record(chunk_res)
+            for w, F in chunk_res:
+                results[w] = F
+
+    return [(w, results[w]) for w in widths]
@@ -8,6 +8,7 @@ The root directory of data files
 
 INTERFACE_DATA_FILE = 'data.json'
 """
+Per-angle metadata written by gen_interface (na, nb)
 """
 
 
@@ -17,11 +18,112 @@ File storing gamma, width etc
 """
 
 
+CALC_CACHE_FILE = 'calc_cache.json'
+"""
+Per-interface calc results, used to skip unchanged interfaces
+"""
+
+
+RESULTS_FILE = 'results.sqlite'
+"""
+SQLite index of calc results and run metadata under DATA_DIR, see
+base.ResultStore
+"""
+
+
 INTERFACES_DIR = 'interfaces'
 """
 Directory storing the long interfaces
 """
 
 
+INTERFACE_INDEX_FILE = 'index.jsonl'
+"""
+Append-only index of the interfaces directory written by run_interface
+(one JSON entry per saved field)
+"""
+
+
+COMPLETE_FILE = 'complete.json'
+"""
+Marker written by run_interface into the interfaces directory once it
+stopped at lx_max (which it records), i.e. the series is complete
+"""
+
+
+SERIES_FILE = 'interfaces.series'
+"""
+Chunked, compressed container of the interfaces directory's fields when
+run_interface saves with field_format: series, see base.FieldSeries
+"""
+
+
+WISDOM_DIR = 'wisdom'
+"""
+FFTW wisdom store under DATA_DIR, keyed by host CPU, precision and threads
+"""
+
+
+PIPELINE_DIR = 'pipeline'
+"""
+Generated configs and logs of pipeline jobs under DATA_DIR, per sweep
+"""
+
+
+BENCH_DIR = 'bench'
+"""
+Benchmark results and baselines under DATA_DIR, per host CPU
+"""
+
+
+JOBS_DIR = 'jobs'
+"""
+Registry of running stages under DATA_DIR, one file per process, see
+base.Job
+"""
+
+
 RUNNING_FILE = '.running'
+"""
+Lease file of a directory being written to, see base.Lease
+"""
+
+
+CHECKPOINT_DIR = '.checkpoint'
+"""
+Directory next to RUNNING_FILE holding the progress of an interrupted run,
+see base.Checkpoint
+"""
+
+
+PROGRESS_FILE = 'progress.jsonl'
+"""
+Progress records (one JSON object per line) of a stage run with --headless,
+in the directory it writes to
+"""
+
+
+TIMINGS_FILE = 'timings.json'
+"""
+Timers, counters and peak RSS of the last run of each stage writing to a
+directory, see base.Timings
+"""
+
+
+PROGRESS_INTERVAL = 10.
+"""
+Minimum seconds between two progress records of the same evolution
+"""
+
+
+JOB_HEARTBEAT_INTERVAL = 10.
+"""
+Seconds between two updates of a job's registry entry
+"""
+
+
+LEASE_TTL = 120.
+"""
+Seconds without heartbeat after which a lease is stale and can be taken over
+"""
 
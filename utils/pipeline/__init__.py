@@ -0,0 +1,3 @@
+from .main import run
+from .config import parse_sweep
+from .dag import build_jobs
@@ -0,0 +1,88 @@
+from typing import Any, Dict, List, Optional, Tuple
+from pathlib import Path
+import os
+import yaml
+
+from .. import base
+
+
+STAGES = ['uc', 'gi', 'ri', 'cg', 'cw']
+"""
+Pipeline stages in dependency order, named as the commands of main.py
+"""
+
+
+TEMPLATE_KEYS = dict(uc='unit_cell', gi='gen_interface', ri='run_interface', cg='calc', cw='calc')
+"""
+Key under `configs` of the config template used by each stage
+"""
+
+
+_STAGE_ALIASES = dict(
+    unit_cell='uc', gen_interface='gi', run_interface='ri',
+    calc_gamma='cg', calc_width='cw')
+
+
+def _as_list(x) -> list:
+    return x if isinstance(x, list) else [x]
+
+
+def _load_template(template) -> Dict[str, Any]:
+    """
+    A config template given either inline or as the path of a config file
+    """
+    if isinstance(template, dict):
+        return template
+    with open(str(template), 'r') as f:
+        return yaml.safe_load(f)
+
+
+class SweepConfig:
+    """
+    A parameter sweep: every combination of shape, eps, alpha, beta and angle
+    in `grid` is run through `stages`, each stage using its config template
+    from `configs` with the grid values filled in.
+
+    cores, memory: budget of the local scheduler (default: all CPUs, no
+    memory limit)
+    """
+    def __init__(self, config: dict, name: str):
+        self.name = str(config.get('name', name))
+
+        cores = int(config.get('cores', 0))
+        self.cores = cores if cores > 0 else (os.cpu_count() or 1)
+        self.memory: Optional[int] = base.parse_bytes(config.get('memory', None))
+
+        self.stages: List[str] = []
+        for stage in _as_list(config.get('stages', STAGES)):
+            stage = _STAGE_ALIASES.get(str(stage), str(stage))
+            if stage not in STAGES:
+                raise ValueError(f'Unknown stage {stage}, expected one of {STAGES}')
+            self.stages.append(stage)
+
+        grid = config['grid']
+        self.shapes: List[Tuple[int, int]] = [(int(nx), int(ny)) for nx, ny in grid['shape']]
+        self.eps: List[str] = [str(x) for x in _as_list(grid['eps'])]
+        self.alpha: List[str] = [str(x) for x in _as_list(grid['alpha'])]
+        self.beta: List[str] = [str(x) for x in _as_list(grid['beta'])]
+        self.angles: List[Tuple[int, int]] = [(int(na), int(nb)) for na, nb in grid.get('angle', [])]
+
+        if self.angles == [] and any(stage != 'uc' for stage in self.stages):
+            raise ValueError('grid.angle is required by stages other than uc')
+
+        self.templates: Dict[str, Dict[str, Any]] = {}
+        for stage in self.stages:
+            key = TEMPLATE_KEYS[stage]
+            if key not in self.templates.keys():
+                self.templates[key] = _load_template(config['configs'][key])
+
+        ri = self.templates.get('run_interface', None)
+        if ri is not None and float(ri.get('lx_max', 'inf')) == float('inf'):
+            raise ValueError('The run_interface template needs a finite lx_max, '
+                             'run_interface is only complete once it is reached')
+
+
+def parse_sweep(path: str) -> SweepConfig:
+    with open(path, 'r') as f:
+        config = yaml.safe_load(f)
+    return SweepConfig(config, Path(path).stem)
@@ -0,0 +1,280 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+from pathlib import Path
+import copy
+import itertools
+import numpy as np
+import torusgrid as tg
+import pfc_util as pfc
+
+from .config import SweepConfig, TEMPLATE_KEYS
+
+from .. import base
+from .. import global_cfg as G
+from .. import run_interface
+from .. import unit_cell
+
+
+_ARRAYS_PER_FIELD = 24
+"""
+Rough number of field-sized real arrays held by a minimizer (psi, its
+transform, RK4 stages, kernels and FFTW buffers), used to estimate memory
+"""
+
+_PROCESS_OVERHEAD = 300 * 1024**2
+"""
+Memory of an idle stage process (interpreter, numpy, pyfftw, ...)
+"""
+
+
+def _unit_cell_size(job: Job) -> Tuple[float, float]:
+    """
+    lx, ly of the unit cell gen_interface rotates for job: from the header
+    of unit_sol.field if unit_cell already ran, otherwise from the source
+    field of the unit_cell job of the sweep, which keeps its size
+    """
+    path = f'{job.pfc_dir}/unit_sol.field'
+    if Path(path).exists():
+        header = base.read_field_header(path)
+        return float(header['lx']), float(header['ly'])
+
+    uc = _upstream(job, 'uc')
+    if uc is None:
+        raise FileNotFoundError(f'{path} does not exist and the sweep has no uc stage for {job.name}')
+    if uc.source_size is None:
+        source = unit_cell.config.UnitCellSimulationConfig(uc.config).source_field
+        uc.source_size = float(source.lx), float(source.ly)
+    return uc.source_size
+
+
+def _rotated_cell(job: Job) -> Tuple[Tuple[int, int], float]:
+    """
+    Shape and lx of the rotated unit cell of job: from the header of
+    solid.field if gen_interface already ran, otherwise by rotating an empty
+    unit cell of the same size and shape as gen_interface does
+    (UnitCellRotator with SNAP)
+    """
+    path = f'{job.dir}/solid.field'
+    if Path(path).exists():
+        header = base.read_field_header(path)
+        return tuple(header['shape']), float(header['lx']) # type: ignore
+
+    lx, ly = _unit_cell_size(job)
+    cell = tg.RealField2D(lx, ly, int(job.config['nx']), int(job.config['ny']))
+    rotated = pfc.toolkit.UnitCellRotator(int(job.config['na']), int(job.config['nb']))(cell, pfc.toolkit.SNAP)
+    return rotated.shape, float(rotated.lx)
+
+
+def _upstream(job: Job, stage: str) -> Optional[Job]:
+    for dep in job.deps:
+        if dep.stage == stage:
+            return dep
+        found = _upstream(dep, stage)
+        if found is not None:
+            return found
+    return None
+
+
+def _field_bytes(points: int, precision) -> int:
+    return int(points) * np.dtype(tg.get_real_dtype(precision)).itemsize * _ARRAYS_PER_FIELD
+
+
+class Job:
+    """
+    One stage run on one point of the sweep grid, i.e. one main.py command
+    with a generated config file.
+
+    cores, memory and cost are estimates used by the scheduler: cost is the
+    number of grid points summed over the fields the stage minimizes, and
+    priority adds the highest priority among the jobs that depend on this
+    one, so that long chains are started first.
+    """
+    def __init__(self, stage: str, config: Dict[str, Any], deps: List[Job]):
+        self.stage = stage
+        self.config = config
+        self.deps = deps
+        self.dependents: List[Job] = []
+        for dep in deps:
+            dep.dependents.append(self)
+
+        nx, ny = int(config['nx']), int(config['ny'])
+        eps, alpha, beta = str(config['eps']), str(config['alpha']), str(config['beta'])
+        if stage == 'uc':
+            self.prefix = base.get_path(nx, ny, eps, alpha, beta)
+        else:
+            self.prefix = base.get_path(nx, ny, eps, alpha, beta, int(config['na']), int(config['nb']))
+
+        self.dir = f'{G.DATA_DIR}/{self.prefix}'
+        self.name = f'{stage}:{self.prefix}'
+
+        self.source_size: Optional[Tuple[float, float]] = None
+        """
+        lx, ly of the source field of a uc job, once needed by an estimate
+        """
+
+        self.cores, self.memory, self.cost = _ESTIMATES[stage](self)
+        self.priority = self.cost
+
+        self.state = 'pending'
+
+    @property
+    def pfc_dir(self) -> str:
+        return str(Path(self.dir).parent) if self.stage != 'uc' else self.dir
+
+    @property
+    def lease_dir(self) -> Optional[str]:
+        """
+        The directory the stage holds a lease on, if any
+        """
+        if self.stage == 'ri':
+            return f'{self.dir}/{G.INTERFACES_DIR}'
+        if self.stage in ['uc', 'gi']:
+            return self.dir
+        return None
+
+    def done(self) -> bool:
+        """
+        Whether the outputs of the job already exist
+        """
+        return _DONE[self.stage](self)
+
+
+def _uc_done(job: Job) -> bool:
+    return all(Path(f'{job.pfc_dir}/{name}').exists()
+               for name in ['log.pkl', 'unit_sol.field', 'unit_liq.field'])
+
+
+def _gi_done(job: Job) -> bool:
+    return (base.json_has_key(f'{job.dir}/{G.INTERFACE_DATA_FILE}', 'nb')
+            and Path(f'{job.dir}/interface.field').exists())
+
+
+def _ri_done(job: Job) -> bool:
+    if not _gi_done(job):
+        return False
+    return run_interface.is_complete(run_interface.config.InterfaceRunConfig(job.config))
+
+
+def _calc_done(key: str):
+    def done(job: Job) -> bool:
+        calc_file = Path(f'{job.dir}/{G.CALC_FILE}')
+        index_file = Path(f'{job.dir}/{G.INTERFACES_DIR}/{G.INTERFACE_INDEX_FILE}')
+        if not base.json_has_key(str(calc_file), key):
+            return False
+        return not index_file.exists() or calc_file.stat().st_mtime >= index_file.stat().st_mtime
+    return done
+
+
+_DONE = dict(uc=_uc_done, gi=_gi_done, ri=_ri_done, cg=_calc_done('gamma'), cw=_calc_done('widths'))
+
+
+def _uc_estimate(job: Job) -> Tuple[int, int, int]:
+    runs = job.config['runs']
+    points = int(job.config['nx']) * int(job.config['ny'])
+    cores = max(int(run['fft_threads']) for run in runs)
+    memory = max(_field_bytes(points, run['precision']) for run in runs)
+    return cores, memory + _PROCESS_OVERHEAD, points * len(runs)
+
+
+def _long_shape(job: Job) -> Tuple[int, int]:
+    (nxr, nyr), _ = _rotated_cell(job)
+    return nxr * int(job.config['long']['mx']), nyr * int(job.config['long']['my'])
+
+
+def _gi_estimate(job: Job) -> Tuple[int, int, int]:
+    long = job.config['long']
+    nx, ny = _long_shape(job)
+    widths = len(long['width']) if isinstance(long['width'], list) else 1
+    workers = min(int(long.get('width_workers', 1)), widths)
+
+    precision = long.get('precision', job.config['precision'])
+    cores = max(int(job.config['base']['fft_threads']), int(long['fft_threads']), workers)
+    memory = _field_bytes(nx*ny, precision) * max(workers, 1)
+    return cores, memory + _PROCESS_OVERHEAD, nx * ny * (widths + 3)
+
+
+def _ri_estimate(job: Job) -> Tuple[int, int, int]:
+    gi = job.deps[0] if job.deps else None
+    (nxr, nyr), lxr = _rotated_cell(job)
+    nx0, ny = _long_shape(gi) if gi is not None else (nxr * int(job.config['mx']), nyr)
+    dnx = 2 * int(job.config['mx_delta']) * 2 * nxr
+
+    count = job.config.get('max_interfaces', None)
+    n = int(count) if count is not None else None
+    lx_max = job.config.get('lx_max', None)
+    if lx_max is not None and float(lx_max) < np.inf:
+        dx = lxr / nxr
+        n_lx = max(int((float(lx_max) / dx - nx0) // dnx) + 1, 0)
+        n = n_lx if n is None else min(n, n_lx)
+    assert n is not None
+
+    nx_last = nx0 + max(n-1, 0) * dnx
+    memory = _field_bytes(nx_last * ny, job.config['precision'])
+    cost = sum((nx0 + k*dnx) * ny for k in range(n))
+    return int(job.config['fft_threads']), memory + _PROCESS_OVERHEAD, cost
+
+
+def _calc_estimate(job: Job) -> Tuple[int, int, int]:
+    ri = job.deps[0] if job.deps and job.deps[0].stage == 'ri' else None
+    cores = int(job.config.get('fft_threads', 1))
+    if ri is None:
+        return cores, _PROCESS_OVERHEAD, 0
+    # one field at a time, a fraction of run_interface's work
+    return cores, ri.memory // _ARRAYS_PER_FIELD * 4 + _PROCESS_OVERHEAD, ri.cost // 100
+
+
+_ESTIMATES = dict(uc=_uc_estimate, gi=_gi_estimate, ri=_ri_estimate, cg=_calc_estimate, cw=_calc_estimate)
+
+
+def _fill(template: Dict[str, Any], **values) -> Dict[str, Any]:
+    config = copy.deepcopy(template)
+    config.update(values)
+    return config
+
+
+def build_jobs(S: SweepConfig) -> List[Job]:
+    """
+    Expand the sweep into jobs, in dependency order (every job comes after
+    its dependencies), with priorities propagated along the DAG
+    """
+    jobs: List[Job] = []
+
+    for (nx, ny), eps, alpha, beta in itertools.product(S.shapes, S.eps, S.alpha, S.beta):
+        params = dict(nx=nx, ny=ny, eps=eps, alpha=alpha, beta=beta)
+
+        uc = None
+        if 'uc' in S.stages:
+            uc = Job('uc', _fill(S.templates['unit_cell'], **params), [])
+            jobs.append(uc)
+
+        for na, nb in S.angles:
+            prev: Dict[str, Job] = {}
+            if uc is not None:
+                prev['uc'] = uc
+
+            for stage in S.stages:
+                if stage == 'uc':
+                    continue
+
+                deps = [prev[s] for s in _UPSTREAM[stage] if s in prev.keys()]
+                job = Job(stage, _fill(S.templates[TEMPLATE_KEYS[stage]], **params, na=na, nb=nb), deps)
+                jobs.append(job)
+                prev[stage] = job
+
+    for job in reversed(jobs):
+        if job.dependents:
+            job.priority = job.cost + max(d.priority for d in job.dependents)
+
+    return jobs
+
+
+_UPSTREAM = dict(
+    gi=['uc'],
+    ri=['gi'],
+    cg=['ri'],
+    # calc_gamma and calc_width both write calc.json and calc_cache.json
+    cw=['ri', 'cg'],
+)
+"""
+Stages each stage depends on, if present in the sweep
+"""
@@ -0,0 +1,157 @@
+from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+import subprocess
+import sys
+import time
+import yaml
+
+import rich
+
+from .config import SweepConfig, parse_sweep
+from .dag import Job, build_jobs
+
+from .. import base
+from .. import global_cfg as G
+
+
+MAIN_SCRIPT = str(Path(__file__).resolve().parents[2] / 'main.py')
+
+
+def _fmt_bytes(n: int) -> str:
+    return f'{n / 1024**3:.1f}G'
+
+
+def job_file(S: SweepConfig, job: Job, suffix: str) -> str:
+    """
+    Generated config (.yaml) or output log (.log) of a job
+    """
+    return f'{G.DATA_DIR}/{G.PIPELINE_DIR}/{S.name}/{job.prefix}/{job.stage}{suffix}'
+
+
+def _cancel_dependents(job: Job, console):
+    for d in job.dependents:
+        if d.state == 'pending':
+            d.state = 'cancelled'
+            console.log(f'{d.name} cancelled ({job.name} {job.state})', highlight=False)
+            _cancel_dependents(d, console)
+
+
+def _start(S: SweepConfig, job: Job) -> Tuple[subprocess.Popen, object]:
+    config_file = job_file(S, job, '.yaml')
+    Path(config_file).parent.mkdir(parents=True, exist_ok=True)
+    with open(config_file, 'w') as f:
+        yaml.safe_dump(job.config, f, sort_keys=False)
+
+    log = open(job_file(S, job, '.log'), 'w')
+    proc = subprocess.Popen(
+            [sys.executable, MAIN_SCRIPT, job.stage, '-c', config_file, '--headless'],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+    return proc, log
+
+
+def run(sweep_path: str, *, cores: Optional[int] = None, memory: Optional[int] = None, dry: bool = False):
+    """
+    Run every job of a sweep whose outputs do not exist yet. Ready jobs (all
+    dependencies finished) are started by decreasing priority as long as
+    their estimated cores and memory fit in the budget; a job that does not
+    fit is only started once nothing else is running.
+    """
+    console = rich.get_console()
+
+    S = parse_sweep(sweep_path)
+    if cores is not None:
+        S.cores = cores
+    if memory is not None:
+        S.memory = memory
+
+    jobs = build_jobs(S)
+
+    for job in jobs:
+        if job.done():
+            job.state = 'done'
+
+    todo = [job for job in jobs if job.state == 'pending']
+    console.log(f'Sweep {S.name}: {len(jobs)} jobs, {len(jobs)-len(todo)} with existing outputs, '
+                f'budget {S.cores} cores, '
+                f'{"no memory limit" if S.memory is None else _fmt_bytes(S.memory)}', highlight=False)
+
+    if dry:
+        for job in sorted(todo, key=lambda j: -j.priority):
+            deps = ', '.join(d.name for d in job.deps if d.state != 'done')
+            console.log(f'{job.name} cores={job.cores} memory={_fmt_bytes(job.memory)} '
+                        f'priority={job.priority}' + (f' after {deps}' if deps else ''), highlight=False)
+        return
+
+    running: Dict[Job, Tuple[subprocess.Popen, object]] = {}
+
+    try:
+        while True:
+            for job, (proc, log) in list(running.items()):
+                code = proc.poll()
+                if code is None:
+                    continue
+                log.close() # type: ignore
+                del running[job]
+
+                if code != 0:
+                    job.state = 'failed'
+                    console.log(f'{job.name} failed with exit code {code}, see {job_file(S, job, ".log")}',
+                                style='bold red', highlight=False)
+                elif job.stage in ['uc', 'gi', 'ri'] and not job.done():
+                    job.state = 'failed'
+                    console.log(f'{job.name} exited without producing its outputs, see {job_file(S, job, ".log")}',
+                                style='bold red', highlight=False)
+                else:
+                    job.state = 'done'
+                    console.log(f'{job.name} done', highlight=False)
+
+                if job.state == 'failed':
+                    _cancel_dependents(job, console)
+
+            ready = [job for job in jobs
+                     if job.state == 'pending' and all(d.state == 'done' for d in job.deps)]
+            ready.sort(key=lambda j: -j.priority)
+
+            if not ready and not running:
+                break
+
+            used_cores = sum(job.cores for job in running.keys())
+            used_memory = sum(job.memory for job in running.keys())
+
+            for job in ready:
+                fits = (used_cores + job.cores <= S.cores
+                        and (S.memory is None or used_memory + job.memory <= S.memory))
+                if not fits and running:
+                    continue
+
+                if job.lease_dir is not None and base.is_leased(job.lease_dir):
+                    job.state = 'busy'
+                    console.log(f'{job.name} is occupied by another process, skipped', highlight=False)
+                    _cancel_dependents(job, console)
+                    continue
+
+                console.log(f'starting {job.name} (cores={job.cores}, memory={_fmt_bytes(job.memory)})',
+                            highlight=False)
+                running[job] = _start(S, job)
+                job.state = 'running'
+                used_cores += job.cores
+                used_memory += job.memory
+
+            time.sleep(0.5)
+
+    finally:
+        for job, (proc, log) in running.items():
+            console.log(f'terminating {job.name}', highlight=False)
+            proc.terminate()
+        for job, (proc, log) in running.items():
+            proc.wait()
+            log.close() # type: ignore
+
+    states: Dict[str, List[str]] = {}
+    for job in jobs:
+        states.setdefault(job.state, []).append(job.name)
+    for state, names in states.items():
+        console.log(f'{len(names)} {state}', highlight=False)
+        if state in ['failed', 'cancelled', 'busy']:
+            for name in names:
+                console.print('    ' + name, highlight=False)
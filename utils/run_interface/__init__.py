@@ -1 +1,2 @@
-from .main import run
+from .main import run, fft_shapes, is_complete
+from .config import parse_config
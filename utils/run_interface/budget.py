@@ -0,0 +1,71 @@
+from typing import Optional
+from pathlib import Path
+import time
+
+import torusgrid as tg
+
+from .config import InterfaceRunConfig
+
+
+def dir_size(path: str) -> int:
+    """
+    Total size in bytes of the files directly under path
+    """
+    return sum(p.stat().st_size for p in Path(path).iterdir() if p.is_file())
+
+
+class RunBudget:
+    """
+    Stopping conditions of run_interface, checked before each interface is
+    evolved:
+
+        - lx_max: the interface to be evolved is longer than lx_max
+        - max_interfaces: the interfaces directory holds max_interfaces fields
+        - walltime: the next interface is not expected to finish in time,
+          estimating its duration by that of the previous one
+        - disk_limit: saving the next interface would exceed the disk usage
+          cap of the interfaces directory
+    """
+    def __init__(self, C: InterfaceRunConfig):
+        self.lx_max = C.lx_max_
+        self.max_interfaces = C.max_interfaces
+        self.walltime = C.walltime
+        self.disk_limit = C.disk_limit
+
+        self.t_start = time.monotonic()
+        self.last_duration = 0.
+
+    def reached_lx_max(self, ifc: tg.RealField2D) -> bool:
+        """
+        Whether ifc is longer than lx_max, the only condition under which the
+        run is complete rather than interrupted
+        """
+        return self.lx_max is not None and ifc.lx > self.lx_max
+
+    def exceeded(
+        self, i: int, ifc: tg.RealField2D, savedir: str, *,
+        pending_bytes: int = 0
+    ) -> Optional[str]:
+        """
+        Return why the run should stop before evolving interface i, or None.
+        pending_bytes is the size of fields queued for saving but not yet on
+        disk.
+        """
+        if self.max_interfaces is not None and i >= self.max_interfaces:
+            return f'reached max_interfaces={self.max_interfaces}'
+
+        if self.reached_lx_max(ifc):
+            return f'Lx={ifc.lx:.5f} exceeds lx_max={self.lx_max}'
+
+        if self.walltime is not None:
+            elapsed = time.monotonic() - self.t_start
+            if elapsed + self.last_duration > self.walltime:
+                return (f'next interface would exceed walltime={self.walltime:.0f}s '
+                        f'(elapsed {elapsed:.0f}s, last interface took {self.last_duration:.0f}s)')
+
+        if self.disk_limit is not None and Path(savedir).exists():
+            used = dir_size(savedir) + pending_bytes
+            if used + ifc.psi.nbytes > self.disk_limit:
+                return f'saving would exceed disk_limit={self.disk_limit} bytes (used {used})'
+
+        return None
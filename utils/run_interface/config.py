@@ -4,6 +4,9 @@ import yaml
 
 
 class InterfaceRunConfig(
+    base.SpecifiesCheckpoints,
+    base.SpecifiesPrecisionSchedule,
+    base.SpecifiesAdaptiveTimeStep,
     base.SpecifiesInertia,
     base.SpecifiesKRegularizer,
     base.SpecifiesFFTWisdoms,
@@ -14,6 +17,10 @@ class InterfaceRunConfig(
     base.SpecifiesPrecision,
     base.ConfigBase
 ):
+    # budgets and I/O settings can change between runs of the same series
+    checkpoint_ignore = ('checkpoint_interval', 'lx_max', 'max_interfaces', 'walltime', 'disk_limit',
+                         'max_pending_saves', 'fft_preplan', 'field_format')
+
     def __init__(self, config: dict):
         super().__init__(config)
 
@@ -21,6 +28,18 @@ class InterfaceRunConfig(
         self.mx = int(config['mx'])
         self.my = int(config['my'])
 
+        self.field_format: base.FieldFormat = config.get('field_format', 'npz')
+        self.max_pending_saves = int(config.get('max_pending_saves', 1))
+
+        self.fft_preplan = int(config.get('fft_preplan', 2))
+
+        lx_max = config.get('lx_max', None)
+        self.lx_max_ = None if lx_max is None else self.to_float(str(lx_max))
+        max_interfaces = config.get('max_interfaces', None)
+        self.max_interfaces = None if max_interfaces is None else int(max_interfaces)
+        self.walltime = base.parse_duration(config.get('walltime', None))
+        self.disk_limit = base.parse_bytes(config.get('disk_limit', None))
+
         self.eps_ = self.to_float(self.eps)
         self.alpha_ = self.to_float(self.alpha)
         self.beta_ = self.to_float(self.beta)
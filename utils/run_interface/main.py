@@ -4,10 +4,18 @@ import pfc_util as pfc
 import rich
 import pyfftw
 from pathlib import Path
+from typing import List, Tuple, Union
+from contextlib import nullcontext
+from functools import partial
+import json
 import shutil
+import threading
+import time
 import os
 
 from .config import InterfaceRunConfig, parse_config
+from .writer import FieldWriter
+from .budget import RunBudget
 
 from .. import global_cfg as G
 
@@ -22,42 +30,126 @@ def run(config_path: str, CC: CommandLineConfig):
 
     savedir = C.file_path('interfaces')
 
-    if CC.overwrite:
-        console.input(f'[bold red]Passing --overwrite will erase all data under {savedir}, proceed?[/bold red]')
-        shutil.rmtree(savedir)
-        Path(savedir).mkdir()
-    
-    _running_marker = Path(savedir + '/' + G.RUNNING_FILE)
-    
-    if _running_marker.exists():
-        console.log(f'{str(_running_marker)} is already occupied by another process. Aborted.', style='bold red')
+    stop = threading.Event()
+    lost = threading.Event()
+
+    def on_lease_lost():
+        console.log(f'Lease on {savedir} lost, stopping after the current step without saving',
+                    style='bold red', highlight=False)
+        lost.set()
+        stop.set()
+
+    lease = base.Lease(savedir, on_lost=on_lease_lost)
+
+    acquired = not base.is_leased(savedir) if CC.dry else lease.acquire()
+
+    if not acquired:
+        console.log(f'{savedir} is already occupied by {base.describe_lease(base.read_lease(savedir))}. Aborted.',
+                    style='bold red', highlight=False)
         return
 
+    timings = base.get_timings()
+    timings.reset('run_interface')
+
+    job = base.get_job()
     if not CC.dry:
-        Path(savedir).mkdir(parents=True, exist_ok=True)
-        # base.check_dir_empty(savedir, overwrite=CC.overwrite)
+        job.start('run_interface', savedir)
 
     try:
-        if not CC.dry:
-            _running_marker.touch()
-        _run(C, CC)
+        with base.stop_on_sigterm(stop):
+            if CC.overwrite:
+                if CC.headless:
+                    console.log(f'Erasing all data under {savedir}', style='bold red', highlight=False)
+                else:
+                    console.input(f'[bold red]Passing --overwrite will erase all data under {savedir}, proceed?[/bold red]')
+                for p in Path(savedir).iterdir():
+                    if p.name == G.RUNNING_FILE:
+                        continue
+                    if p.is_dir():
+                        shutil.rmtree(p)
+                    else:
+                        os.remove(p)
+
+            _run(C, CC, stop, lost)
     finally:
-        if not CC.dry:
-            os.remove(_running_marker)
+        if not CC.dry and not lost.is_set():
+            timings.save(savedir, G.TIMINGS_FILE)
+        job.stop()
+        lease.release()
+
+
+def fft_shapes(C: InterfaceRunConfig, count: int) -> List[Tuple[Tuple[int, int], tg.PrecisionLike, int]]:
+    """
+    (shape, precision, threads) of the minimizers of the next count
+    interfaces (fewer if lx_max or max_interfaces is reached first)
+    """
+    angle = C.file_path('angle')
+    solid = base.read_field_header(f'{angle}/solid.field')
+    liquid = base.read_field_header(f'{angle}/liquid.field')
+    dnx = 2 * C.mx_delta * (solid['shape'][0] + liquid['shape'][0])
+
+    ifc_loaders = base.get_interface_list(f'{angle}/{G.INTERFACES_DIR}')
+    if ifc_loaders:
+        last = base.read_field_header(ifc_loaders[-1].path)
+        nx, ny = last['shape'][0] + dnx, last['shape'][1]
+    else:
+        last = base.read_field_header(f'{angle}/interface.field')
+        nx, ny = last['shape']
+    dx = last['lx'] / last['shape'][0]
 
+    if C.max_interfaces is not None:
+        count = min(count, C.max_interfaces - len(ifc_loaders))
 
-def _run(C: InterfaceRunConfig, CC: CommandLineConfig):
+    shapes = []
+    for k in range(count):
+        shape = (nx + k*dnx, ny)
+        if C.lx_max_ is not None and shape[0] * dx > C.lx_max_:
+            break
+        shapes += [(shape, phase.precision, phase.fft_threads) for phase in C.phases]
+        shapes.append((shape, C.precision, C.fft_threads))
+    return shapes
+
+
+def is_complete(C: InterfaceRunConfig) -> bool:
+    """
+    Whether a previous run stopped at lx_max (or a larger one), see
+    G.COMPLETE_FILE. Runs stopped by any other budget or by SIGTERM are not
+    complete.
+    """
+    path = Path(C.file_path('interfaces')) / G.COMPLETE_FILE
+    if C.lx_max_ is None or not path.exists():
+        return False
+    with open(path, 'r') as f:
+        info = json.load(f)
+    return float(info['lx_max']) >= float(C.lx_max_)
+
+
+def _run(C: InterfaceRunConfig, CC: CommandLineConfig,
+         stop: threading.Event, lost: threading.Event):
+    """
+    Evolve and elongate the interface until a budget in C is exhausted or
+    stop is set. An interface interrupted by stop is not saved, but its
+    minimizer state is checkpointed (if enabled) and resumed by the next run.
+    Once lost is set (the lease was lost), nothing is written anymore: the
+    checkpoint is left as is and fields queued for saving are dropped.
+    """
 
     console = rich.get_console()
+    timings = base.get_timings()
+    budget = RunBudget(C)
+
+    timings.begin('setup')
 
+    plans = base.FFTPlanCache(base.get_store(C.wisdom_store),
+                              precision=None if C.phases else C.precision)
     for wisdom in C.fftw_wisdoms:
         pyfftw.import_wisdom(wisdom)
 
     console.log(f'Saving directory: {C.file_path("angle")}')
 
-    ifc = tg.load(tg.RealField2D, f'{C.file_path("angle")}/interface.field')
-    solid = tg.load(tg.RealField2D, f'{C.file_path("angle")}/solid.field')
-    liquid = tg.load(tg.RealField2D, f'{C.file_path("angle")}/liquid.field')
+    ifc = base.load_field(f'{C.file_path("angle")}/interface.field', mmap=False)
+    solid = base.load_field(f'{C.file_path("angle")}/solid.field', mmap=False)
+    liquid = base.load_field(f'{C.file_path("angle")}/liquid.field', mmap=False)
 
     delta_sol = tg.extend(solid, (C.mx_delta, C.my))
     delta_liq = tg.extend(liquid, (C.mx_delta, C.my))
@@ -69,15 +161,35 @@ def _run(C: InterfaceRunConfig, CC: CommandLineConfig):
 
     n_ifcs = len(ifc_loaders)
     i = n_ifcs
+
+    ckpt = base.Checkpoint(savedir, interval=None if CC.dry else C.checkpoint_interval,
+                           config=C.config_hash, overwrite=CC.overwrite, lost=lost)
+
+    complete_file = Path(savedir) / G.COMPLETE_FILE
+    if not CC.dry and complete_file.exists():
+        # rewritten below if this run stops at lx_max again
+        os.remove(complete_file)
+    complete = False
     
     if n_ifcs > 0:
         console.log(f'continuing in {C.file_path("interfaces")}, found {n_ifcs} interface fields')
-        ifc = ifc_loaders[-1]()
-        ifc = pfc.toolkit.elongate_interface(ifc, delta_sol, delta_liq)
+        ifc = base.load_field(ifc_loaders[-1].path, mmap=False)
+        with timings.timer('elongate'):
+            ifc = pfc.toolkit.elongate_interface(ifc, delta_sol, delta_liq)
     else:
         console.log(f'No previous interfaces found, starting fresh')
 
+    dnx = 2 * (delta_sol.nx + delta_liq.nx)
+
+    # the final minimizer of the interface being evolved, whose F and psibar
+    # are recorded in the index
+    final = {}
+
     def minim_supplier(field: tg.RealField2D):
+        plans.plan_minimizer(field.shape, C.precision, C.fft_threads)
+        for k in range(1, C.fft_preplan+1):
+            plans.plan_minimizer((field.nx + k*dnx, field.ny), C.precision, C.fft_threads, background=True)
+
         m = pfc.pfc6.NonlocalConservedRK4(
                 field, 
                 C.dt, C.eps_, C.alpha_, C.beta_,
@@ -87,39 +199,118 @@ def _run(C: InterfaceRunConfig, CC: CommandLineConfig):
                 threads=C.fft_threads,
                 wisdom_only=C.wisdom_only,
                 destroy_input=True)
+
+        ckpt.restore('interface', m, phase=len(C.phases))
+        final['minimizer'] = m
         return m
 
-    hooks = pfc.toolkit.get_pfc_hooks(
-        state_function_cls=pfc.pfc6.StateFunction,
-        display_digits=-round(np.log10(C.tol)),
-        extra_display_digits=2,
-        title_params=['eps', 'alpha', 'beta', 'R', 'M', 'dt'],
-        display_params=['Lx', 'Ly', 'psibar', 'f', 'F'],
-        refresh_interval=C.refresh_interval,
-        detect_slow=(C.target, C.tol, C.patience),
-        fps=C.fps
-    )
-
-    while True:
-        console.rule()
-        console.log(f'Evolving interface {i}')
-        console.log(f'size={ifc.size} shape={ifc.shape}')
-
-        ifc2 = pfc.toolkit.evolve_and_elongate_interface(
-            ifc, delta_sol, delta_liq,     
-            minimizer_supplier=minim_supplier,
-            n_steps=C.n_steps, hooks=hooks,
-            verbose=True
-        )
-
-        console.log(f'evolved size={ifc.size} shape={ifc.shape}')
-        console.log(f'elongated to size={ifc2.size} shape={ifc2.shape}')
-
-        if not CC.dry:
-            field_path = f'{C.file_path("interfaces")}/{i:04d}.field'
-            tg.save(ifc, field_path)
-            console.log(f'saved interface to {field_path}')
-
-        ifc = ifc2
-        i += 1
+    def phase_supplier(field: tg.RealField2D, phase: base.PhaseConfig):
+        plans.plan_minimizer(field.shape, phase.precision, phase.fft_threads)
+        m = pfc.pfc6.NonlocalConservedRK4(
+                field,
+                phase.dt, phase.to_float(C.eps), phase.to_float(C.alpha), phase.to_float(C.beta),
+                inertia=phase.to_float(C.inertia), k_regularizer=phase.to_float(C.k_regularizer))
+
+        m.initialize_fft(
+                threads=phase.fft_threads,
+                wisdom_only=phase.wisdom_only,
+                destroy_input=True)
+        return m
+
+    progress = base.get_progress(CC, savedir)
+
+    def get_hooks(cfg: Union[base.PhaseConfig, InterfaceRunConfig], interface: int):
+        hooks = base.get_pfc_hooks(
+            progress, label='interface', state=dict(interface=interface),
+            state_function_cls=pfc.pfc6.StateFunction,
+            display_digits=-round(np.log10(cfg.tol)),
+            extra_display_digits=2,
+            title_params=['eps', 'alpha', 'beta', 'R', 'M', 'dt'],
+            display_params=['Lx', 'Ly', 'psibar', 'f', 'F'],
+            refresh_interval=cfg.refresh_interval,
+            detect_slow=(cfg.target, cfg.tol, cfg.patience),
+            fps=cfg.fps
+        ) + base.StopOnEvent(stop)
+        return base.with_adaptive_dt(hooks, cfg)
+
+    writer = None if CC.dry else FieldWriter(
+            C.file_path('interfaces'), C.field_format,
+            max_pending=C.max_pending_saves, lost=lost)
+
+    with plans, writer or nullcontext():
+        while True:
+            if writer is not None:
+                writer.check()
+
+            reason = budget.exceeded(
+                    i, ifc, savedir,
+                    pending_bytes=0 if writer is None else writer.pending_bytes)
+            if reason is not None:
+                console.log(f'Stopping: {reason}', highlight=False)
+                complete = budget.reached_lx_max(ifc)
+                break
+
+            console.rule()
+            console.log(f'Evolving interface {i}')
+            console.log(f'size={ifc.size} shape={ifc.shape}')
+
+            t0 = time.perf_counter()
+            timings.begin(f'interface {i}')
+
+            if ckpt.get('interface') != i:
+                # left by an interface that has been saved since
+                ckpt.discard('interface')
+
+            # lower-precision phases, then the final one in C.precision
+            if base.run_phases(
+                    ifc, C.phases, phase_supplier, partial(get_hooks, interface=i), ckpt, 'interface',
+                    stop=stop, interface=i):
+                clock = base.StepClock()
+                ifc2 = pfc.toolkit.evolve_and_elongate_interface(
+                    ifc, delta_sol, delta_liq,     
+                    minimizer_supplier=minim_supplier,
+                    n_steps=C.n_steps,
+                    hooks=clock.wrap(get_hooks(C, i) + ckpt.hook('interface', stop=stop, interface=i)),
+                    verbose=True
+                )
+                assert clock.ended is not None
+                timings.add('elongate', time.perf_counter() - clock.ended)
+
+            if stop.is_set():
+                if ckpt.writable:
+                    console.log(f'Stopped, interface {i} checkpointed', highlight=False)
+                else:
+                    console.log(f'Stopped, interface {i} discarded', highlight=False)
+                break
+
+            budget.last_duration = time.perf_counter() - t0
+
+            console.log(f'evolved size={ifc.size} shape={ifc.shape}')
+            console.log(f'elongated to size={ifc2.size} shape={ifc2.shape}')
+
+            if writer is not None:
+                field_path = f'{C.file_path("interfaces")}/{i:04d}.field'
+                data = final['minimizer'].data
+                writer.submit(ifc, field_path, F=data['F'], psibar=data['psibar'],
+                              wall_time=budget.last_duration)
+                console.log(f'queued interface for saving to {field_path}')
+
+            plans.save()
+            timings.end()
+
+            ifc = ifc2
+            i += 1
+
+        # pending saves are written on leaving (dropped if lost)
+        timings.begin('finish')
+
+    if not stop.is_set():
+        # every evolved interface has been written
+        ckpt.discard('interface')
 
+    if complete and not CC.dry and not stop.is_set():
+        assert C.lx_max_ is not None
+        tmp = complete_file.with_name(complete_file.name + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(dict(lx_max=float(C.lx_max_), interfaces=i), f)
+        os.replace(tmp, complete_file)
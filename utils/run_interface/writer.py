@@ -0,0 +1,111 @@
+from typing import Optional, Tuple
+import queue
+import threading
+
+import torusgrid as tg
+import rich
+
+from .. import base
+
+
+_Job = Tuple[tg.RealField2D, str, tg.FloatLike, tg.FloatLike, float]
+
+
+class FieldWriter:
+    """
+    Save interface fields on a background thread so that the next
+    minimization can start while the previous field is being written.
+
+    A submitted field is owned by the writer until it has been written
+    (atomically, see base.save_field) and recorded in the interface index
+    with the F and psibar it was submitted with (those of the minimizer at
+    the end of the evolution); the caller must not modify it afterwards. At
+    most max_pending fields wait in the queue, after which submit() blocks.
+
+    An error in the writer thread is raised by the next call to check() or
+    submit(). close() (or leaving the with block) writes all pending fields
+    before returning. Once lost is set (the lease on dir was lost, see
+    base.Lease), fields not yet written are dropped instead.
+    """
+    def __init__(
+        self, dir: str, fmt: base.FieldFormat, *,
+        max_pending: int = 1,
+        lost: Optional[threading.Event] = None
+    ):
+        self.dir = dir
+        self.fmt = fmt
+        self.lost = lost
+
+        self._queue: queue.Queue[Optional[_Job]] = queue.Queue(maxsize=max(1, max_pending))
+        self._error: Optional[BaseException] = None
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._work, name='field-writer')
+        self._thread.start()
+
+    def _work(self):
+        console = rich.get_console()
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+
+            field, path, F, psibar, wall_time = job
+            try:
+                if self._error is not None:
+                    continue
+                if self.lost is not None and self.lost.is_set():
+                    console.log(f'lease lost, not saving {path}', highlight=False)
+                    continue
+
+                base.save_field(field, path, self.fmt)
+                base.append_to_index(
+                        self.dir,
+                        base.index_entry(
+                            field, path,
+                            F=F, psibar=psibar,
+                            wall_time=wall_time))
+                console.log(f'saved interface to {path}')
+            except BaseException as e:
+                self._error = e
+            finally:
+                with self._lock:
+                    self._pending_bytes -= field.psi.nbytes
+
+    def check(self):
+        """
+        Raise the error of a failed write, if any
+        """
+        if self._error is not None:
+            raise RuntimeError('failed to save interface field') from self._error
+
+    @property
+    def pending_bytes(self) -> int:
+        """
+        Array size of the fields submitted but not yet written
+        """
+        with self._lock:
+            return self._pending_bytes
+
+    def submit(
+        self, field: tg.RealField2D, path: str, *,
+        F: tg.FloatLike, psibar: tg.FloatLike, wall_time: float
+    ):
+        self.check()
+        with self._lock:
+            self._pending_bytes += field.psi.nbytes
+        # time blocked on max_pending
+        with base.get_timings().timer('field.save.wait'):
+            self._queue.put((field, path, F, psibar, wall_time))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        if exc_type is None:
+            self.check()
@@ -36,9 +36,14 @@ class UnitCellSingleRunConfig(
 
         self.max_trials = int(config['max_trials'])
 
+        # k-ary search: number of mu evaluated concurrently per round
+        self.search_points = int(config.get('search_points', 1))
+        self.search_workers = int(config.get('search_workers', self.search_points))
+
 
 @final
 class UnitCellSimulationConfig(
+    base.SpecifiesCheckpoints,
     base.SpecifiesShape,
     base.SpecifiesPFCParams,
     base.SpecifiesFFTWisdoms,
@@ -1,5 +1,6 @@
 import os
-from typing import List
+import threading
+from typing import List, Tuple
 import torusgrid  as tg
 import pfc_util as pfc
 import pickle
@@ -9,6 +10,7 @@ import pyfftw
 
 from .config import UnitCellSimulationConfig, parse_config
 from .singlerun import run_single
+from .mucache import MuCache
 
 from ..base import CommandLineConfig
 from .. import base
@@ -17,40 +19,75 @@ from .. import global_cfg as G
 
 
 
+def fft_shapes(C: UnitCellSimulationConfig) -> List[Tuple[Tuple[int, int], tg.PrecisionLike, int]]:
+    """
+    (shape, precision, threads) of the minimizers of each run
+    """
+    return [((C.nx, C.ny), cfg.precision, cfg.fft_threads) for cfg in C.runs]
+
+
 def run(config_name: str, CC: CommandLineConfig):
     C = parse_config(config_name)
     console = rich.get_console()
     savedir = C.file_path('pfc')
     
-    
-    _running_marker = Path(savedir + '/' + G.RUNNING_FILE)
-    
-    if _running_marker.exists():
-        console.log(f'{str(_running_marker.parent)} is already occupied by another process. Aborted.', style='bold red', highlight=False)
+    stop = threading.Event()
+    lost = threading.Event()
+
+    def on_lease_lost():
+        console.log(f'Lease on {savedir} lost, stopping after the current step without saving',
+                    style='bold red', highlight=False)
+        lost.set()
+        stop.set()
+
+    lease = base.Lease(savedir, on_lost=on_lease_lost)
+
+    acquired = not base.is_leased(savedir) if CC.dry else lease.acquire()
+
+    if not acquired:
+        console.log(f'{savedir} is already occupied by {base.describe_lease(base.read_lease(savedir))}. Aborted.',
+                    style='bold red', highlight=False)
         return
 
-    if not CC.dry:
-        Path(savedir).mkdir(parents=True, exist_ok=True)
-        base.check_dir_empty(savedir, overwrite=CC.overwrite)
+    plans = base.FFTPlanCache(base.get_store(C.wisdom_store))
+
+    timings = base.get_timings()
+    timings.reset('unit_cell')
+
+    job = base.get_job()
 
     try:
-        if not CC.dry:
-            _running_marker.touch()
-        _run(C, CC)
+        with base.stop_on_sigterm(stop):
+            if not CC.dry:
+                base.check_dir_empty(savedir, overwrite=CC.overwrite)
+                job.start('unit_cell', savedir)
+            _run(C, CC, plans, stop, lost)
+    except base.Stopped:
+        if not lost.is_set():
+            console.log('Stopped, evaluated mu checkpointed', style='bold red')
 
     finally:
-        if not CC.dry:
-            os.remove(_running_marker)
+        plans.save()
+        if not CC.dry and not lost.is_set():
+            timings.save(savedir, G.TIMINGS_FILE)
+        job.stop()
+        lease.release()
     
 
-def _run(C: UnitCellSimulationConfig, CC: CommandLineConfig):
+def _run(C: UnitCellSimulationConfig, CC: CommandLineConfig, plans: base.FFTPlanCache,
+         stop: threading.Event, lost: threading.Event):
 
     console = rich.get_console()
+    timings = base.get_timings()
+    timings.begin('setup')
 
     '''Load FFTW wisdoms'''
     for wisdom in C.fftw_wisdoms:
         pyfftw.import_wisdom(wisdom)
 
+    for shape, precision, threads in fft_shapes(C):
+        plans.plan_minimizer(shape, precision, threads)
+
 
     '''Resize the solid to the desired shape'''
     if (C.nx,C.ny) != (C.source_field.shape):
@@ -74,10 +111,22 @@ def _run(C: UnitCellSimulationConfig, CC: CommandLineConfig):
     mu_max = C.mu_max
     mu_min = C.mu_min
 
+    # evaluations of mu shared by all trials and runs; resuming replays the
+    # search with every mu evaluated before answered from the cache
+    ckpt = base.Checkpoint(savedir, interval=None if CC.dry else C.checkpoint_interval,
+                           config=C.config_hash, overwrite=CC.overwrite, lost=lost)
+
+    cache: MuCache = ckpt.get('cache', MuCache())
+    if len(cache) > 0:
+        console.log(f'resuming from checkpoint with {len(cache)} evaluated mu', highlight=False)
+
+    progress = base.get_progress(CC, savedir)
+
     liq = None
     for i, cfg in enumerate(C.runs):
         console.rule(style='orange3')
         console.log(f'Run {i+1}/{len(C.runs)}')
+        timings.begin(f'run {i+1}')
 
         mu_max = cfg.dtype(mu_max)
         mu_min = cfg.dtype(mu_min)
@@ -88,7 +137,7 @@ def _run(C: UnitCellSimulationConfig, CC: CommandLineConfig):
         for j in range(cfg.max_trials):
             console.log(f'[bold orange1]Trial {j+1}/{cfg.max_trials}[bold orange1]')
             try:
-                sol, liq, rec = run_single(cfg, mu_min, mu_max, sol)
+                sol, liq, rec = run_single(cfg, mu_min, mu_max, sol, cache, ckpt, progress, stop)
                 break
 
             except pfc.toolkit.LiquefiedError as e:
@@ -118,10 +167,16 @@ def _run(C: UnitCellSimulationConfig, CC: CommandLineConfig):
     assert liq is not None
 
     '''Save fields'''
+    if stop.is_set():
+        raise base.Stopped()
+
     if not CC.dry:
         console.log(f'saving under {savedir}')
-        tg.save(sol, f'{savedir}/unit_sol.field')
-        tg.save(liq, f'{savedir}/unit_liq.field')
+        timings.begin('save')
+        with timings.timer('field.save'):
+            tg.save(sol, f'{savedir}/unit_sol.field')
+            tg.save(liq, f'{savedir}/unit_liq.field')
         with open(f'{savedir}/log.pkl', 'wb') as f:
             pickle.dump(recs, f)
+        ckpt.clear()
 
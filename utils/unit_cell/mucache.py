@@ -0,0 +1,90 @@
+from typing import Dict, List, Optional
+import numpy as np
+import torusgrid as tg
+
+
+class MuState:
+    """
+    Result of evaluating one mu: the relaxed solid, the minimized liquid and
+    their mean grand potentials. A liquefied evaluation has no liquid.
+    """
+    def __init__(
+        self, mu: tg.FloatLike, *,
+        omega_s: tg.FloatLike, omega_l: tg.FloatLike,
+        liquefied: bool,
+        sol_psi: np.ndarray, lx: tg.FloatLike, ly: tg.FloatLike,
+        liq_psi: Optional[np.ndarray],
+        steps: int = 0
+    ):
+        self.mu = mu
+        self.omega_s = omega_s
+        self.omega_l = omega_l
+        self.liquefied = liquefied
+        self.sol_psi = sol_psi
+        self.lx = lx
+        self.ly = ly
+        self.liq_psi = liq_psi
+        self.steps = steps
+
+    def solid(self, precision: tg.PrecisionLike) -> tg.RealField2D:
+        """
+        A new field holding the relaxed solid in the given precision
+        """
+        field = tg.RealField2D(self.lx, self.ly, *self.sol_psi.shape, precision=precision)
+        field.psi[...] = self.sol_psi
+        return field
+
+    def liquid(self, precision: tg.PrecisionLike) -> tg.RealField2D:
+        assert self.liq_psi is not None
+        field = tg.RealField2D(self.lx, self.ly, *self.liq_psi.shape, precision=precision)
+        field.psi[...] = self.liq_psi
+        return field
+
+
+class MuCache:
+    """
+    Evaluations of mu during one unit_cell session, shared by all trials and
+    runs.
+
+    An evaluation is reused as is only for the same mu in the same precision
+    (the precision of each run decides the accuracy of omega); any
+    non-liquefied state serves as the starting point of evaluations at
+    nearby mu.
+    """
+    def __init__(self):
+        self._states: Dict[str, Dict[tg.FloatLike, MuState]] = {}
+        self.hits = 0
+        self.steps_saved = 0
+
+    @staticmethod
+    def _key(mu: tg.FloatLike) -> str:
+        return np.dtype(type(mu)).str
+
+    def get(self, mu: tg.FloatLike) -> Optional[MuState]:
+        return self._states.get(self._key(mu), {}).get(mu, None)
+
+    def reuse(self, mu: tg.FloatLike) -> Optional[MuState]:
+        """
+        Like get(), but a state found counts as a hit: use this where the
+        cached evaluation replaces running one
+        """
+        state = self.get(mu)
+        if state is not None:
+            self.hits += 1
+            self.steps_saved += state.steps
+        return state
+
+    def put(self, state: MuState):
+        self._states.setdefault(self._key(state.mu), {})[state.mu] = state
+
+    def nearest(self, mu: tg.FloatLike) -> Optional[MuState]:
+        """
+        The non-liquefied state (in any precision) with mu closest to mu
+        """
+        states: List[MuState] = [s for d in self._states.values() for s in d.values() if not s.liquefied]
+        if states == []:
+            return None
+        return min(states, key=lambda s: abs(float(s.mu) - float(mu)))
+
+    def __len__(self) -> int:
+        return sum(len(d) for d in self._states.values())
@@ -0,0 +1,241 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import List, Optional
+import multiprocessing as mp
+import threading
+import numpy as np
+import torusgrid as tg
+import pfc_util as pfc
+import rich
+
+from .config import UnitCellSingleRunConfig
+from .mucache import MuCache, MuState
+
+from .. import base
+
+
+Hooks = tg.dynamics.EvolverHooks[tg.dynamics.FieldEvolver[tg.RealField2D]]
+
+
+def _worker_params(cfg: UnitCellSingleRunConfig, progress: Optional[base.Progress] = None) -> dict:
+    return dict(
+        dt=cfg.dt, eps=cfg.eps_, alpha=cfg.alpha_, beta=cfg.beta_,
+        threads=cfg.fft_threads, wisdom_only=cfg.wisdom_only,
+        n_steps=cfg.n_steps, refresh_interval=cfg.refresh_interval,
+        detect_slow=(cfg.target, cfg.tol, cfg.patience),
+        liquid_tol=cfg.liquid_tol, progress=progress)
+
+
+def _evaluate(
+    sol_psi: np.ndarray, sol_meta: dict, liq_psi: Optional[np.ndarray],
+    mu: tg.FloatLike, p: dict, hooks: Optional[Hooks] = None
+) -> MuState:
+    """
+    One step of find_coexistent_mu at a given mu: relax the solid, minimize
+    the liquid and compute both mean grand potentials. The liquid starts from
+    liq_psi if given, otherwise from the mean of the solid.
+
+    Without hooks, quiet hooks are used (for worker processes), recording
+    progress in headless mode.
+    """
+    sol = tg.RealField2D.from_array(sol_psi, metadata=sol_meta)
+    fef = pfc.pfc6.FreeEnergyFunctional(p['eps'], p['alpha'], p['beta'])
+
+    def get_hooks(label: str) -> Hooks:
+        if hooks is not None:
+            return hooks
+        return base.get_quiet_hooks(
+                state_function_cls=pfc.pfc6.StateFunction,
+                refresh_interval=p['refresh_interval'],
+                detect_slow=p['detect_slow'],
+                label=f'{label} mu={mu}',
+                progress=p['progress'], state=dict(mu=float(mu)))
+
+    relaxer = pfc.pfc6.StressRelaxer(sol, p['dt'], p['eps'], p['alpha'], p['beta'], mu)
+    relaxer.initialize_fft(threads=p['threads'], wisdom_only=p['wisdom_only'], destroy_input=True)
+    relaxer.run(p['n_steps'], hooks=base.timed_hooks(get_hooks('solid')))
+    steps = int(round(relaxer.age / p['dt']))
+
+    with base.get_timings().timer('energy'):
+        omega_s = fef.mean_free_energy_density(sol) - mu*sol.psi.mean()
+
+    if pfc.is_liquid(sol.psi, tol=p['liquid_tol']):
+        return MuState(mu, omega_s=omega_s, omega_l=np.nan, liquefied=True,
+                       sol_psi=sol.psi.copy(), lx=sol.lx, ly=sol.ly, liq_psi=None, steps=steps)
+
+    liq = tg.const_like(sol)
+    if liq_psi is not None:
+        liq.psi[...] = liq_psi
+
+    minim = pfc.pfc6.ConstantMuMinimizer(liq, p['dt'], p['eps'], p['alpha'], p['beta'], mu)
+    minim.initialize_fft(threads=p['threads'], wisdom_only=p['wisdom_only'], destroy_input=True)
+    minim.run(p['n_steps'], hooks=base.timed_hooks(get_hooks('liquid')))
+    steps += int(round(minim.age / p['dt']))
+
+    with base.get_timings().timer('energy'):
+        omega_l = fef.mean_free_energy_density(liq) - mu*liq.psi.mean()
+    return MuState(mu, omega_s=omega_s, omega_l=omega_l, liquefied=False,
+                   sol_psi=sol.psi.copy(), lx=sol.lx, ly=sol.ly, liq_psi=liq.psi.copy(), steps=steps)
+
+
+def bracket_points(rec: pfc.toolkit.MuSearchRecord, k: int, dtype) -> List[tg.FloatLike]:
+    """
+    k points splitting the current bracket into k+1 equal parts. With the
+    interpolate search method, the point closest to the secant estimate of
+    the zero is replaced by the estimate once both bounds have been
+    evaluated.
+    """
+    lo, hi = rec.lower_bound, rec.upper_bound
+    points = [dtype(lo + (hi - lo) * j / (k + 1)) for j in range(1, k + 1)]
+
+    if rec.search_method == 'interpolate':
+        try:
+            x = dtype(rec.polate_zero(hi, lo))
+        except (ValueError, KeyError):
+            return points
+        if lo < x < hi:
+            i = int(np.argmin([abs(mu - x) for mu in points]))
+            points[i] = x
+
+    return points
+
+
+def find_coexistent_mu_cached(
+    sol: tg.RealField2D,
+    mu_min: tg.FloatLike, mu_max: tg.FloatLike,
+    fef: pfc.pfc6.FreeEnergyFunctional,
+    cfg: UnitCellSingleRunConfig,
+    cache: MuCache, *,
+    hooks: Optional[Hooks] = None,
+    checkpoint: Optional[base.Checkpoint] = None,
+    stop: Optional[threading.Event] = None,
+    progress: Optional[base.Progress] = None
+) -> pfc.toolkit.MuSearchRecord:
+    """
+    Counterpart of pfc.toolkit.find_coexistent_mu() whose evaluations go
+    through a MuCache: a mu evaluated before (in this precision) is answered
+    from the cache, and every other evaluation starts from the cached solid
+    and liquid closest in mu rather than from the last one evaluated.
+
+    With cfg.search_points = k > 1, each round evaluates k values of mu
+    inside the current bracket on a process pool (whose workers record
+    progress if given), narrowing the bracket by a factor of about k+1 per
+    round instead of 2; otherwise mu is chosen by
+    MuSearchRecord.next() and evaluated in this process with the given hooks.
+
+    The cache is saved to checkpoint (if given) after every round. Once stop
+    is set, base.Stopped is raised after the round; an evaluation in this
+    process cut short by stop (see StopOnEvent in hooks) is not cached.
+
+    On return, sol holds the solid relaxed at rec.mu[-1], which is the
+    evaluated mu closest to coexistence in the last round. Results of each
+    round are appended to the record in order of decreasing
+    |omega_s - omega_l|.
+
+    :raises pfc.toolkit.LiquefiedError: if the solid liquefies at some mu,
+        after recording the other evaluations of that round
+    """
+    console = rich.get_console()
+
+    dtype = tg.get_real_dtype(sol.precision)
+    mu_min, mu_max = dtype(mu_min), dtype(mu_max)
+    if mu_min >= mu_max:
+        raise ValueError('mu_min must be smaller than mu_max')
+
+    k = cfg.search_points
+    workers = base.max_workers(cfg.search_workers, n_tasks=k)
+    digits = round(-np.log10(cfg.mu_precision + 1e-22))
+    params = _worker_params(cfg, progress)
+
+    rec = pfc.toolkit.MuSearchRecord(initial_range=(mu_min, mu_max), search_method=cfg.search_method)
+
+    def start(mu: tg.FloatLike):
+        """
+        Solid psi and metadata, and liquid psi to start an evaluation from
+        """
+        near = cache.nearest(mu)
+        if near is None:
+            return sol.psi.copy(), sol.metadata(), None
+        console.log(f'mu={tg.float_fmt(mu, digits)}: starting from the state at '
+                    f'mu={tg.float_fmt(near.mu, digits)}', highlight=False)
+        field = near.solid(sol.precision)
+        liq_psi = None if near.liq_psi is None else near.liq_psi.astype(dtype)
+        return field.psi, field.metadata(), liq_psi
+
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('fork')) if k > 1 else None
+
+    with pool or nullcontext():
+        while (np.abs(rec.upper_bound - rec.lower_bound)
+               > cfg.mu_precision * (np.abs(rec.upper_bound) + np.abs(rec.lower_bound)) / 2):
+
+            console.rule()
+            console.log(f'current mu bounds: {tg.float_fmt(rec.lower_bound, digits)} ~ '
+                        f'{tg.float_fmt(rec.upper_bound, digits)}', highlight=False)
+
+            points = bracket_points(rec, k, dtype) if k > 1 else [dtype(rec.next())]
+            points = [mu for mu in points if mu not in rec.record.keys()]
+            if points == []:
+                break
+
+            results: List[MuState] = []
+            todo = []
+            for mu in points:
+                state = cache.reuse(mu)
+                if state is not None:
+                    console.log(f'mu={tg.float_fmt(mu, digits)}: from cache', highlight=False)
+                    results.append(state)
+                else:
+                    todo.append(mu)
+
+            if pool is not None and todo:
+                console.log(f'evaluating {len(todo)} mu on {workers} workers', highlight=False)
+                args = [(*start(mu), mu, params) for mu in todo]
+                with base.get_timings().timer('mu_search.parallel'):
+                    evaluated = list(pool.map(_evaluate, *zip(*args)))
+            else:
+                evaluated = [_evaluate(*start(mu), mu, params, hooks) for mu in todo]
+                if stop is not None and stop.is_set():
+                    raise base.Stopped()
+
+            base.get_timings().count('mu.evaluated', len(evaluated))
+            base.get_timings().count('mu.cached', len(results))
+            for state in evaluated:
+                cache.put(state)
+            results += evaluated
+
+            if checkpoint is not None and evaluated:
+                checkpoint.save(cache=cache)
+
+            if stop is not None and stop.is_set():
+                raise base.Stopped()
+
+            liquefied = [s.mu for s in results if s.liquefied]
+            valid = [s for s in results if not s.liquefied]
+            valid.sort(key=lambda s: -np.abs(s.omega_s - s.omega_l))
+
+            for state in valid:
+                rec.append(state.mu, state.omega_l, state.omega_s)
+                console.log(f'mu={tg.float_fmt(state.mu, digits)} '
+                            f'omega_s-omega_l={state.omega_s - state.omega_l}', highlight=False)
+
+            if valid:
+                best = valid[-1]
+                sol.set_size(best.lx, best.ly)
+                sol.psi[...] = best.sol_psi
+
+            if liquefied:
+                mu = min(liquefied)
+                console.log(f'solid field has been liquefied during minimization with mu={mu}')
+                raise pfc.toolkit.LiquefiedError(rec, mu)
+
+            if rec.zero is not None:
+                console.log('omega_l and omega_s are numerically indistinguishable under the current floating point precision')
+                break
+
+    console.rule()
+    console.log(f'mu min   = {tg.float_fmt(rec.lower_bound, digits)}', highlight=False)
+    console.log(f'mu max   = {tg.float_fmt(rec.upper_bound, digits)}', highlight=False)
+    if len(rec.mu) >= 1:
+        console.log(f'final mu = {tg.float_fmt(rec.mu[-1], digits)}', highlight=False)
+
+    return rec
@@ -1,9 +1,14 @@
+from typing import Optional
+import threading
 import torusgrid  as tg
 import pfc_util as pfc
 import numpy as np
 import rich
 
+from .. import base
 from .config import UnitCellSingleRunConfig
+from .mucache import MuCache
+from .search import find_coexistent_mu_cached
 
 console = rich.get_console()
 
@@ -11,7 +16,11 @@ console = rich.get_console()
 def run_single(
     cfg: UnitCellSingleRunConfig,
     mu_min: tg.FloatLike, mu_max: tg.FloatLike, 
-    sol: tg.RealField2D
+    sol: tg.RealField2D,
+    cache: MuCache,
+    checkpoint: base.Checkpoint,
+    progress: Optional[base.Progress] = None,
+    stop: Optional[threading.Event] = None
 ):
 
     sol = tg.change_precision(
@@ -30,14 +39,6 @@ def run_single(
     fef = pfc.pfc6.FreeEnergyFunctional(
             cfg.eps_, cfg.alpha_, cfg.beta_)
 
-    def relaxer_supplier(field: tg.RealField2D, /, mu: tg.FloatLike):
-        m = pfc.pfc6.StressRelaxer(field, cfg.dt, cfg.eps_, cfg.alpha_, cfg.beta_, mu)
-        m.initialize_fft(
-                    threads=cfg.fft_threads,
-                    wisdom_only=cfg.wisdom_only, 
-                    destroy_input=True)
-        return m
-
     def const_mu_supplier(field: tg.RealField2D, /, mu: tg.FloatLike):
         m = pfc.pfc6.ConstantMuMinimizer(field, cfg.dt, cfg.eps_, cfg.alpha_, cfg.beta_, mu)
         m.initialize_fft(
@@ -46,7 +47,8 @@ def run_single(
                     destroy_input=True)
         return m
 
-    hooks = pfc.toolkit.get_pfc_hooks(
+    hooks = base.get_pfc_hooks(
+        progress, label='unit_cell',
         state_function_cls=pfc.pfc6.StateFunction,
         display_digits=round(-np.log10(cfg.mu_precision)),
         extra_display_digits=3,
@@ -56,31 +58,38 @@ def run_single(
         fps=12
     )
 
+    if stop is not None:
+        hooks = hooks + base.StopOnEvent(stop)
 
-    hooks = hooks + (
-            tg.dynamics.MonitorValues[tg.dynamics.FieldEvolver[tg.RealField2D]](
-                {'psi_delta': lambda e: e.field.psi.max() - e.field.psi.min()}
-            ) +
-            tg.dynamics.Text('psi_delta: {psi_delta:.4e}')
-            )
+
+    if progress is None:
+        hooks = hooks + (
+                tg.dynamics.MonitorValues[tg.dynamics.FieldEvolver[tg.RealField2D]](
+                    {'psi_delta': lambda e: e.field.psi.max() - e.field.psi.min()}
+                ) +
+                tg.dynamics.Text('psi_delta: {psi_delta:.4e}')
+                )
     
-    rec = pfc.toolkit.find_coexistent_mu(
-        sol, mu_min, mu_max, fef,
-        relaxer_supplier=relaxer_supplier,
-        relaxer_hooks=hooks, relaxer_nsteps=cfg.n_steps,
-        const_mu_supplier=const_mu_supplier,
-        const_mu_hooks=hooks, const_mu_nsteps=cfg.n_steps,
-        precision=cfg.mu_precision,
-        search_method=cfg.search_method,
-        liquid_tol=cfg.liquid_tol,
-        error_if_liquefied=True
-    )
+    if cfg.search_points > 1:
+        console.log(f'search points={cfg.search_points}')
+
+    rec = find_coexistent_mu_cached(sol, mu_min, mu_max, fef, cfg, cache,
+                                    hooks=hooks, checkpoint=checkpoint, stop=stop,
+                                    progress=progress)
 
-    liq = tg.const_like(sol)
     mu = rec.mu[-1]
+    state = cache.get(mu)
 
-    console.log(f'Evolving liquid profile at mu = {mu}')
-    const_mu_supplier(liq, mu).run(cfg.n_steps, hooks=hooks)
+    if state is not None and state.liq_psi is not None:
+        console.log(f'Using the liquid profile evaluated at mu = {mu}')
+        liq = state.liquid(sol.precision)
+    else:
+        liq = tg.const_like(sol)
+        console.log(f'Evolving liquid profile at mu = {mu}')
+        const_mu_supplier(liq, mu).run(cfg.n_steps, hooks=base.timed_hooks(hooks))
+        if stop is not None and stop.is_set():
+            raise base.Stopped()
 
-    return sol, liq, rec
+    console.log(f'mu cache: {len(cache)} evaluations, {cache.hits} answered from cache')
 
+    return sol, liq, rec